@@ -0,0 +1,143 @@
+# ml_service/app/ann.py
+import os
+import numpy as np
+
+# Nombre de listes inversées (0 = automatique, ~ racine de la taille de la galerie)
+FACE_INDEX_NLIST = int(os.getenv("FACE_INDEX_NLIST", "0"))
+# Nombre de listes explorées par requête : compromis rappel / latence
+FACE_INDEX_NPROBE = int(os.getenv("FACE_INDEX_NPROBE", "8"))
+# En dessous de cette taille, la recherche exacte reste plus rapide
+FACE_INDEX_MIN_SIZE = int(os.getenv("FACE_INDEX_MIN_SIZE", "20000"))
+FACE_INDEX_PATH = os.getenv("FACE_INDEX_PATH", "data/face_index.npz")
+# Réentraînement quand la galerie dépasse ce multiple de sa taille à l'entraînement
+# (les listes s'éloignent alors de ~racine(N) : rappel et latence se dégradent)
+FACE_INDEX_RETRAIN_RATIO = float(os.getenv("FACE_INDEX_RETRAIN_RATIO", "4"))
+
+
+def nearest_centroids(data, centroids, chunk_size=65536):
+    """Indice du centroïde le plus proche pour chaque ligne, par blocs pour borner la mémoire."""
+    data = np.atleast_2d(data)
+    centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), chunk_size):
+        block = data[start:start + chunk_size]
+        # ||x - c||² = ||x||² - 2 x.c + ||c||² ; ||x||² ne change pas l'argmin
+        labels[start:start + chunk_size] = np.argmin(centroid_norms - 2 * block @ centroids.T, axis=1)
+    return labels
+
+def kmeans(data, k, n_iter=10, seed=0):
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(n_iter):
+        labels = nearest_centroids(data, centroids)
+        order = np.argsort(labels, kind="stable")
+        counts = np.bincount(labels, minlength=k)
+        non_empty = np.flatnonzero(counts)
+        # Sommes par cluster en un passage (les clusters vides gardent leur centroïde)
+        sums = np.add.reduceat(data[order], np.concatenate(([0], np.cumsum(counts)[:-1]))[non_empty])
+        centroids[non_empty] = sums / counts[non_empty, None]
+    return centroids
+
+
+class IVFFlatIndex:
+    """
+    Index IVF-flat en NumPy : un k-means grossier partitionne la galerie en
+    nlist listes inversées de lignes. Une requête n'explore que les nprobe
+    listes les plus proches ; les distances finales sont recalculées exactement
+    par la galerie, les confiances sont donc identiques à la recherche exhaustive.
+    """
+
+    def __init__(self, centroids, nprobe=FACE_INDEX_NPROBE, trained_size=0):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.trained_size = trained_size  # taille de la galerie à l'entraînement
+        self._lists = [set() for _ in range(len(self.centroids))]
+        self._row_list = {}  # ligne de la galerie -> liste inversée
+
+    @property
+    def nlist(self):
+        return len(self.centroids)
+
+    @classmethod
+    def train(cls, matrix, nlist=FACE_INDEX_NLIST, nprobe=FACE_INDEX_NPROBE, n_iter=10, seed=0):
+        if not nlist:
+            nlist = max(1, int(np.sqrt(len(matrix))))
+        nlist = min(nlist, len(matrix))
+        # Échantillon d'entraînement : ~40 points par liste suffisent pour des centroïdes stables
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(matrix), 40 * nlist)
+        sample = matrix[rng.choice(len(matrix), sample_size, replace=False)]
+        return cls(kmeans(sample, nlist, n_iter=n_iter, seed=seed), nprobe=nprobe, trained_size=len(matrix))
+
+    def is_stale(self, size, ratio=FACE_INDEX_RETRAIN_RATIO):
+        """Vrai si la galerie a dépassé ratio fois sa taille à l'entraînement."""
+        return bool(ratio) and size > ratio * max(self.trained_size, 1)
+
+    def list_sizes(self):
+        return np.fromiter((len(members) for members in self._lists), dtype=np.int64, count=self.nlist)
+
+    def assign(self, vectors):
+        return nearest_centroids(np.asarray(vectors, dtype=np.float32), self.centroids)
+
+    def add_many(self, rows, lists):
+        for row, list_id in zip(rows, lists):
+            self.remove(row)
+            self._lists[list_id].add(row)
+            self._row_list[row] = list_id
+
+    def add(self, row, vector):
+        self.add_many([row], self.assign(vector))
+
+    def remove(self, row):
+        list_id = self._row_list.pop(row, None)
+        if list_id is not None:
+            self._lists[list_id].discard(row)
+
+    def move(self, src, dst):
+        """La galerie a déplacé la ligne src vers dst (suppression par échange)."""
+        list_id = self._row_list.pop(src, None)
+        if list_id is not None:
+            self._lists[list_id].discard(src)
+            self._lists[list_id].add(dst)
+            self._row_list[dst] = list_id
+
+    def candidates(self, query, nprobe=None):
+        """Lignes de la galerie appartenant aux nprobe listes les plus proches de la requête."""
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        distances = np.linalg.norm(self.centroids - np.asarray(query, dtype=np.float32), axis=1)
+        probed = np.argpartition(distances, nprobe - 1)[:nprobe]
+        size = sum(len(self._lists[i]) for i in probed)
+        rows = np.empty(size, dtype=np.intp)
+        offset = 0
+        for i in probed:
+            members = self._lists[i]
+            rows[offset:offset + len(members)] = np.fromiter(members, dtype=np.intp, count=len(members))
+            offset += len(members)
+        return rows
+
+    def save(self, path, row_ids):
+        """
+        Instantané : centroïdes, liste de chaque identifiant de modèle (row_ids : ligne -> id)
+        et taille de la galerie à l'entraînement.
+        """
+        rows = np.fromiter(self._row_list.keys(), dtype=np.intp, count=len(self._row_list))
+        lists = np.fromiter(self._row_list.values(), dtype=np.int32, count=len(self._row_list))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp.npz"
+        np.savez(
+            tmp_path, centroids=self.centroids, ids=np.asarray(row_ids[rows], dtype=np.int64), lists=lists,
+            trained_size=self.trained_size,
+        )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, nprobe=FACE_INDEX_NPROBE):
+        """Retourne (index vide, {identifiant: liste}) ou (None, {}) si aucun instantané."""
+        if not os.path.exists(path):
+            return None, {}
+        with np.load(path) as snapshot:
+            assignments = dict(zip(snapshot["ids"].tolist(), snapshot["lists"].tolist()))
+            # Instantanés antérieurs sans trained_size : taille au moment de l'instantané
+            trained_size = int(snapshot["trained_size"]) if "trained_size" in snapshot else len(assignments)
+            index = cls(snapshot["centroids"], nprobe=nprobe, trained_size=trained_size)
+        return index, assignments
@@ -0,0 +1,90 @@
+# ml_service/app/cache.py
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+FACE_CACHE_SIZE = int(os.getenv("FACE_CACHE_SIZE", "10000"))
+FACE_CACHE_TTL = float(os.getenv("FACE_CACHE_TTL", "300"))
+# Résultats de détection/encodage par contenu d'image (images renvoyées à l'identique)
+FACE_RESULT_CACHE_SIZE = int(os.getenv("FACE_RESULT_CACHE_SIZE", "2048"))
+FACE_RESULT_CACHE_TTL = float(os.getenv("FACE_RESULT_CACHE_TTL", "300"))
+
+
+class LRUCache:
+    """
+    Cache LRU borné avec expiration (TTL, en secondes ; 0 = sans expiration)
+    et compteurs de hits/misses.
+    """
+
+    def __init__(self, maxsize, ttl=0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # clé -> (expiration, valeur)
+        self._generations = {}  # clé -> nombre d'invalidations
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (not self.ttl or item[0] > time.monotonic()):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def generation(self, key):
+        """Version de la clé, incrémentée par invalidate : à lire avant de calculer la valeur."""
+        with self._lock:
+            return self._generations.get(key, 0)
+
+    def set(self, key, value, generation=None):
+        """
+        Met la valeur en cache. Avec generation (lue avant le calcul), la valeur
+        est ignorée si la clé a été invalidée entre-temps : elle serait périmée.
+        """
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            if generation is not None and self._generations.get(key, 0) != generation:
+                return
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._generations[key] = self._generations.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+def content_key(data, *params):
+    """Empreinte blake2b des octets reçus, combinée aux paramètres qui influent sur le résultat."""
+    digest = hashlib.blake2b(data, digest_size=16)
+    for param in params:
+        digest.update(repr(param).encode())
+    return digest.digest()
+
+
+# Modèles connus décodés (matrice K x 128), par user_id, pour /face/verify
+encoding_cache = LRUCache(FACE_CACHE_SIZE, FACE_CACHE_TTL)
+# (face_locations, face_encodings) par empreinte de l'image envoyée
+extraction_cache = LRUCache(FACE_RESULT_CACHE_SIZE, FACE_RESULT_CACHE_TTL)
@@ -1,28 +1,170 @@
 # ml_service/app/database.py
-from sqlalchemy import create_engine, Column, String, JSON
+from sqlalchemy import func, inspect, text, Column, DateTime, Integer, String, JSON, LargeBinary, SmallInteger
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session
 from dotenv import load_dotenv
+import numpy as np
 import os
 
 load_dotenv()
 DATABASE_URL = os.getenv("DATABASE_URL")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Pool de connexions (ignoré pour SQLite)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Durée maximale d'une requête SQL côté Postgres, en millisecondes (0 = illimitée)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+
+# Format binaire des encodages : octets bruts little-endian ("<f4" = float32, "<f8" = float64)
+ENCODING_VERSION = 1
+ENCODING_DTYPE = os.getenv("FACE_ENCODING_DTYPE", "<f4")
+# Nombre maximal de modèles (encodages) conservés par utilisateur
+FACE_MAX_TEMPLATES = int(os.getenv("FACE_MAX_TEMPLATES", "5"))
+
+
+def async_database_url(url):
+    """Choisit le pilote asynchrone : asyncpg pour Postgres, aiosqlite pour SQLite."""
+    url = make_url(url)
+    if url.get_backend_name() == "postgresql":
+        return url.set(drivername="postgresql+asyncpg")
+    if url.get_backend_name() == "sqlite":
+        return url.set(drivername="sqlite+aiosqlite")
+    return url
+
+def create_engine_from_env(url=DATABASE_URL):
+    url = async_database_url(url)
+    options = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if url.get_backend_name() == "postgresql":
+        options.update(pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_recycle=DB_POOL_RECYCLE)
+        if DB_STATEMENT_TIMEOUT_MS:
+            options["connect_args"] = {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT_MS)}}
+    return create_async_engine(url, **options)
+
+engine = create_engine_from_env()
+# expire_on_commit=False : les attributs restent lisibles après commit sans relecture implicite
+SessionLocal = async_sessionmaker(engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+
+def pack_embedding(array, dtype=ENCODING_DTYPE):
+    return np.asarray(array, dtype=dtype).tobytes()
+
+def unpack_embedding(data, dtype=ENCODING_DTYPE):
+    # Lecture sans copie : le tableau pointe directement sur les octets lus en base
+    return np.frombuffer(data, dtype=dtype)
+
+
 class FaceEncoding(Base):
+    """Un modèle (encodage) de visage ; un utilisateur en a jusqu'à FACE_MAX_TEMPLATES."""
     __tablename__ = "face_encodings"
-    user_id = Column(String, primary_key=True)
-    encoding = Column(JSON, nullable=False)
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(String, nullable=False, index=True)
+    created_at = Column(DateTime, server_default=func.now())
+    # Ancien format JSON (128 floats en texte), vidé par migrate_encodings()
+    encoding = Column(JSON(none_as_null=True), nullable=True)
+    embedding = Column(LargeBinary, nullable=True)
+    embedding_dtype = Column(String(8), nullable=True)
+    embedding_version = Column(SmallInteger, nullable=True)
+
+    @classmethod
+    def from_array(cls, user_id, array):
+        return cls(
+            user_id=user_id,
+            encoding=None,
+            embedding=pack_embedding(array),
+            embedding_dtype=ENCODING_DTYPE,
+            embedding_version=ENCODING_VERSION,
+        )
+
+    def to_array(self):
+        if self.embedding is not None:
+            return unpack_embedding(self.embedding, self.embedding_dtype)
+        return np.asarray(self.encoding, dtype=np.float64)
+
+
+async def run_startup_migrations():
+    """Création des tables puis migrations de schéma et de format, en une transaction."""
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(migrate_templates)
+        return await conn.run_sync(migrate_encodings)
+
+def migrate_templates(conn):
+    """
+    Passage de l'ancien schéma (user_id clé primaire, un encodage par utilisateur)
+    au schéma multi-modèles (clé primaire id). Idempotent ; retourne True si la
+    table a été migrée.
+    """
+    table = FaceEncoding.__tablename__
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return False
+    columns = [c["name"] for c in inspector.get_columns(table)]
+    if "id" in columns:
+        return False
+
+    if conn.dialect.name == "postgresql":
+        pk_name = inspector.get_pk_constraint(table)["name"]
+        conn.execute(text(f"ALTER TABLE {table} DROP CONSTRAINT {pk_name}"))
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN id SERIAL PRIMARY KEY"))
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN created_at TIMESTAMP DEFAULT now()"))
+        conn.execute(text(f"CREATE INDEX ix_{table}_user_id ON {table} (user_id)"))
+    else:
+        # SQLite ne sait pas changer de clé primaire : copie vers une nouvelle table
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {table}_legacy"))
+        FaceEncoding.__table__.create(conn)
+        copied = ", ".join(c for c in columns if c in FaceEncoding.__table__.columns)
+        conn.execute(text(f"INSERT INTO {table} ({copied}) SELECT {copied} FROM {table}_legacy"))
+        conn.execute(text(f"DROP TABLE {table}_legacy"))
+    return True
+
+def migrate_encodings(conn, batch_size=1000):
+    """
+    Convertit les lignes JSON existantes au format binaire.
+    Idempotent : ajoute les colonnes manquantes puis ne traite que les lignes non migrées.
+    Retourne le nombre de lignes converties.
+    """
+    table = FaceEncoding.__tablename__
+    inspector = inspect(conn)
+    if not inspector.has_table(table):
+        return 0
+
+    columns = {c["name"]: c for c in inspector.get_columns(table)}
+    # SQLite ne sait pas retirer un NOT NULL : on y conserve alors la copie JSON
+    clear_legacy = columns["encoding"]["nullable"] or conn.dialect.name == "postgresql"
+    for column in (FaceEncoding.embedding, FaceEncoding.embedding_dtype, FaceEncoding.embedding_version):
+        if column.name not in columns:
+            column_type = column.type.compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+    if not columns["encoding"]["nullable"] and conn.dialect.name == "postgresql":
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN encoding DROP NOT NULL"))
 
-def create_tables():
-    Base.metadata.create_all(bind=engine)
+    migrated = 0
+    with Session(bind=conn, autoflush=False) as db:
+        while True:
+            rows = (
+                db.query(FaceEncoding)
+                .filter(FaceEncoding.embedding.is_(None), FaceEncoding.encoding.isnot(None))
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            for row in rows:
+                row.embedding = pack_embedding(row.encoding)
+                row.embedding_dtype = ENCODING_DTYPE
+                row.embedding_version = ENCODING_VERSION
+                if clear_legacy:
+                    row.encoding = None
+            db.flush()
+            db.expunge_all()
+            migrated += len(rows)
+    return migrated
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
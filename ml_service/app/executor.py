@@ -0,0 +1,100 @@
+# ml_service/app/executor.py
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .face_processing import warm_up
+
+# "process" : pool de processus (un modèle dlib par worker)
+# "thread"  : pool de threads (dlib relâche le GIL pendant la détection)
+FACE_EXECUTOR = os.getenv("FACE_EXECUTOR", "process")
+FACE_WORKERS = int(os.getenv("FACE_WORKERS", os.cpu_count() or 1))
+# Nombre de requêtes pouvant attendre un worker libre avant de refuser (503)
+FACE_QUEUE_DEPTH = int(os.getenv("FACE_QUEUE_DEPTH", FACE_WORKERS * 4))
+
+
+class ExecutorSaturated(Exception):
+    pass
+
+
+class FaceExecutor:
+    """
+    Exécute le décodage, la détection et l'encodage hors de la boucle asyncio,
+    dans un pool borné : au plus workers + queue_depth tâches en cours.
+    """
+
+    def __init__(self, kind=FACE_EXECUTOR, workers=FACE_WORKERS, queue_depth=FACE_QUEUE_DEPTH):
+        self.kind = kind
+        self.workers = workers
+        self.queue_depth = queue_depth
+        self._pool = None
+        self._slots = None
+
+    def start(self):
+        if self._pool is not None:
+            return
+        if self.kind == "process":
+            # spawn : pas de fork d'un processus déjà multi-threadé (uvicorn)
+            # Chaque worker charge et préchauffe les modèles avant sa première tâche
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=warm_up,
+            )
+        elif self.kind == "thread":
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="face")
+        else:
+            raise ValueError(f"FACE_EXECUTOR inconnu : {self.kind}")
+        self._slots = asyncio.Semaphore(self.workers + self.queue_depth)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    async def run(self, fn, *args):
+        if self._pool is None:
+            self.start()
+        if self._slots.locked():
+            raise ExecutorSaturated()
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool, fn, *args)
+
+    async def warm_up(self):
+        """
+        Démarre tous les workers et attend leur préchauffage.
+        Retourne la liste des (pid, durée) de l'inférence synthétique.
+        """
+        if self._pool is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        count = self.workers if self.kind == "process" else 1
+        # Le pool démarre autant de processus que de tâches en attente, mais un worker
+        # rapide peut en traiter plusieurs : on recommence jusqu'à avoir vu chaque worker
+        # (un worker ne prend de tâche qu'après son initializer, donc préchauffé).
+        results = {}
+        for _ in range(10):
+            for pid, seconds in await asyncio.gather(
+                *(loop.run_in_executor(self._pool, warm_up) for _ in range(count))
+            ):
+                results.setdefault(pid, seconds)
+            if len(results) >= count:
+                break
+        return list(results.items())
+
+    async def map_batches(self, fn, items):
+        """
+        Répartit items en au plus `workers` lots traités en parallèle ;
+        fn reçoit un lot et renvoie une liste de résultats dans le même ordre.
+        """
+        if not items:
+            return []
+        chunk_size = -(-len(items) // min(self.workers, len(items)))
+        chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+        results = await asyncio.gather(*(self.run(fn, chunk) for chunk in chunks))
+        return [result for chunk in results for result in chunk]
+
+
+face_executor = FaceExecutor()
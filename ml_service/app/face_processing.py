@@ -0,0 +1,120 @@
+# ml_service/app/face_processing.py
+# Fonctions exécutées dans le pool de workers : elles doivent rester
+# importables au niveau module (sérialisables par pickle).
+# face_recognition charge les modèles dlib dès son import : il n'est importé
+# que dans les fonctions, pour que seul le worker (et non l'API) les charge.
+import os
+import time
+import cv2
+import numpy as np
+
+# Plus grand côté de l'image utilisée pour la détection HOG (0 = pleine résolution).
+# Désactivé par défaut tant que le pipeline d'évaluation n'a pas montré la parité
+# de précision (une forte réduction peut rendre les visages trop petits pour le HOG).
+# L'encodage est toujours fait sur l'image originale.
+FACE_DETECTION_MAX_SIDE = int(os.getenv("FACE_DETECTION_MAX_SIDE", "0"))
+
+
+def decode_image(image_bytes):
+    image_np = np.frombuffer(image_bytes, np.uint8)
+    image = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Image illisible.")
+    return image
+
+def detect_and_encode(image, max_side=FACE_DETECTION_MAX_SIDE, timings=None):
+    """
+    Détecte les visages sur une copie réduite de l'image (coût HOG proportionnel
+    au nombre de pixels), ramène les boîtes à l'échelle d'origine puis encode
+    chaque visage à partir de l'image pleine résolution.
+    Retourne (face_locations, face_encodings) en coordonnées de l'original.
+    """
+    import face_recognition
+
+    if timings is None:
+        timings = {}
+    height, width = image.shape[:2]
+    scale = 1.0
+    small = image
+    if max_side and max(height, width) > max_side:
+        scale = max_side / max(height, width)
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    start = time.perf_counter()
+    small_locations = face_recognition.face_locations(small)
+    timings["detect"] = time.perf_counter() - start
+    if not small_locations:
+        timings["encode"] = 0.0
+        return [], []
+
+    face_locations = [
+        (
+            max(0, int(round(top / scale))),
+            min(width, int(round(right / scale))),
+            min(height, int(round(bottom / scale))),
+            max(0, int(round(left / scale))),
+        )
+        for top, right, bottom, left in small_locations
+    ]
+
+    start = time.perf_counter()
+    # Le prédicteur de points clés et le réseau d'encodage ne lisent que la zone du visage
+    face_encodings = face_recognition.face_encodings(image, face_locations)
+    timings["encode"] = time.perf_counter() - start
+    return face_locations, face_encodings
+
+def extract_faces(image_bytes):
+    """
+    Décode l'image puis détecte et encode les visages.
+    Retourne (face_locations, face_encodings, timings) ; timings donne la durée
+    de chaque étape en secondes.
+    """
+    timings = {}
+    start = time.perf_counter()
+    image = decode_image(image_bytes)
+    timings["decode"] = time.perf_counter() - start
+    face_locations, face_encodings = detect_and_encode(image, timings=timings)
+    return face_locations, face_encodings, timings
+
+def extract_faces_raw(buffer, shape):
+    """
+    Variante de extract_faces pour une image déjà décodée : octets RGB uint8 de
+    forme shape (hauteur, largeur, 3). Convertie en BGR comme une image décodée
+    par OpenCV, pour rester cohérente avec les modèles enregistrés.
+    """
+    timings = {}
+    start = time.perf_counter()
+    rgb = np.frombuffer(buffer, np.uint8)
+    if rgb.size != int(np.prod(shape)):
+        raise ValueError("Taille du tampon incompatible avec X-Image-Shape.")
+    image = np.ascontiguousarray(rgb.reshape(shape)[:, :, ::-1])
+    timings["decode"] = time.perf_counter() - start
+    face_locations, face_encodings = detect_and_encode(image, timings=timings)
+    return face_locations, face_encodings, timings
+
+def warm_up(size=160):
+    """
+    Charge les modèles dlib (import de face_recognition) puis lance une inférence
+    synthétique pour initialiser détecteur HOG, prédicteur de points clés et
+    réseau d'encodage. Retourne (pid, durée).
+    """
+    start = time.perf_counter()
+    import face_recognition
+
+    image = np.zeros((size, size, 3), dtype=np.uint8)
+    face_recognition.face_locations(image)
+    face_recognition.face_encodings(image, [(size // 4, 3 * size // 4, 3 * size // 4, size // 4)])
+    return os.getpid(), time.perf_counter() - start
+
+def extract_faces_batch(images_bytes):
+    """
+    Traite un lot d'images dans un même worker (un seul aller-retour IPC).
+    Une image illisible renvoie l'exception à sa place au lieu d'interrompre le lot.
+    """
+    results = []
+    for image_bytes in images_bytes:
+        try:
+            results.append(extract_faces(image_bytes))
+        except ValueError as e:
+            results.append(e)
+    return results
@@ -0,0 +1,325 @@
+# ml_service/app/gallery.py
+import logging
+import os
+import threading
+import numpy as np
+
+from .ann import IVFFlatIndex, FACE_INDEX_MIN_SIZE, FACE_INDEX_PATH
+from .database import FaceEncoding, FACE_MAX_TEMPLATES
+
+EMBEDDING_DIM = 128
+DEFAULT_TOLERANCE = float(os.getenv("FACE_TOLERANCE", "0.6"))
+# Agrégation des distances aux modèles d'un utilisateur : "min" (modèle le plus proche) ou "mean"
+FACE_TEMPLATE_AGGREGATION = os.getenv("FACE_TEMPLATE_AGGREGATION", "min")
+AGGREGATIONS = ("min", "mean")
+# Candidats supplémentaires recalculés exactement après le produit matriciel
+RERANK_MARGIN = 8
+
+logger = logging.getLogger(__name__)
+
+
+def face_distance(known_encodings, encoding):
+    """Équivalent vectorisé de face_recognition.face_distance (sans charger dlib)."""
+    known = np.asarray(known_encodings, dtype=np.float32)
+    if len(known) == 0:
+        return np.empty(0, dtype=np.float32)
+    return np.linalg.norm(known - np.asarray(encoding, dtype=np.float32), axis=-1)
+
+def aggregate_distances(distances, starts, aggregation=FACE_TEMPLATE_AGGREGATION):
+    """
+    Réduit des distances regroupées par utilisateur (groupes contigus commençant
+    aux indices starts) en une distance par groupe, en un seul appel reduceat.
+    """
+    distances = np.asarray(distances, dtype=np.float32)
+    starts = np.asarray(starts, dtype=np.intp)
+    if aggregation == "mean":
+        counts = np.diff(np.append(starts, len(distances)))
+        return np.add.reduceat(distances, starts) / counts
+    return np.minimum.reduceat(distances, starts)
+
+def aggregate_by_user(user_ids, distances, aggregation=FACE_TEMPLATE_AGGREGATION):
+    """Distance par utilisateur à partir des distances par modèle. Retourne (user_ids, distances)."""
+    order = np.argsort(user_ids, kind="stable")
+    sorted_ids = user_ids[order]
+    starts = np.flatnonzero(np.append(True, sorted_ids[1:] != sorted_ids[:-1]))
+    return sorted_ids[starts], aggregate_distances(np.asarray(distances)[order], starts, aggregation)
+
+
+class FaceGallery:
+    """
+    Galerie résidente en mémoire : une matrice contiguë (N, 128) en float32,
+    une ligne par modèle, avec les user_id et identifiants de modèle
+    correspondants, chargée une fois au démarrage.
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, initial_capacity=1024):
+        self.dim = dim
+        self._lock = threading.Lock()
+        self._matrix = np.empty((initial_capacity, dim), dtype=np.float32)
+        self._ids = np.empty(initial_capacity, dtype=object)
+        self._template_ids = np.empty(initial_capacity, dtype=np.int64)
+        self._sq_norms = np.empty(initial_capacity, dtype=np.float32)
+        self._rows = {}  # template_id -> index de ligne
+        self._user_templates = {}  # user_id -> {template_id}
+        self._size = 0
+        self.index = None  # IVFFlatIndex optionnel pour les grandes galeries
+        self._index_stale_logged = False
+
+    def __len__(self):
+        return self._size
+
+    def _reserve(self, capacity):
+        # Croissance géométrique pour garder un coût d'insertion amorti en O(1)
+        if capacity <= len(self._matrix):
+            return
+        new_capacity = max(capacity, 2 * len(self._matrix))
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        ids = np.empty(new_capacity, dtype=object)
+        ids[:self._size] = self._ids[:self._size]
+        template_ids = np.empty(new_capacity, dtype=np.int64)
+        template_ids[:self._size] = self._template_ids[:self._size]
+        sq_norms = np.empty(new_capacity, dtype=np.float32)
+        sq_norms[:self._size] = self._sq_norms[:self._size]
+        self._matrix, self._ids, self._template_ids, self._sq_norms = matrix, ids, template_ids, sq_norms
+
+    def load(self, db):
+        """Recharge toute la galerie depuis la base."""
+        rows = db.query(FaceEncoding).all()
+        with self._lock:
+            self.index = None
+            capacity = max(len(rows), 1024)
+            self._matrix = np.empty((capacity, self.dim), dtype=np.float32)
+            self._ids = np.empty(capacity, dtype=object)
+            self._template_ids = np.empty(capacity, dtype=np.int64)
+            self._rows = {}
+            self._user_templates = {}
+            for i, row in enumerate(rows):
+                self._matrix[i] = row.to_array()
+                self._ids[i] = row.user_id
+                self._template_ids[i] = row.id
+                self._rows[row.id] = i
+                self._user_templates.setdefault(row.user_id, set()).add(row.id)
+            self._size = len(rows)
+            matrix = self._matrix[:self._size]
+            self._sq_norms = np.empty(capacity, dtype=np.float32)
+            self._sq_norms[:self._size] = np.einsum("ij,ij->i", matrix, matrix)
+
+    def add(self, template_id, user_id, encoding):
+        """Ajoute (ou remplace) un modèle d'un utilisateur."""
+        with self._lock:
+            row = self._rows.get(template_id)
+            if row is None:
+                self._reserve(self._size + 1)
+                row = self._size
+                self._ids[row] = user_id
+                self._template_ids[row] = template_id
+                self._rows[template_id] = row
+                self._user_templates.setdefault(user_id, set()).add(template_id)
+                self._size += 1
+            self._matrix[row] = encoding
+            self._sq_norms[row] = self._matrix[row] @ self._matrix[row]
+            if self.index is not None:
+                self.index.add(row, self._matrix[row])
+                if not self._index_stale_logged and self.index.is_stale(self._size):
+                    # Réentraîné au prochain démarrage (build_index)
+                    self._index_stale_logged = True
+                    logger.warning(
+                        "Index ANN entraîné sur %d modèles, galerie à %d : réentraînement au prochain démarrage",
+                        self.index.trained_size, self._size,
+                    )
+
+    def _remove_row(self, template_id):
+        # Suppression d'un modèle en déplaçant la dernière ligne à sa place (verrou déjà pris)
+        row = self._rows.pop(template_id, None)
+        if row is None:
+            return
+        user_templates = self._user_templates.get(self._ids[row])
+        if user_templates is not None:
+            user_templates.discard(template_id)
+            if not user_templates:
+                del self._user_templates[self._ids[row]]
+        if self.index is not None:
+            self.index.remove(row)
+        last = self._size - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._sq_norms[row] = self._sq_norms[last]
+            self._ids[row] = self._ids[last]
+            self._template_ids[row] = self._template_ids[last]
+            self._rows[self._template_ids[row]] = row
+            if self.index is not None:
+                self.index.move(last, row)
+        self._ids[last] = None
+        self._size = last
+
+    def remove(self, template_id):
+        """Supprime un modèle."""
+        with self._lock:
+            self._remove_row(template_id)
+
+    def remove_user(self, user_id):
+        """Supprime tous les modèles d'un utilisateur."""
+        with self._lock:
+            for template_id in list(self._user_templates.get(user_id, ())):
+                self._remove_row(template_id)
+
+    def _user_rows(self, user_ids):
+        with self._lock:
+            return np.fromiter(
+                (self._rows[t] for user_id in user_ids for t in self._user_templates.get(user_id, ())),
+                dtype=np.intp,
+            )
+
+    def _snapshot(self):
+        with self._lock:
+            return self._matrix[:self._size], self._ids[:self._size], self._sq_norms[:self._size]
+
+    def attach_index(self, index, assignments=None):
+        """
+        Branche un index ANN sur la galerie. Les lignes présentes dans l'instantané
+        (assignments : template_id -> liste) reprennent leur liste, les autres sont
+        rangées dans la liste du centroïde le plus proche.
+        """
+        assignments = assignments or {}
+        with self._lock:
+            lists = np.array(
+                [assignments.get(template_id, -1) for template_id in self._template_ids[:self._size].tolist()],
+                dtype=np.int32,
+            )
+            unassigned = np.flatnonzero((lists < 0) | (lists >= index.nlist))
+            if len(unassigned):
+                lists[unassigned] = index.assign(self._matrix[unassigned])
+            index.add_many(range(self._size), lists)
+            self.index = index
+            self._index_stale_logged = False
+
+    def build_index(self, path=FACE_INDEX_PATH):
+        """
+        Recharge l'index depuis son instantané (liste de chaque identifiant de
+        modèle), ou l'entraîne si la galerie est assez grande et qu'aucun
+        instantané n'existe, ou si elle a trop grandi depuis l'entraînement
+        (FACE_INDEX_RETRAIN_RATIO).
+        """
+        index, assignments = IVFFlatIndex.load(path)
+        if index is not None and index.is_stale(self._size):
+            logger.warning(
+                "Index ANN entraîné sur %d modèles, galerie à %d : réentraînement",
+                index.trained_size, self._size,
+            )
+            index, assignments = None, {}
+        if index is None:
+            if self._size < FACE_INDEX_MIN_SIZE:
+                return
+            matrix, _, _ = self._snapshot()
+            index = IVFFlatIndex.train(matrix)
+        self.attach_index(index, assignments)
+        if not assignments:
+            self.save_index(path)
+
+    def index_stats(self):
+        """Tailles des listes de l'index ANN et croissance depuis l'entraînement, ou None sans index."""
+        with self._lock:
+            if self.index is None:
+                return None
+            sizes = self.index.list_sizes()
+            return {
+                "lists": len(sizes),
+                "max_list_size": int(sizes.max()),
+                "mean_list_size": float(sizes.mean()),
+                "trained_size": self.index.trained_size,
+                "size": self._size,
+            }
+
+    def save_index(self, path=FACE_INDEX_PATH):
+        if self.index is None:
+            return
+        with self._lock:
+            self.index.save(path, self._template_ids)
+
+    @staticmethod
+    def _sq_distances(queries, matrix, sq_norms):
+        # ||q - g||² = ||q||² - 2 q.g + ||g||²
+        return (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            - 2 * queries @ matrix.T
+            + sq_norms[None, :]
+        )
+
+    def _exhaustive_candidates(self, queries, matrix, sq_norms, n_candidates):
+        sq_distances = self._sq_distances(queries, matrix, sq_norms)
+        if n_candidates < len(matrix):
+            return np.argpartition(sq_distances, n_candidates - 1, axis=1)[:, :n_candidates]
+        return np.broadcast_to(np.arange(len(matrix)), (len(queries), len(matrix)))
+
+    def _exhaustive_user_candidates(self, queries, matrix, ids, sq_norms, n_users):
+        """
+        Pour l'agrégation "mean" : moyenne de chaque utilisateur sur tous ses modèles
+        (un reduceat sur les colonnes regroupées par utilisateur), puis lignes de tous
+        les modèles des n_users utilisateurs les plus proches de chaque requête.
+        """
+        distances = np.sqrt(np.maximum(self._sq_distances(queries, matrix, sq_norms), 0))
+        _, inverse, counts = np.unique(ids, return_inverse=True, return_counts=True)
+        order = np.argsort(inverse, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        means = np.add.reduceat(distances[:, order], starts, axis=1) / counts
+        if n_users < len(counts):
+            nearest = np.argpartition(means, n_users - 1, axis=1)[:, :n_users]
+        else:
+            nearest = np.broadcast_to(np.arange(len(counts)), (len(queries), len(counts)))
+        return [np.flatnonzero(np.isin(inverse, users)) for users in nearest]
+
+    def search_many(self, encodings, k=1, tolerance=DEFAULT_TOLERANCE, nprobe=None,
+                    aggregation=FACE_TEMPLATE_AGGREGATION):
+        """
+        Recherche les k utilisateurs les plus proches pour plusieurs encodages à la fois.
+        Sans index, la matrice de distances (requêtes x modèles) est calculée en un
+        seul produit matriciel, et les candidats sont choisis par modèle ("min") ou
+        par utilisateur sur tous ses modèles ("mean") : le top-k est exact. Avec
+        l'index ANN (grandes galeries), seules les listes explorées sont candidates :
+        pour "mean", un utilisateur dont aucun modèle n'y figure peut être manqué.
+        Les modèles candidats sont recalculés exactement avec face_distance puis
+        réduits par utilisateur (min ou moyenne sur tous ses modèles).
+        Retourne, pour chaque requête, une liste de (user_id, distance) triée par
+        distance croissante et limitée aux distances <= tolerance.
+        """
+        queries = np.atleast_2d(np.asarray(encodings, dtype=np.float32))
+        matrix, ids, sq_norms = self._snapshot()
+        if len(ids) == 0:
+            return [[] for _ in range(len(queries))]
+
+        ann = self.index is not None and len(ids) >= FACE_INDEX_MIN_SIZE
+        if ann:
+            candidates = [self.index.candidates(query, nprobe) for query in queries]
+        elif aggregation == "mean":
+            candidates = self._exhaustive_user_candidates(queries, matrix, ids, sq_norms, k + RERANK_MARGIN)
+        else:
+            # Assez de modèles candidats pour couvrir k utilisateurs distincts
+            n_candidates = min(k * FACE_MAX_TEMPLATES + RERANK_MARGIN, len(ids))
+            candidates = self._exhaustive_candidates(queries, matrix, sq_norms, n_candidates)
+
+        results = []
+        for query, rows in zip(queries, candidates):
+            if len(rows) == 0:
+                # Toutes les listes explorées sont vides (k-means, nprobe faible) : aucun candidat
+                results.append([])
+                continue
+            if ann and aggregation == "mean":
+                # La moyenne porte sur tous les modèles des utilisateurs candidats
+                rows = self._user_rows(np.unique(ids[rows]))
+            user_ids, distances = aggregate_by_user(ids[rows], face_distance(matrix[rows], query), aggregation)
+            order = np.argsort(distances)[:k]
+            results.append([
+                (user_ids[i], float(distances[i]))
+                for i in order
+                if distances[i] <= tolerance
+            ])
+        return results
+
+    def search(self, encoding, k=1, tolerance=DEFAULT_TOLERANCE, nprobe=None,
+               aggregation=FACE_TEMPLATE_AGGREGATION):
+        """Recherche les k utilisateurs les plus proches d'un seul encodage."""
+        return self.search_many([encoding], k=k, tolerance=tolerance, nprobe=nprobe, aggregation=aggregation)[0]
+
+
+gallery = FaceGallery()
@@ -1,15 +1,93 @@
-from fastapi import FastAPI
-from .database import create_tables
-from .routes import face_api
+import asyncio
+import logging
+import os
+import time
+from contextlib import contextmanager
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from .cache import encoding_cache, extraction_cache
+from .database import engine, run_startup_migrations, SessionLocal
+from .executor import face_executor
+from .gallery import gallery
+from .metrics import register_cache, register_index, server_timing_header, start_request_timings
+from .routes import face_api, internal_api
+
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
 
 app = FastAPI(title="API de reconnaissance faciale")
+# Passe à True quand les workers ont chargé et préchauffé les modèles
+app.state.ready = False
+
+register_cache("face_encoding_cache", encoding_cache)
+register_cache("face_extraction_cache", extraction_cache)
+register_index(gallery)
+
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # Durées des étapes de la requête, renvoyées dans l'en-tête Server-Timing
+    timings = start_request_timings()
+    response = await call_next(request)
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+@contextmanager
+def startup_phase(name):
+    start = time.perf_counter()
+    yield
+    logger.info("Démarrage : %s en %.2fs", name, time.perf_counter() - start)
+
+async def warm_up_workers():
+    try:
+        with startup_phase("préchauffage des modèles"):
+            for pid, seconds in await face_executor.warm_up():
+                logger.info("Worker %s préchauffé en %.2fs", pid, seconds)
+        app.state.ready = True
+    except Exception:
+        logger.exception("Échec du préchauffage des modèles")
 
 @app.on_event("startup")
-def on_startup():
-    create_tables()
+async def on_startup():
+    with startup_phase("création des tables et migrations"):
+        # Ancien schéma à un encodage par utilisateur -> plusieurs modèles par utilisateur,
+        # puis conversion des anciens encodages JSON vers le format binaire
+        await run_startup_migrations()
+    with startup_phase("chargement de la galerie"):
+        # Chargement unique de la galerie (tous les modèles) en mémoire pour /face/identify
+        async with SessionLocal() as db:
+            await db.run_sync(gallery.load)
+    with startup_phase("index ANN"):
+        # Index ANN : rechargé depuis son instantané ou entraîné pour les grandes galeries
+        gallery.build_index()
+    face_executor.start()
+    # Le serveur accepte les connexions pendant le préchauffage ; /health/ready renvoie 503 jusqu'à la fin
+    app.state.warm_up_task = asyncio.create_task(warm_up_workers())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    face_executor.shutdown()
+    gallery.save_index()
+    await engine.dispose()
 
 app.include_router(face_api.router)
+app.include_router(internal_api.router)
 
 @app.get("/")
 def read_root():
-    return {"message": "API de reconnaissance faciale opérationnelle"}
\ No newline at end of file
+    return {"message": "API de reconnaissance faciale opérationnelle"}
+
+@app.get("/metrics")
+def metrics():
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/health/live")
+def health_live():
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+def health_ready():
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
@@ -0,0 +1,135 @@
+# ml_service/app/metrics.py
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUEST_SECONDS = Histogram(
+    "face_api_request_seconds", "Durée totale des requêtes par endpoint",
+    ["endpoint"], buckets=LATENCY_BUCKETS,
+)
+STAGE_SECONDS = Histogram(
+    "face_api_stage_seconds", "Durée de chaque étape (decode, detect, encode, queue, db, compare)",
+    ["endpoint", "stage"], buckets=LATENCY_BUCKETS,
+)
+OUTCOMES = Counter(
+    "face_api_outcomes_total", "Résultats par endpoint (no_face, match, no_match, not_found, error...)",
+    ["endpoint", "outcome"],
+)
+IN_FLIGHT = Gauge("face_api_in_flight_requests", "Requêtes en cours par endpoint", ["endpoint"])
+
+# Endpoint et durées d'étapes de la requête en cours (pour les labels et l'en-tête Server-Timing)
+_current_endpoint = ContextVar("current_endpoint", default="unknown")
+_request_timings = ContextVar("request_timings", default=None)
+
+
+def start_request_timings():
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def server_timing_header(timings):
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in timings.items())
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.labels(_current_endpoint.get(), stage).observe(seconds)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+def observe_stages(timings):
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds)
+
+def record_outcome(outcome, count=1):
+    OUTCOMES.labels(_current_endpoint.get(), outcome).inc(count)
+
+@contextmanager
+def stage(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+def instrumented(endpoint):
+    """Décorateur de route : durée totale, requêtes en cours et erreurs, par endpoint."""
+    def decorator(route):
+        @functools.wraps(route)
+        async def wrapper(*args, **kwargs):
+            token = _current_endpoint.set(endpoint)
+            in_flight = IN_FLIGHT.labels(endpoint)
+            in_flight.inc()
+            start = time.perf_counter()
+            try:
+                return await route(*args, **kwargs)
+            except HTTPException as e:
+                if e.status_code >= 500:
+                    record_outcome("error")
+                raise
+            except Exception:
+                record_outcome("error")
+                raise
+            finally:
+                REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - start)
+                in_flight.dec()
+                _current_endpoint.reset(token)
+        return wrapper
+    return decorator
+
+
+class CacheCollector:
+    """Expose les compteurs d'un LRUCache (hits, misses, taille) au format Prometheus."""
+
+    def __init__(self, name, cache):
+        self.name = name
+        self.cache = cache
+
+    def collect(self):
+        stats = self.cache.stats()
+        hits = CounterMetricFamily(f"{self.name}_hits", f"Hits du cache {self.name}")
+        hits.add_metric([], stats["hits"])
+        misses = CounterMetricFamily(f"{self.name}_misses", f"Misses du cache {self.name}")
+        misses.add_metric([], stats["misses"])
+        size = GaugeMetricFamily(f"{self.name}_size", f"Entrées du cache {self.name}")
+        size.add_metric([], stats["size"])
+        return [hits, misses, size]
+
+
+class IndexCollector:
+    """
+    État de l'index ANN de la galerie : déséquilibre des listes (plus grande
+    liste / taille moyenne, 1 = équilibré) et croissance depuis l'entraînement.
+    """
+
+    def __init__(self, gallery):
+        self.gallery = gallery
+
+    def collect(self):
+        stats = self.gallery.index_stats()
+        if stats is None:
+            return []
+        lists = GaugeMetricFamily("face_index_lists", "Listes inversées de l'index ANN")
+        lists.add_metric([], stats["lists"])
+        imbalance = GaugeMetricFamily(
+            "face_index_list_imbalance", "Taille de la plus grande liste ANN rapportée à la taille moyenne",
+        )
+        imbalance.add_metric([], stats["max_list_size"] / stats["mean_list_size"] if stats["mean_list_size"] else 0.0)
+        growth = GaugeMetricFamily(
+            "face_index_growth_ratio", "Taille de la galerie rapportée à sa taille à l'entraînement de l'index",
+        )
+        growth.add_metric([], stats["size"] / stats["trained_size"] if stats["trained_size"] else 0.0)
+        return [lists, imbalance, growth]
+
+
+def register_cache(name, cache):
+    REGISTRY.register(CacheCollector(name, cache))
+
+def register_index(gallery):
+    REGISTRY.register(IndexCollector(gallery))
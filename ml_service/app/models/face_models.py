@@ -1,17 +1,70 @@
+from datetime import datetime
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class VerificationResponse(BaseModel):
     status: str
     match: bool
     message: Optional[str] = None
 
+class Candidate(BaseModel):
+    user_id: str
+    distance: float
+    confidence: float
+
+class FaceBox(BaseModel):
+    top: int
+    right: int
+    bottom: int
+    left: int
+
+class FaceIdentification(BaseModel):
+    box: FaceBox
+    user_id: Optional[str] = None
+    confidence: Optional[float] = None
+    distance: Optional[float] = None
+    candidates: List[Candidate] = []
+
 class IdentificationResponse(BaseModel):
     status: str
     user_id: Optional[str]
     confidence: Optional[float]
+    distance: Optional[float] = None
+    candidates: List[Candidate] = []
+    # Tous les visages détectés ; user_id/confidence ci-dessus = meilleure correspondance
+    faces: List[FaceIdentification] = []
     message: Optional[str] = None
 
+class VerificationResult(BaseModel):
+    user_id: str
+    status: str
+    match: bool
+    distance: Optional[float] = None
+    message: Optional[str] = None
+
+class BatchVerificationResponse(BaseModel):
+    status: str
+    results: List[VerificationResult]
+
+class BatchIdentificationResponse(BaseModel):
+    status: str
+    results: List[IdentificationResponse]
+
 class StandardResponse(BaseModel):
     status: str
-    message: Optional[str] = None
\ No newline at end of file
+    message: Optional[str] = None
+
+class TemplateInfo(BaseModel):
+    id: int
+    created_at: Optional[datetime] = None
+
+class TemplateResponse(BaseModel):
+    status: str
+    template_id: int
+    message: Optional[str] = None
+
+class TemplateListResponse(BaseModel):
+    status: str
+    user_id: str
+    max_templates: int
+    templates: List[TemplateInfo]
@@ -1,92 +1,522 @@
 # ml_service/app/routes/face_api.py
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends
-from sqlalchemy.orm import Session
-import face_recognition
-import cv2
+import os
+import time
+from typing import List, Optional
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, Query, WebSocket, WebSocketDisconnect
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import numpy as np
 
-from ..database import get_db, FaceEncoding
-from ..models.face_models import VerificationResponse, IdentificationResponse, StandardResponse
+from ..cache import content_key, encoding_cache, extraction_cache
+from ..database import get_db, FaceEncoding, FACE_MAX_TEMPLATES
+from ..executor import face_executor, ExecutorSaturated
+from ..face_processing import extract_faces, extract_faces_batch, extract_faces_raw, FACE_DETECTION_MAX_SIDE
+from ..gallery import gallery, face_distance, aggregate_distances, AGGREGATIONS, DEFAULT_TOLERANCE, FACE_TEMPLATE_AGGREGATION
+from ..metrics import instrumented, observe_stage, observe_stages, record_outcome, stage
+from ..models.face_models import (
+    VerificationResponse, IdentificationResponse, StandardResponse,
+    BatchVerificationResponse, BatchIdentificationResponse,
+    TemplateResponse, TemplateListResponse,
+)
 
 router = APIRouter(prefix="/face", tags=["face_recognition"])
 
+# Paramètre commun : agrégation des distances aux modèles d'un utilisateur
+AggregationQuery = Query(FACE_TEMPLATE_AGGREGATION, pattern="^(min|mean)$")
+
+# Vérification en flux : arrêt dès qu'une image passe sous ce seuil (plus strict que
+# FACE_TOLERANCE), sinon décision sur la meilleure image après FACE_STREAM_MAX_FRAMES images
+FACE_STREAM_MATCH_DISTANCE = float(os.getenv("FACE_STREAM_MATCH_DISTANCE", "0.5"))
+FACE_STREAM_MAX_FRAMES = int(os.getenv("FACE_STREAM_MAX_FRAMES", "30"))
+
+def extraction_key(image_bytes, shape=None):
+    return content_key(image_bytes, shape, FACE_DETECTION_MAX_SIDE)
+
+async def extract_in_pool(image_bytes, shape=None):
+    """
+    Décodage + détection + encodage dans le pool, sans bloquer la boucle asyncio.
+    Avec shape, image_bytes est un tampon RGB déjà décodé (hauteur, largeur, 3).
+    Une image déjà traitée (mêmes octets) est servie depuis extraction_cache sans
+    passer par le pool. Les durées mesurées dans le worker sont enregistrées ;
+    "queue" est le reste (attente d'un worker libre et aller-retour IPC).
+    """
+    key = extraction_key(image_bytes, shape)
+    cached = extraction_cache.get(key)
+    if cached is not None:
+        return cached
+
+    start = time.perf_counter()
+    try:
+        if shape is None:
+            extracted = await face_executor.run(extract_faces, image_bytes)
+        else:
+            extracted = await face_executor.run(extract_faces_raw, image_bytes, shape)
+        face_locations, face_encodings, timings = extracted
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Service surchargé, veuillez réessayer.")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    observe_stages(timings)
+    observe_stage("queue", max(0.0, time.perf_counter() - start - sum(timings.values())))
+    extraction_cache.set(key, (face_locations, face_encodings))
+    return face_locations, face_encodings
+
+async def extract_batch_in_pool(images_bytes):
+    """
+    Version lot : seules les images absentes du cache sont réparties sur les
+    workers ; résultats (face_locations, face_encodings, timings) dans l'ordre.
+    """
+    keys = [extraction_key(image_bytes) for image_bytes in images_bytes]
+    extracted = [extraction_cache.get(key) for key in keys]
+    extracted = [None if item is None else (*item, {}) for item in extracted]
+    missing = [i for i, item in enumerate(extracted) if item is None]
+    if not missing:
+        return extracted
+
+    start = time.perf_counter()
+    try:
+        computed = await face_executor.map_batches(extract_faces_batch, [images_bytes[i] for i in missing])
+    except ExecutorSaturated:
+        raise HTTPException(status_code=503, detail="Service surchargé, veuillez réessayer.")
+    for i, item in zip(missing, computed):
+        extracted[i] = item
+        if not isinstance(item, Exception):
+            observe_stages(item[2])
+            extraction_cache.set(keys[i], item[:2])
+    observe_stage("pool", time.perf_counter() - start)
+    return extracted
+
+async def load_known_encodings(db, user_ids):
+    """
+    Modèles connus par user_id (matrice K x 128) : cache LRU d'abord, une seule
+    requête pour les absents.
+    """
+    known = {}
+    missing = []
+    # Génération lue avant la requête : un enregistrement validé pendant celle-ci
+    # invalide le cache, et les modèles lus (périmés) n'y sont alors pas remis
+    generations = {}
+    for user_id in set(user_ids):
+        templates = encoding_cache.get(user_id)
+        if templates is None:
+            missing.append(user_id)
+            generations[user_id] = encoding_cache.generation(user_id)
+        else:
+            known[user_id] = templates
+    if missing:
+        with stage("db"):
+            db_encodings = (await db.scalars(
+                select(FaceEncoding)
+                .where(FaceEncoding.user_id.in_(missing))
+                .order_by(FaceEncoding.id)
+            )).all()
+        grouped = {}
+        for db_encoding in db_encodings:
+            grouped.setdefault(db_encoding.user_id, []).append(db_encoding.to_array())
+        for user_id, arrays in grouped.items():
+            known[user_id] = np.stack(arrays).astype(np.float32)
+            encoding_cache.set(user_id, known[user_id], generations[user_id])
+    return known
+
+def template_distance(known_templates, encoding, aggregation):
+    """Distances à tous les modèles de l'utilisateur en un appel, puis agrégation."""
+    with stage("compare"):
+        return float(aggregate_distances(face_distance(known_templates, encoding), [0], aggregation)[0])
+
+def identification_result(face_locations, face_matches):
+    """Réponse d'identification : un résultat par visage, la meilleure correspondance en tête."""
+    faces = []
+    for (top, right, bottom, left), matches in zip(face_locations, face_matches):
+        candidates = [
+            {"user_id": match_id, "distance": distance, "confidence": 1 - distance}
+            for match_id, distance in matches
+        ]
+        best = candidates[0] if candidates else {}
+        faces.append({
+            "box": {"top": top, "right": right, "bottom": bottom, "left": left},
+            "user_id": best.get("user_id"),
+            "confidence": best.get("confidence"),
+            "distance": best.get("distance"),
+            "candidates": candidates,
+        })
+
+    identified = [face for face in faces if face["user_id"] is not None]
+    best = min(identified, key=lambda face: face["distance"]) if identified else {}
+    return {
+        "status": "success",
+        "user_id": best.get("user_id"),
+        "confidence": best.get("confidence"),
+        "distance": best.get("distance"),
+        "candidates": best.get("candidates", []),
+        "faces": faces,
+        "message": "Identification réussie." if best else "Visage non identifié.",
+    }
+
+async def count_templates(db, user_id, lock=False):
+    statement = select(FaceEncoding.id).where(FaceEncoding.user_id == user_id)
+    if lock:
+        # Verrouille les modèles de l'utilisateur jusqu'à la fin de la transaction (FOR UPDATE
+        # sous Postgres, sans effet sous SQLite qui sérialise déjà les écritures)
+        statement = statement.with_for_update()
+    return len((await db.scalars(statement)).all())
+
+async def insert_template(db, user_id, encoding):
+    """
+    Ajoute un modèle si l'utilisateur en a moins de FACE_MAX_TEMPLATES, en une
+    transaction : les modèles existants sont verrouillés avant le comptage, puis
+    recomptés après l'insertion (ajouts concurrents d'un utilisateur sans modèle,
+    qui n'ont aucune ligne à verrouiller). Retourne l'identifiant du modèle, ou
+    None si la limite est atteinte (rien n'est écrit).
+    """
+    if await count_templates(db, user_id, lock=True) >= FACE_MAX_TEMPLATES:
+        await db.rollback()
+        return None
+    db_encoding = FaceEncoding.from_array(user_id, encoding)
+    db.add(db_encoding)
+    await db.flush()
+    if await count_templates(db, user_id) > FACE_MAX_TEMPLATES:
+        await db.rollback()
+        return None
+    await db.commit()
+    return db_encoding.id
+
+# Traitements communs aux routes multipart (/face) et binaires (/internal/face)
+
+async def register_face(db, user_id, image_bytes, shape=None):
+    face_locations, face_encodings = await extract_in_pool(image_bytes, shape)
+    if not face_locations:
+        record_outcome("no_face")
+        raise HTTPException(status_code=400, detail="Aucun visage détecté.")
+
+    face_encoding = face_encodings[0]
+
+    # Un nouvel enregistrement remplace tous les modèles existants par un seul
+    db_encoding = FaceEncoding.from_array(user_id, face_encoding)
+    with stage("db"):
+        await db.execute(delete(FaceEncoding).where(FaceEncoding.user_id == user_id))
+        db.add(db_encoding)
+        await db.commit()
+        template_id = db_encoding.id
+    # Le prochain verify relira les modèles en base
+    encoding_cache.invalidate(user_id)
+    gallery.remove_user(user_id)
+    gallery.add(template_id, user_id, face_encoding)
+    record_outcome("registered")
+
+    return {"status": "success", "message": "Visage enregistré avec succès."}
+
+async def verify_face(db, user_id, image_bytes, shape=None, aggregation=FACE_TEMPLATE_AGGREGATION):
+    known_templates = (await load_known_encodings(db, [user_id])).get(user_id)
+    if known_templates is None:
+        record_outcome("not_found")
+        raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
+
+    face_locations, face_encodings = await extract_in_pool(image_bytes, shape)
+    if not face_locations:
+        record_outcome("no_face")
+        return {"status": "failure", "match": False, "message": "Aucun visage détecté."}
+
+    distance = template_distance(known_templates, face_encodings[0], aggregation)
+    match = distance <= DEFAULT_TOLERANCE
+    record_outcome("match" if match else "no_match")
+
+    return {"status": "success", "match": match, "message": "Vérification réussie." if match else "Vérification échouée."}
+
+async def identify_face(image_bytes, shape=None, top_k=1, tolerance=DEFAULT_TOLERANCE, nprobe=None,
+                        aggregation=FACE_TEMPLATE_AGGREGATION):
+    face_locations, face_encodings = await extract_in_pool(image_bytes, shape)
+    if not face_locations:
+        record_outcome("no_face")
+        return {"status": "failure", "user_id": None, "confidence": None, "message": "Aucun visage détecté."}
+
+    # Tous les visages détectés comparés à la galerie en une seule matrice (visages x galerie)
+    with stage("compare"):
+        face_matches = gallery.search_many(
+            face_encodings, k=top_k, tolerance=tolerance, nprobe=nprobe, aggregation=aggregation,
+        )
+    result = identification_result(face_locations, face_matches)
+    record_outcome("match" if result["user_id"] else "no_match")
+    return result
+
 @router.post("/register/{user_id}", response_model=StandardResponse, status_code=201)
-async def register_face_route(user_id: str, image: UploadFile = File(...), db: Session = Depends(get_db)):
+@instrumented("register")
+async def register_face_route(user_id: str, image: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
     try:
-        image_bytes = await image.read()
-        image_np = np.frombuffer(image_bytes, np.uint8)
-        image_rgb = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
+        return await register_face(db, user_id, await image.read())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
 
-        face_locations = face_recognition.face_locations(image_rgb)
+@router.post("/templates/{user_id}", response_model=TemplateResponse, status_code=201)
+@instrumented("template_add")
+async def add_template_route(user_id: str, image: UploadFile = File(...), db: AsyncSession = Depends(get_db)):
+    """
+    Ajoute un modèle (autre éclairage, autre angle...) sans remplacer les existants.
+    La limite est vérifiée une première fois pour ne pas encoder l'image inutilement,
+    puis de nouveau dans la transaction d'insertion (voir insert_template).
+    """
+    with stage("db"):
+        count = await count_templates(db, user_id)
+    if count >= FACE_MAX_TEMPLATES:
+        record_outcome("limit_reached")
+        raise HTTPException(status_code=409, detail=f"Nombre maximal de modèles atteint ({FACE_MAX_TEMPLATES}).")
+
+    try:
+        image_bytes = await image.read()
+        face_locations, face_encodings = await extract_in_pool(image_bytes)
         if not face_locations:
+            record_outcome("no_face")
             raise HTTPException(status_code=400, detail="Aucun visage détecté.")
-        
-        face_encoding = face_recognition.face_encodings(image_rgb, face_locations)[0]
-
-        db_encoding = FaceEncoding(user_id=user_id, encoding=face_encoding.tolist())
-        # Utilisation de merge pour insérer ou mettre à jour (upsert)
-        db.merge(db_encoding)
-        db.commit()
-        
-        return {"status": "success", "message": "Visage enregistré avec succès."}
+
+        face_encoding = face_encodings[0]
+        with stage("db"):
+            template_id = await insert_template(db, user_id, face_encoding)
+        if template_id is None:
+            record_outcome("limit_reached")
+            raise HTTPException(status_code=409, detail=f"Nombre maximal de modèles atteint ({FACE_MAX_TEMPLATES}).")
+        encoding_cache.invalidate(user_id)
+        gallery.add(template_id, user_id, face_encoding)
+        record_outcome("added")
+
+        return {"status": "success", "template_id": template_id, "message": "Modèle ajouté avec succès."}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
 
-@router.post("/verify/{user_id}", response_model=VerificationResponse)
-async def verify_face_route(user_id: str, image: UploadFile = File(...), db: Session = Depends(get_db)):
-    db_encoding = db.query(FaceEncoding).filter(FaceEncoding.user_id == user_id).first()
-    if not db_encoding:
+@router.get("/templates/{user_id}", response_model=TemplateListResponse)
+async def list_templates_route(user_id: str, db: AsyncSession = Depends(get_db)):
+    templates = (await db.execute(
+        select(FaceEncoding.id, FaceEncoding.created_at)
+        .where(FaceEncoding.user_id == user_id)
+        .order_by(FaceEncoding.id)
+    )).all()
+    if not templates:
         raise HTTPException(status_code=404, detail="Utilisateur non trouvé.")
+    return {
+        "status": "success",
+        "user_id": user_id,
+        "max_templates": FACE_MAX_TEMPLATES,
+        "templates": [{"id": template_id, "created_at": created_at} for template_id, created_at in templates],
+    }
+
+@router.delete("/templates/{user_id}/{template_id}", response_model=StandardResponse)
+@instrumented("template_delete")
+async def delete_template_route(user_id: str, template_id: int, db: AsyncSession = Depends(get_db)):
+    with stage("db"):
+        result = await db.execute(
+            delete(FaceEncoding).where(FaceEncoding.id == template_id, FaceEncoding.user_id == user_id)
+        )
+        await db.commit()
+    if not result.rowcount:
+        record_outcome("not_found")
+        raise HTTPException(status_code=404, detail="Modèle non trouvé.")
+    encoding_cache.invalidate(user_id)
+    gallery.remove(template_id)
+    record_outcome("deleted")
+    return {"status": "success", "message": "Modèle supprimé."}
+
+# Les routes /batch doivent être déclarées avant /verify/{user_id}
+@router.post("/verify/batch", response_model=BatchVerificationResponse)
+@instrumented("verify_batch")
+async def verify_batch_route(
+    user_ids: List[str] = Form(...),
+    images: List[UploadFile] = File(...),
+    aggregation: str = AggregationQuery,
+    db: AsyncSession = Depends(get_db),
+):
+    if len(user_ids) != len(images):
+        raise HTTPException(status_code=400, detail="Autant de user_ids que d'images sont attendus.")
 
     try:
-        image_bytes = await image.read()
-        image_np = np.frombuffer(image_bytes, np.uint8)
-        image_rgb = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
-        
-        face_locations = face_recognition.face_locations(image_rgb)
-        if not face_locations:
-            return {"status": "failure", "match": False, "message": "Aucun visage détecté."}
-
-        unknown_encoding = face_recognition.face_encodings(image_rgb, face_locations)[0]
-        known_encoding = np.array(db_encoding.encoding)
-
-        # La ligne de comparaison est un peu longue, donc on la met sur plusieurs lignes pour la lisibilité
-        match = face_recognition.compare_faces(
-            [known_encoding],
-            unknown_encoding
-        )[0]
-        
-        return {"status": "success", "match": match, "message": "Vérification réussie." if match else "Vérification échouée."}
+        known = await load_known_encodings(db, user_ids)
+
+        images_bytes = [await image.read() for image in images]
+        extracted = await extract_batch_in_pool(images_bytes)
+
+        results = []
+        to_compare = []
+        for i, (user_id, item) in enumerate(zip(user_ids, extracted)):
+            result = {"user_id": user_id, "status": "failure", "match": False}
+            if isinstance(item, Exception):
+                result.update(status="error", message=str(item))
+                record_outcome("invalid_image")
+            elif user_id not in known:
+                result["message"] = "Utilisateur non trouvé."
+                record_outcome("not_found")
+            elif not item[0]:
+                result["message"] = "Aucun visage détecté."
+                record_outcome("no_face")
+            else:
+                to_compare.append(i)
+            results.append(result)
+
+        # Toutes les comparaisons (modèle connu, inconnu) en un seul calcul vectorisé,
+        # puis réduction par utilisateur (min ou moyenne sur ses modèles)
+        if to_compare:
+            with stage("compare"):
+                known_templates = [known[user_ids[i]] for i in to_compare]
+                counts = [len(templates) for templates in known_templates]
+                unknown_matrix = np.repeat(np.stack([extracted[i][1][0] for i in to_compare]), counts, axis=0)
+                starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+                distances = aggregate_distances(
+                    face_distance(np.concatenate(known_templates), unknown_matrix), starts, aggregation,
+                )
+            for i, distance in zip(to_compare, distances):
+                match = bool(distance <= DEFAULT_TOLERANCE)
+                record_outcome("match" if match else "no_match")
+                results[i].update(
+                    status="success",
+                    match=match,
+                    distance=float(distance),
+                    message="Vérification réussie." if match else "Vérification échouée.",
+                )
+
+        return {"status": "success", "results": results}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
 
-@router.post("/identify", response_model=IdentificationResponse)
-async def identify_face_route(image: UploadFile = File(...), db: Session = Depends(get_db)):
+@router.post("/identify/batch", response_model=BatchIdentificationResponse)
+@instrumented("identify_batch")
+async def identify_batch_route(
+    images: List[UploadFile] = File(...),
+    top_k: int = Query(1, ge=1, le=100),
+    tolerance: float = Query(DEFAULT_TOLERANCE, gt=0),
+    nprobe: Optional[int] = Query(None, ge=1),
+    aggregation: str = AggregationQuery,
+):
     try:
-        image_bytes = await image.read()
-        image_np = np.frombuffer(image_bytes, np.uint8)
-        image_rgb = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
+        images_bytes = [await image.read() for image in images]
+        extracted = await extract_batch_in_pool(images_bytes)
 
-        face_locations = face_recognition.face_locations(image_rgb)
-        if not face_locations:
-            return {"status": "failure", "user_id": None, "confidence": None, "message": "Aucun visage détecté."}
-        
-        unknown_encoding = face_recognition.face_encodings(image_rgb, face_locations)[0]
-        
-        known_encodings_db = db.query(FaceEncoding).all()
-        known_encodings = [np.array(e.encoding) for e in known_encodings_db]
-        known_ids = [e.user_id for e in known_encodings_db]
-        
-        matches = face_recognition.compare_faces(known_encodings, unknown_encoding)
-        
-        user_id = None
-        confidence = None
-        if True in matches:
-            first_match_index = matches.index(True)
-            user_id = known_ids[first_match_index]
-            face_distances = face_recognition.face_distance(known_encodings, unknown_encoding)
-            confidence = 1 - face_distances[first_match_index]
-        
-        return {"status": "success", "user_id": user_id, "confidence": confidence, "message": "Identification réussie." if user_id else "Visage non identifié."}
+        results = []
+        to_search = []
+        for i, item in enumerate(extracted):
+            if isinstance(item, Exception):
+                results.append({"status": "error", "user_id": None, "confidence": None, "message": str(item)})
+                record_outcome("invalid_image")
+            elif not item[0]:
+                results.append({"status": "failure", "user_id": None, "confidence": None, "message": "Aucun visage détecté."})
+                record_outcome("no_face")
+            else:
+                to_search.append(i)
+                results.append(None)
+
+        # Matrice de distances (tous les visages de toutes les images x galerie) en un seul passage
+        if to_search:
+            with stage("compare"):
+                queries = np.concatenate([extracted[i][1] for i in to_search])
+                face_matches = gallery.search_many(
+                    queries, k=top_k, tolerance=tolerance, nprobe=nprobe, aggregation=aggregation,
+                )
+            offset = 0
+            for i in to_search:
+                face_locations = extracted[i][0]
+                results[i] = identification_result(face_locations, face_matches[offset:offset + len(face_locations)])
+                offset += len(face_locations)
+                record_outcome("match" if results[i]["user_id"] else "no_match")
+
+        return {"status": "success", "results": results}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
+
+@router.post("/verify/{user_id}", response_model=VerificationResponse)
+@instrumented("verify")
+async def verify_face_route(
+    user_id: str,
+    image: UploadFile = File(...),
+    aggregation: str = AggregationQuery,
+    db: AsyncSession = Depends(get_db),
+):
+    try:
+        return await verify_face(db, user_id, await image.read(), aggregation=aggregation)
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
+
+@router.websocket("/verify/{user_id}/stream")
+@instrumented("verify_stream")
+async def verify_stream_route(
+    websocket: WebSocket,
+    user_id: str,
+    aggregation: str = FACE_TEMPLATE_AGGREGATION,
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Vérification en flux : le client envoie des images (octets JPEG/PNG) une par
+    une sur la même connexion et reçoit un résultat JSON par image. La connexion
+    est fermée au premier résultat final ("final": true) : correspondance sûre
+    (distance <= FACE_STREAM_MATCH_DISTANCE) ou FACE_STREAM_MAX_FRAMES images traitées.
+    """
+    await websocket.accept()
+    known_templates = (await load_known_encodings(db, [user_id])).get(user_id)
+    # La connexion à la base n'est plus nécessaire pendant le flux
+    await db.close()
+    if known_templates is None or aggregation not in AGGREGATIONS:
+        record_outcome("not_found" if known_templates is None else "invalid_request")
+        message = "Utilisateur non trouvé." if known_templates is None else "Agrégation inconnue."
+        await websocket.send_json({"status": "error", "match": False, "final": True, "message": message})
+        await websocket.close(code=1008)
+        return
+
+    best_distance = None
+    try:
+        for frame in range(1, FACE_STREAM_MAX_FRAMES + 1):
+            image_bytes = await websocket.receive_bytes()
+            last_frame = frame == FACE_STREAM_MAX_FRAMES
+            result = {"status": "failure", "match": False, "final": last_frame, "frame": frame}
+            try:
+                face_locations, face_encodings = await extract_in_pool(image_bytes)
+            except HTTPException as e:
+                # Image illisible ou service saturé : on attend l'image suivante
+                result.update(status="error", message=e.detail)
+                face_locations = []
+            if face_locations:
+                distance = template_distance(known_templates, face_encodings[0], aggregation)
+                best_distance = distance if best_distance is None else min(best_distance, distance)
+                result.update(
+                    status="success",
+                    match=distance <= DEFAULT_TOLERANCE,
+                    distance=distance,
+                    final=last_frame or distance <= FACE_STREAM_MATCH_DISTANCE,
+                )
+            elif "message" not in result:
+                result["message"] = "Aucun visage détecté."
+            if result["final"]:
+                match = best_distance is not None and best_distance <= DEFAULT_TOLERANCE
+                record_outcome("match" if match else "no_match")
+                result.update(
+                    match=match,
+                    distance=best_distance,
+                    message="Vérification réussie." if match else "Vérification échouée.",
+                )
+                await websocket.send_json(result)
+                await websocket.close()
+                return
+            await websocket.send_json(result)
+    except WebSocketDisconnect:
+        record_outcome("disconnected")
+
+@router.post("/identify", response_model=IdentificationResponse)
+@instrumented("identify")
+async def identify_face_route(
+    image: UploadFile = File(...),
+    top_k: int = Query(1, ge=1, le=100),
+    tolerance: float = Query(DEFAULT_TOLERANCE, gt=0),
+    nprobe: Optional[int] = Query(None, ge=1),
+    aggregation: str = AggregationQuery,
+):
+    try:
+        return await identify_face(
+            await image.read(), top_k=top_k, tolerance=tolerance, nprobe=nprobe, aggregation=aggregation,
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
@@ -0,0 +1,125 @@
+# ml_service/app/routes/internal_api.py
+# Variante interne des routes /face pour les appels entre services : l'image est
+# le corps brut de la requête (application/octet-stream, sans multipart) et les
+# réponses sont encodées en msgpack, erreurs comprises.
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
+from fastapi.routing import APIRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+import msgpack
+
+from ..database import get_db
+from ..gallery import DEFAULT_TOLERANCE
+from ..metrics import instrumented
+from .face_api import AggregationQuery, identify_face, register_face, verify_face
+
+MSGPACK_MEDIA_TYPE = "application/x-msgpack"
+
+
+
+class MsgpackResponse(Response):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def render(self, content):
+        return msgpack.packb(content, use_bin_type=True)
+
+
+class MsgpackRoute(APIRoute):
+    """
+    Route dont les erreurs (HTTPException, validation des paramètres) sont
+    renvoyées en msgpack {"detail": ...} avec leur statut, comme les succès,
+    au lieu du JSON des gestionnaires par défaut de FastAPI.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def msgpack_errors_handler(request):
+            try:
+                return await handler(request)
+            except HTTPException as e:
+                return MsgpackResponse({"detail": e.detail}, status_code=e.status_code, headers=e.headers)
+            except RequestValidationError as e:
+                return MsgpackResponse({"detail": jsonable_encoder(e.errors())}, status_code=422)
+
+        return msgpack_errors_handler
+
+
+router = APIRouter(prefix="/internal/face", tags=["face_recognition_internal"], route_class=MsgpackRoute)
+
+
+def parse_image_shape(header):
+    """
+    En-tête X-Image-Shape "hauteur,largeur,3" : le corps est alors un tampon RGB
+    uint8 déjà décodé. Sans en-tête, le corps est un fichier image (JPEG, PNG...).
+    """
+    if header is None:
+        return None
+    try:
+        shape = tuple(int(dim) for dim in header.replace("x", ",").split(","))
+    except ValueError:
+        shape = ()
+    if len(shape) != 3 or shape[2] != 3 or min(shape) <= 0:
+        raise HTTPException(status_code=400, detail="En-tête X-Image-Shape invalide (attendu : hauteur,largeur,3).")
+    return shape
+
+async def read_image(request, x_image_shape):
+    image_bytes = await request.body()
+    if not image_bytes:
+        raise HTTPException(status_code=400, detail="Image non fournie.")
+    return image_bytes, parse_image_shape(x_image_shape)
+
+
+@router.post("/register/{user_id}", response_class=MsgpackResponse, status_code=201)
+@instrumented("internal_register")
+async def register_face_raw_route(
+    user_id: str,
+    request: Request,
+    x_image_shape: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_db),
+):
+    image_bytes, shape = await read_image(request, x_image_shape)
+    try:
+        return MsgpackResponse(await register_face(db, user_id, image_bytes, shape), status_code=201)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
+
+@router.post("/verify/{user_id}", response_class=MsgpackResponse)
+@instrumented("internal_verify")
+async def verify_face_raw_route(
+    user_id: str,
+    request: Request,
+    x_image_shape: Optional[str] = Header(None),
+    aggregation: str = AggregationQuery,
+    db: AsyncSession = Depends(get_db),
+):
+    image_bytes, shape = await read_image(request, x_image_shape)
+    try:
+        return MsgpackResponse(await verify_face(db, user_id, image_bytes, shape, aggregation))
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
+
+@router.post("/identify", response_class=MsgpackResponse)
+@instrumented("internal_identify")
+async def identify_face_raw_route(
+    request: Request,
+    x_image_shape: Optional[str] = Header(None),
+    top_k: int = Query(1, ge=1, le=100),
+    tolerance: float = Query(DEFAULT_TOLERANCE, gt=0),
+    nprobe: Optional[int] = Query(None, ge=1),
+    aggregation: str = AggregationQuery,
+):
+    image_bytes, shape = await read_image(request, x_image_shape)
+    try:
+        result = await identify_face(image_bytes, shape, top_k, tolerance, nprobe, aggregation)
+        return MsgpackResponse(result)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erreur interne: {e}")
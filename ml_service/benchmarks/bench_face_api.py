@@ -0,0 +1,280 @@
+# ml_service/benchmarks/bench_face_api.py
+# Banc de latence et de débit de l'API /face, exécutée dans le processus
+# (httpx + ASGITransport) sur une base SQLite locale.
+#
+#   cd ml_service
+#   python -m benchmarks.bench_face_api --output benchmarks/results.json
+#   python -m benchmarks.bench_face_api --baseline benchmarks/baseline.json
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ML_SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_IMAGES_DIR = os.path.join(ML_SERVICE_DIR, "evaluations", "img_tests")
+ENDPOINTS = ("register", "verify", "identify")
+PERCENTILES = (50, 95, 99)
+SEED_BATCH_SIZE = 10000
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Latence (p50/p95/p99) et débit de /face/register, /face/verify et /face/identify.")
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="Tailles de galerie (encodages synthétiques)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16],
+                        help="Nombres de requêtes simultanées")
+    parser.add_argument("--requests", type=int, default=200, help="Requêtes par endpoint et par niveau de concurrence")
+    parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument("--images", default=DEFAULT_IMAGES_DIR, help="Dossier d'images (un sous-dossier par personne)")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="Garde le cache des extractions (par défaut désactivé : chaque requête passe par les workers)")
+    parser.add_argument("--output", help="Fichier JSON des résultats (sinon sortie standard)")
+    parser.add_argument("--baseline", help="Résultats de référence à comparer")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Dégradation tolérée de p95 et du débit par rapport à la référence (0.10 = 10 %%)")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def configure_environment(args, work_dir):
+    """Variables lues à l'import de l'application : à fixer avant d'importer app."""
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(work_dir, 'bench.db')}"
+    os.environ["FACE_INDEX_PATH"] = os.path.join(work_dir, "face_index.npz")
+    if not args.result_cache:
+        os.environ["FACE_RESULT_CACHE_SIZE"] = "0"
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    sys.path.insert(0, ML_SERVICE_DIR)
+
+
+def load_images(images_dir):
+    """Images par personne : {personne: [octets, ...]}."""
+    images = {}
+    for person in sorted(os.listdir(images_dir)):
+        person_dir = os.path.join(images_dir, person)
+        if not os.path.isdir(person_dir):
+            continue
+        files = sorted(f for f in os.listdir(person_dir) if f.lower().endswith((".png", ".jpg", ".jpeg")))
+        if files:
+            images[person] = [open(os.path.join(person_dir, f), "rb").read() for f in files]
+    return images
+
+def synthetic_encodings(count, rng):
+    # Vecteurs unitaires aléatoires : deux à deux à une distance ~1.4, au-delà de la tolérance
+    vectors = rng.standard_normal((count, 128)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+async def seed_gallery(size, rng):
+    """Vide la table puis y insère size encodages synthétiques (un modèle par utilisateur)."""
+    from sqlalchemy import delete, insert
+    from app.database import ENCODING_DTYPE, ENCODING_VERSION, FaceEncoding, engine, pack_embedding, run_startup_migrations
+
+    await run_startup_migrations()
+    async with engine.begin() as conn:
+        await conn.execute(delete(FaceEncoding))
+        for start in range(0, size, SEED_BATCH_SIZE):
+            encodings = synthetic_encodings(min(SEED_BATCH_SIZE, size - start), rng)
+            await conn.execute(insert(FaceEncoding), [
+                {
+                    "user_id": f"synthetic-{start + i}",
+                    "embedding": pack_embedding(encoding),
+                    "embedding_dtype": ENCODING_DTYPE,
+                    "embedding_version": ENCODING_VERSION,
+                }
+                for i, encoding in enumerate(encodings)
+            ])
+
+
+def summarize(latencies, errors, elapsed):
+    latencies_ms = np.asarray(latencies) * 1000
+    summary = {"requests": len(latencies), "errors": errors, "rps": len(latencies) / elapsed if elapsed else 0.0}
+    if len(latencies_ms):
+        summary["mean_ms"] = float(latencies_ms.mean())
+        for p, value in zip(PERCENTILES, np.percentile(latencies_ms, PERCENTILES)):
+            summary[f"p{p}_ms"] = float(value)
+    return summary
+
+async def run_load(client, make_request, total, concurrency):
+    """
+    total requêtes réparties sur concurrency tâches qui enchaînent les appels.
+    Une réponse 5xx ou une exception compte comme erreur.
+    """
+    latencies = []
+    errors = 0
+    counter = iter(range(total))
+
+    async def worker():
+        nonlocal errors
+        for i in counter:
+            start = time.perf_counter()
+            try:
+                response = await make_request(client, i)
+                failed = response.status_code >= 500
+            except Exception:
+                failed = True
+            latencies.append(time.perf_counter() - start)
+            errors += failed
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+def request_factories(images):
+    """Une fonction (client, i) -> réponse par endpoint, qui parcourt les images en boucle."""
+    people = sorted(images)
+    # (personne, image) : la première image de chaque personne sert de modèle enregistré
+    probes = [(person, image) for person in people for image in (images[person][1:] or images[person])]
+    all_images = [image for person in people for image in images[person]]
+
+    def register(client, i):
+        image = all_images[i % len(all_images)]
+        return client.post(f"/face/register/bench-register-{i % len(all_images)}", files={"image": ("image.jpg", image, "image/jpeg")})
+
+    def verify(client, i):
+        person, image = probes[i % len(probes)]
+        return client.post(f"/face/verify/bench-{person}", files={"image": ("image.jpg", image, "image/jpeg")})
+
+    def identify(client, i):
+        _, image = probes[i % len(probes)]
+        return client.post("/face/identify", files={"image": ("image.jpg", image, "image/jpeg")})
+
+    return {"register": register, "verify": verify, "identify": identify}
+
+async def bench_gallery(args, size, images, rng):
+    import httpx
+    from app.ann import FACE_INDEX_PATH
+    from app.cache import encoding_cache, extraction_cache
+    from app.main import app
+
+    await seed_gallery(size, rng)
+    encoding_cache.clear()
+    extraction_cache.clear()
+    # Instantané d'index d'une taille de galerie précédente
+    if os.path.exists(FACE_INDEX_PATH):
+        os.remove(FACE_INDEX_PATH)
+
+    results = []
+    transport = httpx.ASGITransport(app=app)
+    async with app.router.lifespan_context(app):
+        await app.state.warm_up_task
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Modèles des personnes du jeu d'images, pour /face/verify (hors mesure)
+            for person, person_images in images.items():
+                response = await client.post(f"/face/register/bench-{person}", files={"image": ("image.jpg", person_images[0], "image/jpeg")})
+                if response.status_code != 201:
+                    print(f"  enregistrement de {person} : {response.status_code}", file=sys.stderr)
+
+            factories = request_factories(images)
+            for endpoint in args.endpoints:
+                make_request = factories[endpoint]
+                # Quelques requêtes de chauffe (connexions, caches de modèles)
+                await run_load(client, make_request, min(args.requests, 10), 1)
+                for concurrency in args.concurrency:
+                    summary = await run_load(client, make_request, args.requests, concurrency)
+                    run = {"endpoint": endpoint, "gallery_size": size, "concurrency": concurrency, **summary}
+                    results.append(run)
+                    print(
+                        f"  {endpoint:<9} galerie={size:<7} c={concurrency:<3} "
+                        f"p50={run.get('p50_ms', 0):8.1f}ms p95={run.get('p95_ms', 0):8.1f}ms "
+                        f"p99={run.get('p99_ms', 0):8.1f}ms {run['rps']:7.1f} req/s erreurs={run['errors']}",
+                        file=sys.stderr,
+                    )
+    return results
+
+
+def result_key(run):
+    return run["endpoint"], run["gallery_size"], run["concurrency"]
+
+def compare(results, baseline, max_regression):
+    """
+    Compare p95 et le débit à la référence, pour chaque (endpoint, galerie, concurrence).
+    Retourne la liste des comparaisons ; regression=True au-delà de max_regression.
+    """
+    baseline_runs = {result_key(run): run for run in baseline["results"]}
+    comparisons = []
+    for run in results:
+        reference = baseline_runs.get(result_key(run))
+        if reference is None or "p95_ms" not in run or "p95_ms" not in reference:
+            continue
+        p95_change = run["p95_ms"] / reference["p95_ms"] - 1 if reference["p95_ms"] else 0.0
+        rps_change = run["rps"] / reference["rps"] - 1 if reference["rps"] else 0.0
+        comparisons.append({
+            "endpoint": run["endpoint"],
+            "gallery_size": run["gallery_size"],
+            "concurrency": run["concurrency"],
+            **{f"p{p}_change": run[f"p{p}_ms"] / reference[f"p{p}_ms"] - 1 for p in PERCENTILES if reference.get(f"p{p}_ms")},
+            "rps_change": rps_change,
+            "regression": p95_change > max_regression or rps_change < -max_regression,
+        })
+    return comparisons
+
+def print_comparison(comparisons):
+    print("\nComparaison à la référence (variation relative) :", file=sys.stderr)
+    for c in comparisons:
+        print(
+            f"  {c['endpoint']:<9} galerie={c['gallery_size']:<7} c={c['concurrency']:<3} "
+            f"p50={c.get('p50_change', 0):+7.1%} p95={c.get('p95_change', 0):+7.1%} "
+            f"p99={c.get('p99_change', 0):+7.1%} débit={c['rps_change']:+7.1%}"
+            + ("  RÉGRESSION" if c["regression"] else ""),
+            file=sys.stderr,
+        )
+
+
+async def run_benchmarks(args, images):
+    rng = np.random.default_rng(args.seed)
+    results = []
+    for size in args.gallery_sizes:
+        print(f"Galerie de {size} encodages...", file=sys.stderr)
+        results.extend(await bench_gallery(args, size, images, rng))
+    return results
+
+def main(argv=None):
+    args = parse_args(argv)
+    images = load_images(args.images)
+    if not images:
+        raise SystemExit(f"Aucune image trouvée dans {args.images} (un sous-dossier par personne).")
+    with tempfile.TemporaryDirectory(prefix="face_bench_") as work_dir:
+        configure_environment(args, work_dir)
+        results = asyncio.run(run_benchmarks(args, images))
+
+    from app.executor import FACE_EXECUTOR, FACE_WORKERS
+    report = {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpu_count": os.cpu_count(),
+            "face_executor": FACE_EXECUTOR,
+            "face_workers": FACE_WORKERS,
+            "result_cache": args.result_cache,
+            "requests": args.requests,
+            "images": sum(len(v) for v in images.values()),
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        report["comparison"] = compare(results, baseline, args.max_regression)
+        print_comparison(report["comparison"])
+        if any(c["regression"] for c in report["comparison"]):
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+# ml_service/evaluations/embedding_store.py
+# Stockage incrémental des embeddings du jeu d'évaluation : une matrice .npy
+# (lue en memory-map) et un index JSON chemin -> (taille, mtime, ligne).
+# Seules les images nouvelles ou modifiées sont encodées d'une exécution à l'autre.
+import json
+import os
+import numpy as np
+
+INDEX_FILE = "index.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+EMBEDDING_SIZE = 128
+
+
+def file_signature(path):
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns}
+
+
+class EmbeddingStore:
+    """
+    Embeddings par image, indexés par chemin relatif à root. Une entrée est à
+    recalculer si la taille ou la date de modification du fichier a changé.
+    Une image sans visage détecté est indexée avec la ligne -1.
+    """
+
+    def __init__(self, store_dir, root):
+        self.store_dir = store_dir
+        self.root = root
+        self.index = {}
+        self.embeddings = np.empty((0, EMBEDDING_SIZE))
+        self.load()
+
+    @property
+    def index_path(self):
+        return os.path.join(self.store_dir, INDEX_FILE)
+
+    @property
+    def embeddings_path(self):
+        return os.path.join(self.store_dir, EMBEDDINGS_FILE)
+
+    def key(self, path):
+        return os.path.relpath(path, self.root)
+
+    def load(self):
+        if not (os.path.exists(self.index_path) and os.path.exists(self.embeddings_path)):
+            return
+        with open(self.index_path) as f:
+            self.index = json.load(f)
+        self.embeddings = np.load(self.embeddings_path, mmap_mode="r")
+
+    def stale_paths(self, image_paths):
+        """Images absentes de l'index ou modifiées depuis leur encodage."""
+        stale = []
+        for path in image_paths:
+            entry = self.index.get(self.key(path))
+            signature = file_signature(path)
+            if entry is None or entry["size"] != signature["size"] or entry["mtime"] != signature["mtime"]:
+                stale.append(path)
+        return stale
+
+    def update(self, image_paths, compute_embeddings):
+        """
+        Encode les images nouvelles ou modifiées avec compute_embeddings
+        (liste de chemins -> dict chemin -> embedding ou None) et retire de
+        l'index les images qui ne sont plus dans image_paths.
+        Retourne le nombre d'images encodées.
+        """
+        stale = self.stale_paths(image_paths)
+        keys = {self.key(path) for path in image_paths}
+        removed = [key for key in self.index if key not in keys]
+        if not stale and not removed:
+            return 0
+
+        computed = compute_embeddings(stale) if stale else {}
+        stale_keys = {self.key(path) for path in stale}
+
+        # Réécriture compacte : lignes conservées, puis nouveaux embeddings
+        rows = []
+        index = {}
+        for key, entry in self.index.items():
+            if key in stale_keys or key not in keys:
+                continue
+            row = -1
+            if entry["row"] >= 0:
+                row = len(rows)
+                rows.append(self.embeddings[entry["row"]])
+            index[key] = {**entry, "row": row}
+        for path in stale:
+            encoding = computed.get(path)
+            row = -1
+            if encoding is not None:
+                row = len(rows)
+                rows.append(encoding)
+            index[self.key(path)] = {**file_signature(path), "row": row}
+
+        embeddings = np.array(rows, dtype=np.float64).reshape(-1, EMBEDDING_SIZE)
+        self.save(index, embeddings)
+        return len(stale)
+
+    def save(self, index, embeddings):
+        os.makedirs(self.store_dir, exist_ok=True)
+        # Écriture dans des fichiers temporaires puis remplacement atomique
+        self.embeddings = None
+        tmp_embeddings = self.embeddings_path + ".tmp.npy"
+        tmp_index = self.index_path + ".tmp"
+        np.save(tmp_embeddings, embeddings)
+        with open(tmp_index, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_embeddings, self.embeddings_path)
+        os.replace(tmp_index, self.index_path)
+        self.load()
+
+    def get(self, path):
+        """Embedding de l'image, ou None si aucun visage n'a été détecté ou si elle n'est pas indexée."""
+        entry = self.index.get(self.key(path))
+        if entry is None or entry["row"] < 0:
+            return None
+        return np.asarray(self.embeddings[entry["row"]])
+
+    def __len__(self):
+        return len(self.index)
@@ -1,10 +1,15 @@
 import os
+import sys
 import random
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
-import matplotlib as plt
-from sklearn.metrics import accuracy_score, confusion_matrix, classification_report
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+from sklearn.metrics import accuracy_score, confusion_matrix, classification_report, roc_curve, auc
 from itertools import combinations
 import face_recognition
 import mlflow
@@ -12,11 +17,24 @@ import mlflow
 script_dir = os.path.dirname(os.path.abspath(__file__))
 dataset_face = os.path.join(script_dir, "img_tests")
 
-# Création de l'experiment dans mlflow
-mlflow.set_experiment("brief17_face_verification")
+# Même prétraitement que l'API (détection sur image réduite, encodage pleine résolution)
+sys.path.insert(0, os.path.dirname(script_dir))
+from app.face_processing import FACE_DETECTION_MAX_SIDE, detect_and_encode
+from embedding_store import EmbeddingStore
 
-PKL_FILE = "df_face_recognition.pkl" 
 TOLERANCE_SEUIL = 0.6
+# Grille de seuils balayée pour la courbe ROC, l'EER et le meilleur F1
+THRESHOLD_GRID = np.round(np.arange(0.30, 0.80 + 1e-9, 0.01), 2)
+# Plus grand côté pour la détection : la valeur du service (FACE_DETECTION_MAX_SIDE),
+# pour mesurer les seuils dans les conditions de production.
+# Comparer FACE_DETECTION_MAX_SIDE=0 et 640 (no_face_rate, seuils) avant d'activer la réduction dans le service
+DETECTION_MAX_SIDE = FACE_DETECTION_MAX_SIDE
+# Embeddings par image, conservés entre les exécutions (un stockage par taille de détection)
+STORE_DIR = os.path.join(
+    script_dir, f"embeddings_{DETECTION_MAX_SIDE}" if DETECTION_MAX_SIDE else "embeddings"
+)
+# Processus utilisés pour le calcul des embeddings
+EMBEDDING_WORKERS = int(os.getenv("EMBEDDING_WORKERS", os.cpu_count() or 1))
 
 
 def index_face_dataset(root_dir):
@@ -98,142 +116,246 @@ def generate_test_pairs(face_dict, num_pairs=600):
 
     return df_pairs
 
-def add_face_embeddings(df):
-    embeddings1 = []
-    embeddings2 = []
+def encode_image(image_path):
+    """Encodage du premier visage de l'image, ou None si aucun visage n'est détecté."""
+    image = face_recognition.load_image_file(image_path)
+    _, encodings = detect_and_encode(image, max_side=DETECTION_MAX_SIDE)
+    return encodings[0] if encodings else None
 
-    print("Calcul des embeddings en cours...")
-    for idx, row in df.iterrows():
-        # Chargement des images
-        img1 = face_recognition.load_image_file(row["img1"])
-        img2 = face_recognition.load_image_file(row["img2"])
-
-        # Extraction des encodings
-        encod1 = face_recognition.face_encodings(img1)
-        encod2 = face_recognition.face_encodings(img2)
-
-        # Si aucun visage n'est détecté, on met None
-        embeddings1.append(encod1[0] if encod1 else None)
-        embeddings2.append(encod2[0] if encod2 else None)
-
-    # Ajouter des colonnes au Dataframe
-    df["embedding1"] = embeddings1
-    df["embedding2"] = embeddings2
+def compute_embeddings(image_paths, workers=EMBEDDING_WORKERS):
+    """
+    Encode chaque image une seule fois, en parallèle sur un pool de processus.
+    Retourne un dictionnaire chemin -> embedding (ou None).
+    """
+    embeddings = {}
+    total = len(image_paths)
+    chunksize = max(1, total // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        for done, (path, encoding) in enumerate(
+            zip(image_paths, pool.map(encode_image, image_paths, chunksize=chunksize)), start=1
+        ):
+            embeddings[path] = encoding
+            if done % 50 == 0 or done == total:
+                print(f"\r  {done}/{total} images encodées", end="", flush=True)
+    print()
+    return embeddings
+
+def update_embedding_store(store, face_dict):
+    """Encode uniquement les images nouvelles ou modifiées du jeu de données."""
+    image_paths = [path for images in face_dict.values() for path in images]
+    stale = store.stale_paths(image_paths)
+    print(f"Embeddings : {len(image_paths) - len(stale)} images à jour, {len(stale)} à calculer ({EMBEDDING_WORKERS} processus)...")
+    store.update(image_paths, compute_embeddings)
     print("Calcul des embeddings terminé.")
 
+def add_face_embeddings(df, store):
+    # Ajouter des colonnes au Dataframe à partir du stockage (une lecture par image)
+    image_paths = pd.unique(pd.concat([df["img1"], df["img2"]]))
+    embeddings = {path: store.get(path) for path in image_paths}
+    df["embedding1"] = df["img1"].map(embeddings)
+    df["embedding2"] = df["img2"].map(embeddings)
     return df
 
+def pair_distances(df):
+    """
+    Distances euclidiennes entre embeddings, calculées en une fois pour toutes
+    les paires valides (visage détecté sur les deux images).
+    Retourne (valid_df, distances, labels).
+    """
+    valid_mask = df["embedding1"].notnull() & df["embedding2"].notnull()
+    valid_df = df[valid_mask].copy()
+    if valid_df.empty:
+        return valid_df, np.empty(0), np.empty(0, dtype=bool)
+    embeddings1 = np.stack(valid_df["embedding1"].to_numpy())
+    embeddings2 = np.stack(valid_df["embedding2"].to_numpy())
+    distances = np.linalg.norm(embeddings1 - embeddings2, axis=1)
+    valid_df["distance"] = distances
+    return valid_df, distances, valid_df["match"].to_numpy(dtype=bool)
+
+def threshold_sweep(distances, labels, thresholds=THRESHOLD_GRID):
+    """
+    Matrice de confusion pour chaque seuil de la grille (match si distance <= seuil),
+    calculée d'un bloc par diffusion NumPy. Retourne un DataFrame par seuil.
+    """
+    predicted = distances[None, :] <= thresholds[:, None]
+    tp = (predicted & labels).sum(axis=1)
+    fp = (predicted & ~labels).sum(axis=1)
+    fn = (~predicted & labels).sum(axis=1)
+    tn = (~predicted & ~labels).sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.nan_to_num(tp / (tp + fp))
+        recall = np.nan_to_num(tp / (tp + fn))
+        fpr = np.nan_to_num(fp / (fp + tn))
+        f1 = np.nan_to_num(2 * precision * recall / (precision + recall))
+    return pd.DataFrame({
+        "threshold": thresholds,
+        "tp": tp, "fp": fp, "fn": fn, "tn": tn,
+        "accuracy": (tp + tn) / len(labels),
+        "precision": precision,
+        "recall": recall,
+        "fpr": fpr,
+        "f1": f1,
+    })
+
+def roc_metrics(distances, labels):
+    """
+    Courbe ROC (score = -distance), AUC et taux d'égale erreur (EER, où FPR = FNR).
+    Retourne (fpr, tpr, seuils en distance, auc, eer, seuil de l'EER).
+    """
+    fpr, tpr, score_thresholds = roc_curve(labels, -distances)
+    thresholds = -score_thresholds
+    fnr = 1 - tpr
+    eer_index = np.argmin(np.abs(fnr - fpr))
+    eer = (fpr[eer_index] + fnr[eer_index]) / 2
+    return fpr, tpr, thresholds, auc(fpr, tpr), eer, thresholds[eer_index]
+
 def calculate_accuracy(df, tolerance_seuil):
-    # Créer une copie du DataFrame pour éviter le SettingWithCopyWarning
-    df_temp = df.copy() 
-    
     print("=============================Calcul de la similarité et de l'accuracy...=============================")
-    df_temp["predicted_match"] = df_temp.apply(
-        lambda row: face_recognition.compare_faces(
-            [row["embedding1"]], row["embedding2"], tolerance=tolerance_seuil
-        )[0] if row["embedding1"] is not None and row["embedding2"] is not None else None,
-        axis=1
-    )
-
-    valid_df_view = df_temp[df_temp["predicted_match"].notnull()]
-    valid_df = valid_df_view.copy() 
-    valid_df["predicted_match"] = valid_df["predicted_match"].astype(bool)
-    
+    valid_df, distances, labels = pair_distances(df)
+
     # S'assurer qu'il y a des données valides pour le calcul
     if valid_df.empty:
          print("Aucune paire valide pour le calcul de l'accuracy (visages non détectés).")
          return 0, pd.DataFrame() # Retourne 0 et un DataFrame vide
-         
-    accuracy = accuracy_score(valid_df["match"], valid_df["predicted_match"])
+
+    # Même règle que face_recognition.compare_faces
+    valid_df["predicted_match"] = distances <= tolerance_seuil
+    accuracy = accuracy_score(labels, valid_df["predicted_match"])
     print(f"\nAccuracy: {accuracy:.2%}")
     return accuracy, valid_df
 
+def log_threshold_analysis(valid_df):
+    """Balayage des seuils, ROC, AUC, EER et meilleur F1, enregistrés dans le run mlflow courant."""
+    distances = valid_df["distance"].to_numpy()
+    labels = valid_df["match"].to_numpy(dtype=bool)
+
+    mlflow.log_param("threshold_grid", f"{THRESHOLD_GRID[0]}-{THRESHOLD_GRID[-1]}")
+    sweep = threshold_sweep(distances, labels)
+    best = sweep.loc[sweep["f1"].idxmax()]
+    sweep.to_csv("threshold_sweep.csv", index=False)
+    mlflow.log_artifact("threshold_sweep.csv")
+    mlflow.log_metric("best_f1", float(best["f1"]))
+    mlflow.log_metric("best_f1_threshold", float(best["threshold"]))
+    mlflow.log_metric("best_f1_accuracy", float(best["accuracy"]))
+    print(f"Meilleur F1 : {best['f1']:.4f} au seuil {best['threshold']:.2f} (accuracy {best['accuracy']:.2%})")
+
+    # Les deux classes sont nécessaires pour la courbe ROC
+    if labels.all() or not labels.any():
+        print("Une seule classe parmi les paires valides : ROC et EER non calculés.")
+        return
+    fpr, tpr, _, roc_auc, eer, eer_threshold = roc_metrics(distances, labels)
+    mlflow.log_metric("roc_auc", float(roc_auc))
+    mlflow.log_metric("eer", float(eer))
+    mlflow.log_metric("eer_threshold", float(eer_threshold))
+    print(f"AUC : {roc_auc:.4f} - EER : {eer:.2%} au seuil {eer_threshold:.3f}")
+
+    fig, ax = plt.subplots(figsize=(5, 5))
+    ax.plot(fpr, tpr, label=f"AUC = {roc_auc:.3f}")
+    ax.plot([0, 1], [0, 1], linestyle="--", color="grey")
+    ax.scatter([eer], [1 - eer], color="red", label=f"EER = {eer:.2%}")
+    ax.set_xlabel("Taux de faux positifs")
+    ax.set_ylabel("Taux de vrais positifs")
+    ax.set_title("Courbe ROC")
+    ax.legend(loc="lower right")
+    mlflow.log_figure(fig, "roc_curve.png")
+    plt.close(fig)
+
 
 # ============================== PARTIE PRINCIPALE ==============================
 
-# Vérifier si le fichier .pkl existe
-if os.path.exists(PKL_FILE):
-    print(f"Fichier PICK_FILE trouvé.")
-    df_face_recognition = pd.read_pickle(PKL_FILE)
-    print("Chargement terminé.")
-else:
-    print("Fichier .pkl non trouvé. Création et calcul des embeddings en cours...")
+def main():
+    # Création de l'experiment dans mlflow
+    mlflow.set_experiment("brief17_face_verification")
+
     # 1. Indexer les images
     dict_face = index_face_dataset(dataset_face)
     print(f"Nombre de personnes indexées : {len(dict_face)}")
-    
-    # 2. Générer les paires de test
-    df_test = generate_test_pairs(dict_face)
-    print(f"Nombre de paires générées : {len(df_test)}")
-    
-    # 3. Ajouter les embeddings
-    df_face_recognition = add_face_embeddings(df_test)
-    
-    # 4. Sauvegarder le DataFrame
-    df_face_recognition.to_pickle(PKL_FILE)
-    print(f"DataFrame sauvegardé dans {PKL_FILE}.")
 
-# ============================== PARAMÈTRES ET EXÉCUTION ==============================
+    # 2. Mettre à jour les embeddings (seules les images nouvelles ou modifiées sont encodées)
+    store = EmbeddingStore(STORE_DIR, dataset_face)
+    update_embedding_store(store, dict_face)
 
-with mlflow.start_run(run_name=f"Tolerance_{TOLERANCE_SEUIL}"):
-
-    mlflow.log_param("tolerance", TOLERANCE_SEUIL)
-    mlflow.log_param("dataset_size_pairs", len(df_face_recognition))
-
-    # ============================== CALCUL DE L'ACCURACY ==============================
-
-    accuracy, valid_df = calculate_accuracy(df_face_recognition, TOLERANCE_SEUIL)
+    # 3. Générer les paires de test, indépendamment du calcul des embeddings
+    df_test = generate_test_pairs(dict_face)
+    print(f"Nombre de paires générées : {len(df_test)}")
 
-    # Afficher les résultats si des données valides existent
-    if not valid_df.empty:
-        print("\n=============================ENREGISTREMENT DES MÉTRIQUES======================================")
-        report_dict = classification_report(
-            valid_df["match"],
-            valid_df["predicted_match"],
-            labels=[True, False],
-            target_names=['Match', 'Non-Match'],
-            output_dict=True
-        )
-        print(report_dict)
-        mlflow.log_metric("precision_match", report_dict['Match']['precision'])
-        mlflow.log_metric("recall_match", report_dict['Match']['recall'])
-        mlflow.log_metric("f1_match", report_dict['Match']['f1-score'])
-
-        # Enregistrement du F1-score pondéré comme métrique globale
-        mlflow.log_metric("f1_weighted_avg", report_dict['weighted avg']['f1-score'])
-
-        # Affichage du rapport (version texte pour la console)
-        print("\n=============================RAPPORT DE CLASSIFICATION======================================")
-        print(classification_report(
-            valid_df["match"],
-            valid_df["predicted_match"],
-            labels=[True, False],
-            target_names=['Match (True)', 'Non-Match (False)']
-        ))
-
-        with open("classification_report.json", "w") as f:
-            json.dump(report_dict, f, indent=4)
-        mlflow.log_artifact("classification_report.json")
-
-        print("\n=============================MATRICE DE CONFUSION======================================")
-        # Calcule et affiche la matrice de confusion
-        conf_matrix = confusion_matrix(
-            valid_df["match"], 
-            valid_df["predicted_match"], 
-            labels=[True, False] # Pour avoir Match/Non-Match dans cet ordre
-        )
-        # Renomme les axes pour l'affichage
-        conf_matrix_df = pd.DataFrame(
-            conf_matrix, 
-            index=['True Positives (TP)', 'False Negatives (FN)'], 
-            columns=['False Positives (FP)', 'True Negatives (TN']
-        )
-        conf_matrix_df.to_csv("confusion_matrix.csv")
-        mlflow.log_artifact("confusion_matrix.csv")
-        print(conf_matrix_df)
-        
-        # Interprétation de la matrice:
-        # True Positives (TP) - Correctement identifiés comme la même personne.
-        # False Negatives (FN) - Manqués (Type II Error).
-        # False Positives (FP) - Fausses alarmes (Type I Error).
-        # True Negatives (TN) - Correctement identifiés comme des personnes différentes.
\ No newline at end of file
+    # 4. Ajouter les embeddings
+    df_face_recognition = add_face_embeddings(df_test, store)
+
+    # ============================== PARAMÈTRES ET EXÉCUTION ==============================
+
+    with mlflow.start_run(run_name=f"Tolerance_{TOLERANCE_SEUIL}"):
+
+        mlflow.log_param("tolerance", TOLERANCE_SEUIL)
+        mlflow.log_param("detection_max_side", DETECTION_MAX_SIDE)
+        # Images sans visage détecté : une réduction trop forte fait passer les visages sous la taille minimale du HOG
+        no_face = sum(1 for entry in store.index.values() if entry["row"] < 0)
+        mlflow.log_metric("no_face_rate", no_face / len(store) if len(store) else 0.0)
+        mlflow.log_param("dataset_size_pairs", len(df_face_recognition))
+
+        # ============================== CALCUL DE L'ACCURACY ==============================
+
+        accuracy, valid_df = calculate_accuracy(df_face_recognition, TOLERANCE_SEUIL)
+
+        # Afficher les résultats si des données valides existent
+        if not valid_df.empty:
+            print("\n=============================ENREGISTREMENT DES MÉTRIQUES======================================")
+            report_dict = classification_report(
+                valid_df["match"],
+                valid_df["predicted_match"],
+                labels=[True, False],
+                target_names=['Match', 'Non-Match'],
+                output_dict=True
+            )
+            print(report_dict)
+            mlflow.log_metric("precision_match", report_dict['Match']['precision'])
+            mlflow.log_metric("recall_match", report_dict['Match']['recall'])
+            mlflow.log_metric("f1_match", report_dict['Match']['f1-score'])
+
+            # Enregistrement du F1-score pondéré comme métrique globale
+            mlflow.log_metric("f1_weighted_avg", report_dict['weighted avg']['f1-score'])
+
+            # Balayage des seuils sur les distances déjà calculées, dans le même run
+            print("\n=============================BALAYAGE DES SEUILS======================================")
+            log_threshold_analysis(valid_df)
+
+            # Affichage du rapport (version texte pour la console)
+            print("\n=============================RAPPORT DE CLASSIFICATION======================================")
+            print(classification_report(
+                valid_df["match"],
+                valid_df["predicted_match"],
+                labels=[True, False],
+                target_names=['Match (True)', 'Non-Match (False)']
+            ))
+
+            with open("classification_report.json", "w") as f:
+                json.dump(report_dict, f, indent=4)
+            mlflow.log_artifact("classification_report.json")
+
+            print("\n=============================MATRICE DE CONFUSION======================================")
+            # Calcule et affiche la matrice de confusion
+            conf_matrix = confusion_matrix(
+                valid_df["match"], 
+                valid_df["predicted_match"], 
+                labels=[True, False] # Pour avoir Match/Non-Match dans cet ordre
+            )
+            # Renomme les axes pour l'affichage
+            conf_matrix_df = pd.DataFrame(
+                conf_matrix, 
+                index=['True Positives (TP)', 'False Negatives (FN)'], 
+                columns=['False Positives (FP)', 'True Negatives (TN']
+            )
+            conf_matrix_df.to_csv("confusion_matrix.csv")
+            mlflow.log_artifact("confusion_matrix.csv")
+            print(conf_matrix_df)
+
+            # Interprétation de la matrice:
+            # True Positives (TP) - Correctement identifiés comme la même personne.
+            # False Negatives (FN) - Manqués (Type II Error).
+            # False Positives (FP) - Fausses alarmes (Type I Error).
+            # True Negatives (TN) - Correctement identifiés comme des personnes différentes.
+
+
+# Garde nécessaire : les workers du pool (spawn) réimportent ce module
+if __name__ == "__main__":
+    main()
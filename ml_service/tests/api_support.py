@@ -0,0 +1,55 @@
+# ml_service/tests/api_support.py
+# Outils communs aux tests de l'API : images synthétiques pour le
+# face_recognition simulé (la couleur fait l'identité) et application
+# démarrée dans le processus (httpx + ASGITransport).
+import asyncio
+
+import cv2
+import httpx
+import numpy as np
+from sqlalchemy import delete
+
+from app.cache import encoding_cache, extraction_cache
+from app.database import FaceEncoding, engine, run_startup_migrations
+from app.main import app
+
+ALICE = (200, 100, 50)
+BOB = (10, 100, 250)
+
+
+def image(*colors, size=(200, 300)):
+    """Image unie (un visage) ; plusieurs couleurs côte à côte : un visage par couleur."""
+    height, width = size
+    if len(colors) > 1:
+        width = max(width, 2 * height + 1)
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    for i, color in enumerate(colors):
+        pixels[:, i * width // len(colors):(i + 1) * width // len(colors)] = color
+    return pixels
+
+def jpeg(*colors, size=(200, 300)):
+    return cv2.imencode(".jpg", image(*colors, size=size))[1].tobytes()
+
+def upload(data, name="image"):
+    return {name: ("image.jpg", data, "image/jpeg")}
+
+def run_api(scenario):
+    """Démarre l'application (migrations, galerie, workers) et exécute scenario(client)."""
+    async def run():
+        async with app.router.lifespan_context(app):
+            await app.state.warm_up_task
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await scenario(client)
+    return asyncio.run(run())
+
+def reset_database():
+    """Table des modèles vide et caches vidés ; la galerie est rechargée au démarrage suivant."""
+    async def reset():
+        await run_startup_migrations()
+        async with engine.begin() as conn:
+            await conn.execute(delete(FaceEncoding))
+        await engine.dispose()
+
+    asyncio.run(reset())
+    encoding_cache.clear()
+    extraction_cache.clear()
@@ -0,0 +1,39 @@
+# ml_service/tests/conftest.py
+# Variables lues à l'import de l'application : à fixer avant d'importer app.
+#
+#   cd ml_service
+#   python -m pytest -q tests
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+ML_SERVICE_DIR = os.path.dirname(TESTS_DIR)
+WORK_DIR = tempfile.mkdtemp(prefix="ml_service_tests_")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORK_DIR, 'tests.db')}"
+os.environ["FACE_INDEX_PATH"] = os.path.join(WORK_DIR, "face_index.npz")
+# Workers en threads : le face_recognition simulé de tests/stubs reste visible
+# (un worker spawn réimporterait le vrai module)
+os.environ["FACE_EXECUTOR"] = "thread"
+os.environ["FACE_WORKERS"] = "2"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+sys.path.insert(0, ML_SERVICE_DIR)
+# Le pipeline d'évaluation importe embedding_store comme un module de premier niveau
+sys.path.insert(0, os.path.join(ML_SERVICE_DIR, "evaluations"))
+# Toujours le module simulé, même si face_recognition est installé : résultats déterministes
+sys.path.insert(0, os.path.join(TESTS_DIR, "stubs"))
+
+
+@pytest.fixture
+def empty_database():
+    from api_support import reset_database
+
+    reset_database()
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
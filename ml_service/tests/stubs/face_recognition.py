@@ -0,0 +1,30 @@
+# ml_service/tests/stubs/face_recognition.py
+# Remplaçant de face_recognition pour les tests (sans dlib ni modèles) :
+# une image sombre n'a aucun visage, une image plus de deux fois plus large
+# que haute en a deux (moitiés gauche et droite), sinon un visage centré.
+# L'encodage est la couleur moyenne de la boîte, répétée sur 128 valeurs.
+import numpy as np
+
+
+def face_locations(img, number_of_times_to_upsample=1, model="hog"):
+    height, width = img.shape[:2]
+    if img.mean() < 5:
+        return []
+    if width > 2 * height:
+        return [
+            (height // 4, width // 2 - 10, 3 * height // 4, 10),
+            (height // 4, width - 10, 3 * height // 4, width // 2 + 10),
+        ]
+    return [(height // 4, 3 * width // 4, 3 * height // 4, width // 4)]
+
+def face_encodings(img, known_face_locations=None, num_jitters=1, model="small"):
+    locations = known_face_locations or face_locations(img)
+    return [
+        np.resize(img[top:bottom, left:right].astype(np.float64).mean(axis=(0, 1)), 128) / 255.0
+        for top, right, bottom, left in locations
+    ]
+
+def load_image_file(file, mode="RGB"):
+    import cv2
+
+    return cv2.imread(file)[:, :, ::-1]
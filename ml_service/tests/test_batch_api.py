@@ -0,0 +1,60 @@
+# ml_service/tests/test_batch_api.py
+import pytest
+
+from api_support import ALICE, BOB, jpeg, run_api, upload
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+NO_FACE = jpeg((0, 0, 0))
+UNREADABLE = b"pas une image"
+
+
+def images(*datas):
+    return [("images", (f"{i}.jpg", data, "image/jpeg")) for i, data in enumerate(datas)]
+
+async def register_alice_and_bob(client):
+    await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+    await client.post("/face/register/bob", files=upload(jpeg(BOB)))
+
+
+def test_verify_batch_keeps_request_order_with_per_item_errors():
+    async def scenario(client):
+        await register_alice_and_bob(client)
+        return await client.post(
+            "/face/verify/batch",
+            data={"user_ids": ["bob", "alice", "nobody", "alice", "bob", "alice"]},
+            files=images(jpeg(BOB), jpeg(BOB), jpeg(ALICE), UNREADABLE, NO_FACE, jpeg(ALICE)),
+        )
+
+    response = run_api(scenario)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["user_id"] for r in results] == ["bob", "alice", "nobody", "alice", "bob", "alice"]
+    assert [r["status"] for r in results] == ["success", "success", "failure", "error", "failure", "success"]
+    assert [r["match"] for r in results] == [True, False, False, False, False, True]
+    assert results[2]["message"] == "Utilisateur non trouvé."
+    assert results[4]["message"] == "Aucun visage détecté."
+
+def test_verify_batch_requires_one_user_id_per_image():
+    async def scenario(client):
+        return await client.post("/face/verify/batch", data={"user_ids": ["alice"]}, files=images(jpeg(ALICE), jpeg(BOB)))
+
+    assert run_api(scenario).status_code == 400
+
+def test_identify_batch_keeps_request_order_with_per_item_errors():
+    async def scenario(client):
+        await register_alice_and_bob(client)
+        return await client.post(
+            "/face/identify/batch",
+            files=images(jpeg(BOB), UNREADABLE, NO_FACE, jpeg(ALICE, BOB), jpeg(ALICE)),
+        )
+
+    response = run_api(scenario)
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["status"] for r in results] == ["success", "error", "failure", "success", "success"]
+    assert [r["user_id"] for r in results[:3] + results[4:]] == ["bob", None, None, "alice"]
+    # Les visages d'une image multi-visages restent rattachés à leur image
+    assert [face["user_id"] for face in results[3]["faces"]] == ["alice", "bob"]
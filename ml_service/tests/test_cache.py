@@ -0,0 +1,50 @@
+# ml_service/tests/test_cache.py
+import asyncio
+
+import numpy as np
+
+from app.cache import LRUCache, encoding_cache
+from app.database import FaceEncoding
+from app.routes.face_api import load_known_encodings
+
+
+class ScalarResult:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+class RegisterDuringQuerySession:
+    """Session dont la requête lit les anciens modèles pendant qu'un enregistrement est validé."""
+
+    def __init__(self, user_id, stale_encoding):
+        self.user_id = user_id
+        self.stale_encoding = stale_encoding
+
+    async def scalars(self, statement):
+        encoding_cache.invalidate(self.user_id)
+        return ScalarResult([FaceEncoding.from_array(self.user_id, self.stale_encoding)])
+
+
+def test_set_with_generation_is_skipped_after_invalidate():
+    cache = LRUCache(maxsize=10)
+    generation = cache.generation("alice")
+    cache.invalidate("alice")
+
+    cache.set("alice", "périmé", generation)
+    assert cache.get("alice") is None
+
+    cache.set("alice", "frais", cache.generation("alice"))
+    assert cache.get("alice") == "frais"
+
+def test_stale_templates_are_not_cached_when_register_commits_during_query():
+    encoding_cache.clear()
+    stale = np.ones(128, dtype=np.float32)
+
+    known = asyncio.run(load_known_encodings(RegisterDuringQuerySession("alice", stale), ["alice"]))
+
+    # La requête en cours utilise ce qu'elle a lu, mais le cache ne le garde pas
+    np.testing.assert_array_equal(known["alice"], stale[None, :])
+    assert encoding_cache.get("alice") is None
@@ -0,0 +1,77 @@
+# ml_service/tests/test_database.py
+import json
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.orm import Session
+
+from app.database import (
+    ENCODING_DTYPE, ENCODING_VERSION, FaceEncoding, migrate_encodings, migrate_templates, pack_embedding,
+    unpack_embedding,
+)
+
+
+def create_legacy_table(engine, encodings):
+    # Schéma d'origine : user_id clé primaire, un encodage JSON par utilisateur
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE face_encodings (user_id VARCHAR NOT NULL PRIMARY KEY, encoding JSON NOT NULL)"
+        ))
+        conn.execute(
+            text("INSERT INTO face_encodings (user_id, encoding) VALUES (:user_id, :encoding)"),
+            [{"user_id": user_id, "encoding": json.dumps(encoding.tolist())} for user_id, encoding in encodings.items()],
+        )
+
+def migrate(engine):
+    with engine.begin() as conn:
+        return migrate_templates(conn), migrate_encodings(conn, batch_size=2)
+
+
+def test_legacy_json_table_is_migrated_to_binary_templates(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    rng = np.random.default_rng(0)
+    encodings = {f"user-{i}": rng.standard_normal(128) for i in range(5)}
+    create_legacy_table(engine, encodings)
+
+    assert migrate(engine) == (True, 5)
+
+    columns = {c["name"] for c in inspect(engine).get_columns("face_encodings")}
+    assert {"id", "created_at", "embedding", "embedding_dtype", "embedding_version"} <= columns
+    with Session(engine) as db:
+        rows = db.query(FaceEncoding).order_by(FaceEncoding.user_id).all()
+        assert [row.user_id for row in rows] == sorted(encodings)
+        assert len({row.id for row in rows}) == len(rows)
+        for row in rows:
+            assert row.encoding is None
+            assert (row.embedding_dtype, row.embedding_version) == (ENCODING_DTYPE, ENCODING_VERSION)
+            np.testing.assert_allclose(row.to_array(), encodings[row.user_id], rtol=1e-6)
+        # Plusieurs modèles par utilisateur possibles après migration
+        db.add(FaceEncoding.from_array("user-0", encodings["user-0"]))
+        db.commit()
+    engine.dispose()
+
+def test_migrations_are_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    create_legacy_table(engine, {"alice": np.ones(128)})
+    migrate(engine)
+    with Session(engine) as db:
+        before = [(row.id, row.embedding) for row in db.query(FaceEncoding)]
+
+    assert migrate(engine) == (False, 0)
+
+    with Session(engine) as db:
+        assert [(row.id, row.embedding) for row in db.query(FaceEncoding)] == before
+    engine.dispose()
+
+@pytest.mark.parametrize("dtype, size", [("<f4", 512), ("<f8", 1024)])
+def test_embeddings_are_packed_as_little_endian_bytes(dtype, size):
+    encoding = np.random.default_rng(1).standard_normal(128)
+
+    data = pack_embedding(encoding, dtype)
+
+    assert len(data) == size
+    assert data[:np.dtype(dtype).itemsize] == np.asarray(encoding[0], dtype=dtype).tobytes()
+    np.testing.assert_array_equal(unpack_embedding(data, dtype), encoding.astype(dtype))
+    row = FaceEncoding(user_id="alice", embedding=data, embedding_dtype=dtype)
+    assert row.to_array().dtype == np.dtype(dtype)
@@ -0,0 +1,69 @@
+# ml_service/tests/test_embedding_store.py
+import os
+
+import numpy as np
+
+from evaluations.embedding_store import EmbeddingStore
+
+
+class FakeEncoder:
+    """compute_embeddings simulé : encodage = taille du fichier, None pour un fichier vide."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, paths):
+        self.calls.append(sorted(os.path.basename(path) for path in paths))
+        return {path: np.full(128, os.path.getsize(path), dtype=np.float64) if os.path.getsize(path) else None for path in paths}
+
+
+def write(path, size, mtime=None):
+    path.write_bytes(b"x" * size)
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+    return str(path)
+
+
+def test_only_new_or_modified_images_are_encoded(tmp_path):
+    root = tmp_path / "images"
+    root.mkdir()
+    a = write(root / "a.jpg", 3)
+    b = write(root / "b.jpg", 5)
+    empty = write(root / "empty.jpg", 0)
+    encoder = FakeEncoder()
+    store = EmbeddingStore(str(tmp_path / "store"), str(root))
+
+    assert store.update([a, b, empty], encoder) == 3
+    assert store.get(a)[0] == 3
+    assert store.get(empty) is None
+
+    # Rechargé depuis le disque : rien à recalculer
+    reloaded = EmbeddingStore(str(tmp_path / "store"), str(root))
+    assert reloaded.update([a, b, empty], encoder) == 0
+    assert len(encoder.calls) == 1
+
+    # Taille modifiée, date modifiée, nouvelle image
+    write(root / "a.jpg", 7)
+    stat = os.stat(b)
+    os.utime(b, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    c = write(root / "c.jpg", 2)
+    assert reloaded.update([a, b, empty, c], encoder) == 3
+    assert encoder.calls[-1] == ["a.jpg", "b.jpg", "c.jpg"]
+    assert [reloaded.get(path)[0] for path in (a, b, c)] == [7, 5, 2]
+    assert reloaded.get(empty) is None
+
+def test_removed_images_are_dropped_and_rows_compacted(tmp_path):
+    root = tmp_path / "images"
+    root.mkdir()
+    paths = [write(root / f"{i}.jpg", i + 1) for i in range(4)]
+    encoder = FakeEncoder()
+    store = EmbeddingStore(str(tmp_path / "store"), str(root))
+    store.update(paths, encoder)
+
+    assert store.update(paths[1:3], encoder) == 0
+    assert len(encoder.calls) == 1
+    assert len(store) == 2
+    assert store.embeddings.shape == (2, 128)
+    assert [store.get(path)[0] for path in paths[1:3]] == [2, 3]
+    assert store.get(paths[0]) is None
+    assert sorted(EmbeddingStore(str(tmp_path / "store"), str(root)).index) == ["1.jpg", "2.jpg"]
@@ -0,0 +1,58 @@
+# ml_service/tests/test_evaluation_embeddings.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from api_support import ALICE, BOB, jpeg
+from evaluations.embedding_store import EmbeddingStore
+
+pytest.importorskip("mlflow")
+pipeline = pytest.importorskip("face_recognition_pipeline")
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Deux personnes, une image sans visage ; une image par fichier."""
+    root = tmp_path / "img_tests"
+    faces = {"alice": [ALICE, ALICE, (0, 0, 0)], "bob": [BOB]}
+    dataset = {}
+    for person, colors in faces.items():
+        (root / person).mkdir(parents=True)
+        dataset[person] = []
+        for i, color in enumerate(colors):
+            path = root / person / f"{i}.jpg"
+            path.write_bytes(jpeg(color))
+            dataset[person].append(str(path))
+    return root, dataset
+
+
+def test_images_are_encoded_once_across_the_pool_and_reused_by_pairs(dataset, tmp_path, monkeypatch):
+    root, face_dict = dataset
+    encoded = []
+    compute_embeddings = pipeline.compute_embeddings
+
+    def recording_compute(paths):
+        encoded.extend(paths)
+        return compute_embeddings(paths, workers=2)
+
+    monkeypatch.setattr(pipeline, "compute_embeddings", recording_compute)
+    store = EmbeddingStore(str(tmp_path / "store"), str(root))
+    pipeline.update_embedding_store(store, face_dict)
+    pipeline.update_embedding_store(store, face_dict)
+
+    all_paths = sorted(path for paths in face_dict.values() for path in paths)
+    assert sorted(encoded) == all_paths
+    alice_0, alice_1, no_face = face_dict["alice"]
+    np.testing.assert_allclose(store.get(alice_0), store.get(alice_1), atol=1e-6)
+    assert store.get(no_face) is None
+
+    # Chaque image apparaît dans plusieurs paires : embeddings lus depuis le stockage
+    pairs = pd.DataFrame(
+        [(alice_0, alice_1, True), (alice_0, face_dict["bob"][0], False), (alice_1, no_face, True)],
+        columns=["img1", "img2", "match"],
+    )
+    valid_df, distances, labels = pipeline.pair_distances(pipeline.add_face_embeddings(pairs, store))
+    assert len(valid_df) == 2
+    assert distances[0] == pytest.approx(0.0, abs=1e-6)
+    assert distances[1] > pipeline.TOLERANCE_SEUIL
+    assert labels.tolist() == [True, False]
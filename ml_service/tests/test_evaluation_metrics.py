@@ -0,0 +1,57 @@
+# ml_service/tests/test_evaluation_metrics.py
+import numpy as np
+import pytest
+
+pytest.importorskip("mlflow")
+pytest.importorskip("sklearn")
+pipeline = pytest.importorskip("face_recognition_pipeline")
+
+
+def test_threshold_sweep_counts_confusion_matrix_per_threshold():
+    distances = np.array([0.2, 0.4, 0.6, 0.8])
+    labels = np.array([True, True, False, False])
+
+    sweep = pipeline.threshold_sweep(distances, labels, thresholds=np.array([0.1, 0.3, 0.5, 0.7, 0.9]))
+
+    assert sweep["tp"].tolist() == [0, 1, 2, 2, 2]
+    assert sweep["fp"].tolist() == [0, 0, 0, 1, 2]
+    assert sweep["fn"].tolist() == [2, 1, 0, 0, 0]
+    assert sweep["tn"].tolist() == [2, 2, 2, 1, 0]
+    assert sweep["accuracy"].tolist() == [0.5, 0.75, 1.0, 0.75, 0.5]
+    # Aucune prédiction positive : précision et F1 à 0 plutôt que NaN
+    assert sweep["precision"].tolist() == pytest.approx([0.0, 1.0, 1.0, 2 / 3, 0.5])
+    assert sweep["f1"].tolist() == pytest.approx([0.0, 2 / 3, 1.0, 0.8, 2 / 3])
+    assert sweep["fpr"].tolist() == [0.0, 0.0, 0.0, 0.5, 1.0]
+
+def test_threshold_sweep_matches_per_threshold_loop():
+    rng = np.random.default_rng(0)
+    labels = rng.random(500) < 0.3
+    distances = np.where(labels, rng.normal(0.45, 0.1, 500), rng.normal(0.75, 0.1, 500))
+
+    sweep = pipeline.threshold_sweep(distances, labels)
+
+    for row in sweep.itertuples():
+        predicted = distances <= row.threshold
+        assert (row.tp, row.fp) == ((predicted & labels).sum(), (predicted & ~labels).sum())
+        assert row.accuracy == pytest.approx((predicted == labels).mean())
+
+def test_roc_metrics_auc_and_equal_error_rate():
+    distances = np.array([0.1, 0.5, 0.4, 0.9])
+    labels = np.array([True, True, False, False])
+
+    fpr, tpr, thresholds, roc_auc, eer, eer_threshold = pipeline.roc_metrics(distances, labels)
+
+    # 3 paires (positive, négative) sur 4 bien ordonnées
+    assert roc_auc == pytest.approx(0.75)
+    # Au seuil 0.4 : une négative acceptée sur deux, une positive rejetée sur deux
+    assert (eer, eer_threshold) == (pytest.approx(0.5), pytest.approx(0.4))
+    assert fpr[0] == 0 and tpr[-1] == 1
+
+def test_roc_metrics_for_separable_distances():
+    distances = np.array([0.2, 0.3, 0.7, 0.8])
+    labels = np.array([True, True, False, False])
+
+    _, _, _, roc_auc, eer, eer_threshold = pipeline.roc_metrics(distances, labels)
+
+    assert (roc_auc, eer) == (1.0, 0.0)
+    assert eer_threshold == pytest.approx(0.3)
@@ -0,0 +1,42 @@
+# ml_service/tests/test_executor.py
+import asyncio
+import threading
+
+import pytest
+
+from api_support import ALICE, jpeg, run_api, upload
+from app.executor import ExecutorSaturated, FaceExecutor, face_executor
+
+
+def test_run_refuses_work_beyond_workers_and_queue_depth():
+    executor = FaceExecutor(kind="thread", workers=1, queue_depth=1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.create_task(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0.05)
+        with pytest.raises(ExecutorSaturated):
+            await executor.run(release.wait)
+        release.set()
+        return await asyncio.gather(*running)
+
+    try:
+        assert asyncio.run(scenario()) == [True, True]
+    finally:
+        release.set()
+        executor.shutdown()
+
+@pytest.mark.usefixtures("empty_database")
+def test_saturated_executor_returns_503(monkeypatch):
+    async def saturated(fn, *args):
+        raise ExecutorSaturated()
+
+    async def scenario(client):
+        # Remplacé après le démarrage, pour que le préchauffage passe par le vrai pool
+        monkeypatch.setattr(face_executor, "run", saturated)
+        return await client.post("/face/identify", files=upload(jpeg(ALICE)))
+
+    response = run_api(scenario)
+
+    assert response.status_code == 503
+    assert response.json()["detail"] == "Service surchargé, veuillez réessayer."
@@ -0,0 +1,58 @@
+# ml_service/tests/test_extraction_cache.py
+import pytest
+
+from api_support import ALICE, BOB, jpeg, run_api, upload
+from app.executor import face_executor
+from app.routes.face_api import extraction_key
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+
+def count_pool_calls(monkeypatch):
+    calls = []
+    run = face_executor.run
+
+    async def counting_run(fn, *args):
+        calls.append(fn.__name__)
+        return await run(fn, *args)
+
+    monkeypatch.setattr(face_executor, "run", counting_run)
+    return calls
+
+
+def test_repeated_upload_is_served_from_cache_without_the_pool(monkeypatch):
+    async def scenario(client):
+        calls = count_pool_calls(monkeypatch)
+        first = (await client.post("/face/identify", files=upload(jpeg(ALICE)))).json()
+        second = (await client.post("/face/identify", files=upload(jpeg(ALICE)))).json()
+        return calls, first, second
+
+    calls, first, second = run_api(scenario)
+
+    assert calls == ["extract_faces"]
+    assert first == second
+
+def test_batch_only_sends_uncached_images_to_the_pool(monkeypatch):
+    async def scenario(client):
+        calls = count_pool_calls(monkeypatch)
+        await client.post("/face/identify", files=upload(jpeg(ALICE)))
+        response = await client.post(
+            "/face/identify/batch",
+            files=[("images", ("a.jpg", jpeg(ALICE), "image/jpeg")), ("images", ("b.jpg", jpeg(BOB), "image/jpeg"))],
+        )
+        again = await client.post("/face/identify/batch", files=[("images", ("b.jpg", jpeg(BOB), "image/jpeg"))])
+        return calls, response, again
+
+    calls, response, again = run_api(scenario)
+
+    # Un seul lot pour l'image inconnue, aucun pour la requête entièrement en cache
+    assert calls == ["extract_faces", "extract_faces_batch"]
+    assert [r["status"] for r in response.json()["results"]] == ["success", "success"]
+    assert again.json()["results"][0]["status"] == "success"
+
+def test_extraction_key_depends_on_content_and_shape():
+    data = jpeg(ALICE)
+
+    assert extraction_key(data) == extraction_key(bytes(data))
+    assert extraction_key(data) != extraction_key(jpeg(BOB))
+    assert extraction_key(data) != extraction_key(data, (200, 300, 3))
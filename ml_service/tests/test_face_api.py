@@ -0,0 +1,109 @@
+# ml_service/tests/test_face_api.py
+# Aller-retours HTTP dans le processus (httpx + ASGITransport), avec le
+# face_recognition simulé : la couleur de l'image fait l'identité.
+import asyncio
+
+import pytest
+
+from api_support import ALICE, BOB, jpeg, run_api, upload
+from app.database import FACE_MAX_TEMPLATES
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+
+def test_register_then_verify_and_identify():
+    async def scenario(client):
+        responses = {
+            "register": await client.post("/face/register/alice", files=upload(jpeg(ALICE))),
+            "verify_same": await client.post("/face/verify/alice", files=upload(jpeg(ALICE))),
+            "verify_other": await client.post("/face/verify/alice", files=upload(jpeg(BOB))),
+            "verify_unknown": await client.post("/face/verify/nobody", files=upload(jpeg(ALICE))),
+            "identify": await client.post("/face/identify", files=upload(jpeg(ALICE))),
+            "identify_unknown": await client.post("/face/identify", files=upload(jpeg(BOB))),
+            "no_face": await client.post("/face/register/bob", files=upload(jpeg((0, 0, 0)))),
+        }
+        return {name: (r.status_code, r.json()) for name, r in responses.items()}
+
+    results = run_api(scenario)
+
+    assert results["register"][0] == 201
+    assert results["verify_same"][1]["match"] is True
+    assert results["verify_other"][1]["match"] is False
+    assert results["verify_unknown"][0] == 404
+    assert results["identify"][1]["user_id"] == "alice"
+    assert results["identify"][1]["distance"] == pytest.approx(0.0, abs=0.05)
+    assert results["identify_unknown"][1]["user_id"] is None
+    assert results["no_face"][0] == 400
+
+def test_identify_every_face_of_an_image():
+    async def scenario(client):
+        await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+        await client.post("/face/register/bob", files=upload(jpeg(BOB)))
+        return (await client.post("/face/identify", params={"top_k": 2}, files=upload(jpeg(ALICE, BOB)))).json()
+
+    result = run_api(scenario)
+
+    assert [face["user_id"] for face in result["faces"]] == ["alice", "bob"]
+    assert [c["user_id"] for c in result["faces"][0]["candidates"]] == ["alice"]
+
+def test_templates_add_list_delete_round_trip():
+    async def scenario(client):
+        await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+        before = (await client.post("/face/verify/alice", files=upload(jpeg(BOB)))).json()
+        added = await client.post("/face/templates/alice", files=upload(jpeg(BOB)))
+        listed = (await client.get("/face/templates/alice")).json()
+        # Le second modèle sert au verify suivant (cache invalidé) comme à l'identification
+        with_template = (await client.post("/face/verify/alice", files=upload(jpeg(BOB)))).json()
+        identified = (await client.post("/face/identify", files=upload(jpeg(BOB)))).json()
+        deleted = await client.delete(f"/face/templates/alice/{added.json()['template_id']}")
+        deleted_again = await client.delete(f"/face/templates/alice/{added.json()['template_id']}")
+        after = (await client.post("/face/verify/alice", files=upload(jpeg(BOB)))).json()
+        remaining = (await client.get("/face/templates/alice")).json()
+        missing = await client.get("/face/templates/nobody")
+        return before, added, listed, with_template, identified, deleted, deleted_again, after, remaining, missing
+
+    before, added, listed, with_template, identified, deleted, deleted_again, after, remaining, missing = run_api(scenario)
+
+    assert before["match"] is False
+    assert added.status_code == 201
+    assert [t["id"] for t in listed["templates"]][-1] == added.json()["template_id"]
+    assert len(listed["templates"]) == 2
+    assert with_template["match"] is True
+    assert identified["user_id"] == "alice"
+    assert (deleted.status_code, deleted_again.status_code) == (200, 404)
+    assert after["match"] is False
+    assert len(remaining["templates"]) == 1
+    assert missing.status_code == 404
+
+def test_register_replaces_templates_and_cached_encodings():
+    async def scenario(client):
+        await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+        await client.post("/face/templates/alice", files=upload(jpeg((90, 200, 90))))
+        first = (await client.post("/face/verify/alice", files=upload(jpeg(ALICE)))).json()
+        await client.post("/face/register/alice", files=upload(jpeg(BOB)))
+        old = (await client.post("/face/verify/alice", files=upload(jpeg(ALICE)))).json()
+        new = (await client.post("/face/verify/alice", files=upload(jpeg(BOB)))).json()
+        templates = (await client.get("/face/templates/alice")).json()["templates"]
+        return first, old, new, templates
+
+    first, old, new, templates = run_api(scenario)
+
+    assert (first["match"], old["match"], new["match"]) == (True, False, True)
+    assert len(templates) == 1
+
+def test_template_limit_holds_under_concurrent_additions():
+    async def scenario(client):
+        await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+        for i in range(FACE_MAX_TEMPLATES - 2):
+            await client.post("/face/templates/alice", files=upload(jpeg((50 + 10 * i, 60, 70))))
+        # Une seule place libre pour quatre ajouts simultanés
+        responses = await asyncio.gather(*(
+            client.post("/face/templates/alice", files=upload(jpeg((150, 60 + 10 * i, 70)))) for i in range(4)
+        ))
+        templates = (await client.get("/face/templates/alice")).json()["templates"]
+        return sorted(r.status_code for r in responses), templates
+
+    statuses, templates = run_api(scenario)
+
+    assert statuses == [201, 409, 409, 409]
+    assert len(templates) == FACE_MAX_TEMPLATES
@@ -0,0 +1,46 @@
+# ml_service/tests/test_face_processing.py
+import face_recognition
+import numpy as np
+
+from app.face_processing import detect_and_encode
+
+
+def face_image(height, width):
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:, :] = (200, 100, 50)
+    return image
+
+
+def test_boxes_are_mapped_back_from_the_downscaled_copy(monkeypatch):
+    detected_shapes = []
+    encoded_shapes = []
+    face_locations = face_recognition.face_locations
+    face_encodings = face_recognition.face_encodings
+    monkeypatch.setattr(face_recognition, "face_locations",
+                        lambda img: detected_shapes.append(img.shape) or face_locations(img))
+    monkeypatch.setattr(face_recognition, "face_encodings",
+                        lambda img, locations: encoded_shapes.append(img.shape) or face_encodings(img, locations))
+    image = face_image(1200, 1800)
+    timings = {}
+
+    locations, encodings = detect_and_encode(image, max_side=600, timings=timings)
+
+    # Détection sur la copie au tiers, boîtes et encodage en coordonnées de l'original
+    assert detected_shapes == [(400, 600, 3)]
+    assert encoded_shapes == [(1200, 1800, 3)]
+    assert locations == [(300, 1350, 900, 450)]
+    assert locations == face_locations(image)
+    assert len(encodings) == 1
+    assert set(timings) == {"detect", "encode"}
+
+def test_small_images_and_zero_max_side_keep_full_resolution():
+    image = face_image(200, 300)
+
+    assert detect_and_encode(image, max_side=640)[0] == face_recognition.face_locations(image)
+    assert detect_and_encode(face_image(1200, 1800), max_side=0)[0] == [(300, 1350, 900, 450)]
+
+def test_no_face_returns_empty_lists():
+    timings = {}
+
+    assert detect_and_encode(np.zeros((400, 600, 3), dtype=np.uint8), max_side=200, timings=timings) == ([], [])
+    assert timings["encode"] == 0.0
@@ -0,0 +1,129 @@
+# ml_service/tests/test_gallery.py
+import numpy as np
+import pytest
+
+from app import gallery as gallery_module
+from app.ann import IVFFlatIndex
+from app.gallery import FaceGallery
+from app.metrics import IndexCollector
+
+
+def unit_vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).standard_normal((count, 128)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def make_gallery(vectors, templates_per_user=1):
+    gallery = FaceGallery()
+    for i, vector in enumerate(vectors):
+        gallery.add(i, f"user-{i // templates_per_user}", vector)
+    return gallery
+
+
+@pytest.mark.parametrize("aggregation", ["min", "mean"])
+def test_ann_search_with_empty_probed_lists_returns_no_match(monkeypatch, aggregation):
+    monkeypatch.setattr(gallery_module, "FACE_INDEX_MIN_SIZE", 0)
+    vectors = unit_vectors(50)
+    gallery = make_gallery(vectors)
+    # Le second centroïde est loin de toutes les données : sa liste reste vide
+    far = np.full(128, -10, dtype=np.float32)
+    gallery.attach_index(IVFFlatIndex(np.stack([vectors.mean(axis=0), far]), nprobe=1))
+
+    results = gallery.search_many([far, vectors[3]], k=1, tolerance=2.0, aggregation=aggregation)
+
+    assert results[0] == []
+    assert [user_id for user_id, _ in results[1]] == ["user-3"]
+    assert results[1][0][1] == pytest.approx(0.0, abs=1e-3)
+
+@pytest.mark.parametrize("aggregation, k", [("min", 3), ("mean", 1)])
+def test_ann_search_probing_every_list_matches_exact_search(monkeypatch, aggregation, k):
+    vectors = unit_vectors(600)
+    gallery = make_gallery(vectors, templates_per_user=3)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), 20, replace=False)] + 0.05 * rng.standard_normal((20, 128))
+
+    exact = gallery.search_many(queries, k=k, tolerance=2.0, aggregation=aggregation)
+    monkeypatch.setattr(gallery_module, "FACE_INDEX_MIN_SIZE", 0)
+    gallery.attach_index(IVFFlatIndex.train(gallery._snapshot()[0], nlist=16))
+    approximate = gallery.search_many(queries, k=k, tolerance=2.0, nprobe=16, aggregation=aggregation)
+
+    assert [[user_id for user_id, _ in matches] for matches in approximate] == \
+        [[user_id for user_id, _ in matches] for matches in exact]
+    np.testing.assert_allclose(
+        [distance for matches in approximate for _, distance in matches],
+        [distance for matches in exact for _, distance in matches],
+        rtol=1e-5,
+    )
+    assert all(len(matches) == k for matches in exact)
+
+def test_index_snapshot_is_reloaded_until_gallery_outgrows_it(monkeypatch, tmp_path, caplog):
+    monkeypatch.setattr(gallery_module, "FACE_INDEX_MIN_SIZE", 0)
+    path = str(tmp_path / "index.npz")
+    vectors = unit_vectors(401)
+    small = make_gallery(vectors[:100])
+    small.build_index(path)
+    assert small.index.trained_size == 100
+
+    # Croissance sous le ratio : l'instantané est repris tel quel
+    grown = make_gallery(vectors[:300])
+    grown.build_index(path)
+    np.testing.assert_array_equal(grown.index.centroids, small.index.centroids)
+    assert grown.index.trained_size == 100
+
+    # Au-delà de FACE_INDEX_RETRAIN_RATIO (4) : réentraînement et nouvel instantané
+    outgrown = make_gallery(vectors)
+    with caplog.at_level("WARNING", logger="app.gallery"):
+        outgrown.build_index(path)
+    assert outgrown.index.trained_size == 401
+    assert outgrown.index.nlist == 20
+    assert "réentraînement" in caplog.text
+    assert IVFFlatIndex.load(path)[0].trained_size == 401
+
+def test_growth_past_ratio_is_logged_once_and_exposed_in_index_stats(monkeypatch, caplog):
+    vectors = unit_vectors(500)
+    gallery = make_gallery(vectors[:100])
+    gallery.attach_index(IVFFlatIndex.train(gallery._snapshot()[0], nlist=10))
+
+    with caplog.at_level("WARNING", logger="app.gallery"):
+        for i in range(100, 500):
+            gallery.add(i, f"user-{i}", vectors[i])
+
+    assert caplog.text.count("réentraînement au prochain démarrage") == 1
+    stats = gallery.index_stats()
+    assert (stats["lists"], stats["trained_size"], stats["size"]) == (10, 100, 500)
+    assert stats["mean_list_size"] == 50.0
+    assert stats["max_list_size"] >= 50
+    assert FaceGallery().index_stats() is None
+
+    metrics = {family.name: family.samples[0].value for family in IndexCollector(gallery).collect()}
+    assert metrics["face_index_lists"] == 10
+    assert metrics["face_index_list_imbalance"] == stats["max_list_size"] / 50.0
+    assert metrics["face_index_growth_ratio"] == 5.0
+
+def test_mean_aggregation_selects_candidates_per_user():
+    rng = np.random.default_rng(2)
+    query = np.zeros(128, dtype=np.float32)
+    query[0] = 1
+
+    def at_distance(distance):
+        direction = rng.standard_normal(128)
+        direction[0] = 0
+        return query + distance * direction / np.linalg.norm(direction)
+
+    gallery = FaceGallery()
+    template_id = 0
+    # Chaque leurre a un modèle très proche et deux lointains (moyenne 1.3) ;
+    # leurs modèles proches suffisent à remplir la présélection par modèle
+    for user in range(30):
+        for distance in (0.1, 1.9, 1.9):
+            gallery.add(template_id, f"decoy-{user}", at_distance(distance))
+            template_id += 1
+    for _ in range(3):
+        gallery.add(template_id, "steady", at_distance(0.5))
+        template_id += 1
+
+    matches = gallery.search(query, k=3, tolerance=2.0, aggregation="mean")
+
+    assert matches[0][0] == "steady"
+    assert matches[0][1] == pytest.approx(0.5, abs=1e-4)
+    assert [distance for _, distance in matches[1:]] == pytest.approx([1.3, 1.3], abs=1e-4)
+    assert gallery.search(query, k=1, tolerance=2.0, aggregation="min")[0][0].startswith("decoy-")
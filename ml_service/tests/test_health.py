@@ -0,0 +1,52 @@
+# ml_service/tests/test_health.py
+import asyncio
+
+import httpx
+import pytest
+
+from app.executor import face_executor
+from app.main import app
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+
+def test_ready_only_after_workers_are_warmed_up(monkeypatch):
+    monkeypatch.setattr(app.state, "ready", False)
+
+    async def scenario():
+        warmed_up = asyncio.Event()
+
+        async def warm_up():
+            await warmed_up.wait()
+            return [(0, 0.0)]
+
+        monkeypatch.setattr(face_executor, "warm_up", warm_up)
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                live = await client.get("/health/live")
+                starting = await client.get("/health/ready")
+                warmed_up.set()
+                await app.state.warm_up_task
+                ready = await client.get("/health/ready")
+        return live, starting, ready
+
+    live, starting, ready = asyncio.run(scenario())
+
+    assert live.status_code == 200
+    assert (starting.status_code, starting.json()) == (503, {"status": "starting"})
+    assert (ready.status_code, ready.json()) == (200, {"status": "ready"})
+
+def test_failed_warm_up_keeps_service_not_ready(monkeypatch):
+    monkeypatch.setattr(app.state, "ready", False)
+
+    async def failing_warm_up():
+        raise RuntimeError("modèles introuvables")
+
+    async def scenario():
+        monkeypatch.setattr(face_executor, "warm_up", failing_warm_up)
+        async with app.router.lifespan_context(app):
+            await app.state.warm_up_task
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                return await client.get("/health/ready")
+
+    assert asyncio.run(scenario()).status_code == 503
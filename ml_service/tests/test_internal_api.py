@@ -0,0 +1,73 @@
+# ml_service/tests/test_internal_api.py
+import msgpack
+import pytest
+
+from api_support import ALICE, BOB, image, jpeg, run_api
+from app.executor import ExecutorSaturated, face_executor
+from app.routes.internal_api import MSGPACK_MEDIA_TYPE
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+OCTET_STREAM = {"Content-Type": "application/octet-stream"}
+
+
+def unpack(response):
+    assert response.headers["content-type"] == MSGPACK_MEDIA_TYPE
+    return msgpack.unpackb(response.content, raw=False)
+
+def raw_rgb(*colors):
+    """Tampon RGB déjà décodé et son en-tête X-Image-Shape."""
+    rgb = image(*colors)[:, :, ::-1].copy()
+    return rgb.tobytes(), {**OCTET_STREAM, "X-Image-Shape": ",".join(map(str, rgb.shape))}
+
+
+def test_internal_routes_answer_in_msgpack_for_encoded_and_raw_images():
+    async def scenario(client):
+        registered = await client.post("/internal/face/register/alice", content=jpeg(ALICE), headers=OCTET_STREAM)
+        alice, alice_headers = raw_rgb(ALICE)
+        bob, bob_headers = raw_rgb(BOB)
+        return (
+            registered,
+            await client.post("/internal/face/verify/alice", content=alice, headers=alice_headers),
+            await client.post("/internal/face/verify/alice", content=bob, headers=bob_headers),
+            await client.post("/internal/face/identify", content=jpeg(ALICE), headers=OCTET_STREAM),
+        )
+
+    registered, raw_match, raw_mismatch, identified = run_api(scenario)
+
+    assert registered.status_code == 201
+    assert unpack(registered)["status"] == "success"
+    # Tampon RGB converti en BGR comme une image décodée : même encodage que le JPEG enregistré
+    assert unpack(raw_match)["match"] is True
+    assert unpack(raw_mismatch)["match"] is False
+    assert unpack(identified)["user_id"] == "alice"
+
+def test_internal_errors_are_msgpack_with_their_status(monkeypatch):
+    async def scenario(client):
+        alice, headers = raw_rgb(ALICE)
+        responses = {
+            "empty": await client.post("/internal/face/identify", content=b"", headers=OCTET_STREAM),
+            "bad_shape": await client.post("/internal/face/identify", content=alice, headers={**headers, "X-Image-Shape": "10,10"}),
+            "wrong_size": await client.post("/internal/face/identify", content=alice[:-3], headers=headers),
+            "unknown_user": await client.post("/internal/face/verify/nobody", content=alice, headers=headers),
+            "invalid_query": await client.post("/internal/face/identify", params={"top_k": 0}, content=alice, headers=headers),
+        }
+
+        async def saturated(fn, *args):
+            raise ExecutorSaturated()
+
+        monkeypatch.setattr(face_executor, "run", saturated)
+        responses["saturated"] = await client.post("/internal/face/identify", content=jpeg(BOB), headers=OCTET_STREAM)
+        return responses
+
+    responses = run_api(scenario)
+
+    statuses = {name: response.status_code for name, response in responses.items()}
+    assert statuses == {
+        "empty": 400, "bad_shape": 400, "wrong_size": 400, "unknown_user": 404, "invalid_query": 422, "saturated": 503,
+    }
+    details = {name: unpack(response)["detail"] for name, response in responses.items()}
+    assert details["empty"] == "Image non fournie."
+    assert details["unknown_user"] == "Utilisateur non trouvé."
+    assert details["invalid_query"][0]["loc"] == ["query", "top_k"]
+    assert details["saturated"] == "Service surchargé, veuillez réessayer."
@@ -0,0 +1,55 @@
+# ml_service/tests/test_metrics.py
+import pytest
+
+from api_support import ALICE, jpeg, run_api, upload
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+
+def sample(metrics, name, **labels):
+    """Valeur d'un échantillon du format texte Prometheus, ou None."""
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    prefix = f"{name}{{{label_text}}} " if labels else f"{name} "
+    for line in metrics.splitlines():
+        if line.startswith(prefix):
+            return float(line[len(prefix):])
+    return None
+
+
+def test_server_timing_header_lists_request_stages():
+    async def scenario(client):
+        await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+        return await client.post("/face/verify/alice", files=upload(jpeg((90, 200, 90))))
+
+    response = run_api(scenario)
+
+    stages = dict(part.split(";dur=") for part in response.headers["Server-Timing"].split(", "))
+    assert {"db", "decode", "detect", "encode", "queue", "compare"} <= set(stages)
+    assert all(float(duration) >= 0 for duration in stages.values())
+
+def test_metrics_expose_requests_stages_outcomes_and_caches():
+    async def scenario(client):
+        before = (await client.get("/metrics")).text
+        await client.post("/face/register/alice", files=upload(jpeg(ALICE)))
+        await client.post("/face/identify", files=upload(jpeg(ALICE)))
+        await client.post("/face/identify", files=upload(jpeg((0, 0, 0))))
+        return before, await client.get("/metrics")
+
+    before, response = run_api(scenario)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    after = response.text
+
+    def increase(name, **labels):
+        return (sample(after, name, **labels) or 0) - (sample(before, name, **labels) or 0)
+
+    assert increase("face_api_request_seconds_count", endpoint="identify") == 2
+    assert increase("face_api_stage_seconds_count", endpoint="identify", stage="detect") == 1
+    assert increase("face_api_outcomes_total", endpoint="identify", outcome="match") == 1
+    assert increase("face_api_outcomes_total", endpoint="identify", outcome="no_face") == 1
+    assert increase("face_api_outcomes_total", endpoint="register", outcome="registered") == 1
+    assert sample(after, "face_api_in_flight_requests", endpoint="identify") == 0
+    # L'image d'identification a déjà été traitée à l'enregistrement
+    assert increase("face_extraction_cache_hits_total") == 1
+    assert sample(after, "face_encoding_cache_size") is not None
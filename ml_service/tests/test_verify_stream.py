@@ -0,0 +1,58 @@
+# ml_service/tests/test_verify_stream.py
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from api_support import ALICE, BOB, jpeg, upload
+from app.main import app
+from app.routes import face_api
+
+pytestmark = pytest.mark.usefixtures("empty_database")
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        assert client.post("/face/register/alice", files=upload(jpeg(ALICE))).status_code == 201
+        yield client
+
+
+def test_stream_stops_at_first_confident_match(client):
+    with client.websocket_connect("/face/verify/alice/stream") as websocket:
+        websocket.send_bytes(jpeg((0, 0, 0)))
+        no_face = websocket.receive_json()
+        websocket.send_bytes(b"pas une image")
+        unreadable = websocket.receive_json()
+        websocket.send_bytes(jpeg(ALICE))
+        final = websocket.receive_json()
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert (no_face["final"], no_face["message"]) == (False, "Aucun visage détecté.")
+    assert (unreadable["status"], unreadable["final"]) == ("error", False)
+    assert (final["frame"], final["final"], final["match"]) == (3, True, True)
+    assert final["distance"] <= face_api.FACE_STREAM_MATCH_DISTANCE
+    assert closed.value.code == 1000
+
+def test_stream_decides_on_best_frame_after_max_frames(client, monkeypatch):
+    monkeypatch.setattr(face_api, "FACE_STREAM_MAX_FRAMES", 3)
+
+    with client.websocket_connect("/face/verify/alice/stream") as websocket:
+        results = []
+        for _ in range(3):
+            websocket.send_bytes(jpeg(BOB))
+            results.append(websocket.receive_json())
+
+    assert [r["final"] for r in results] == [False, False, True]
+    assert [r["match"] for r in results] == [False, False, False]
+    assert results[-1]["message"] == "Vérification échouée."
+    assert results[-1]["distance"] == pytest.approx(min(r["distance"] for r in results))
+
+def test_stream_for_unknown_user_closes_with_policy_violation(client):
+    with client.websocket_connect("/face/verify/nobody/stream") as websocket:
+        result = websocket.receive_json()
+        with pytest.raises(WebSocketDisconnect) as closed:
+            websocket.receive_json()
+
+    assert (result["status"], result["final"], result["message"]) == ("error", True, "Utilisateur non trouvé.")
+    assert closed.value.code == 1008
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+
+import websockets
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.urls import reverse
+
+from .ml_client import ml_client
+from .views import FACE_VERIFIED_SESSION_KEY, ML_UNAVAILABLE_MESSAGE
+
+
+@database_sync_to_async
+def get_session_value(session, key):
+    return session.get(key)
+
+@database_sync_to_async
+def mark_face_verified(session, user_id):
+    # La connexion elle-même est faite en HTTP (verify_face_complete) : un WebSocket
+    # ne peut pas renvoyer le nouveau cookie de session créé par login()
+    session[FACE_VERIFIED_SESSION_KEY] = {'user_id': user_id, 'at': time.time()}
+    session.save()
+
+
+class FaceVerifyConsumer(AsyncWebsocketConsumer):
+    """
+    Vérification faciale en flux : reçoit les images de la webcam sur un seul
+    WebSocket et les relaie au flux /face/verify/{user_id}/stream de ml_service.
+    Une seule image est en cours d'analyse à la fois ; pendant ce temps seule
+    la plus récente est conservée, les images intermédiaires sont abandonnées.
+    """
+
+    async def connect(self):
+        self.ml_socket = None
+        self.forward_task = None
+        self.user_id = await get_session_value(self.scope["session"], 'temp_user_id')
+        if not self.user_id:
+            await self.close(code=4401)
+            return
+
+        await self.accept()
+        if not ml_client.breaker.allow_request():
+            await self.send_error(ML_UNAVAILABLE_MESSAGE)
+            return
+        try:
+            self.ml_socket = await websockets.connect(
+                f"{settings.ML_API_WS_URL}/verify/{self.user_id}/stream",
+                open_timeout=settings.ML_API_CONNECT_TIMEOUT,
+            )
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            ml_client.breaker.record_failure()
+            await self.send_error(ML_UNAVAILABLE_MESSAGE)
+            return
+        ml_client.breaker.record_success()
+
+        self.latest_frame = None
+        self.frame_ready = asyncio.Event()
+        self.dropped_frames = 0
+        self.forward_task = asyncio.create_task(self.forward_frames())
+
+    async def disconnect(self, close_code):
+        if self.forward_task is not None:
+            self.forward_task.cancel()
+        if self.ml_socket is not None:
+            await self.ml_socket.close()
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is None or self.forward_task is None:
+            return
+        # Une image non encore envoyée est remplacée par la plus récente
+        if self.latest_frame is not None:
+            self.dropped_frames += 1
+        self.latest_frame = bytes_data
+        self.frame_ready.set()
+
+    async def forward_frames(self):
+        try:
+            while True:
+                await self.frame_ready.wait()
+                self.frame_ready.clear()
+                frame, self.latest_frame = self.latest_frame, None
+                await self.ml_socket.send(frame)
+                result = json.loads(
+                    await asyncio.wait_for(self.ml_socket.recv(), settings.ML_API_READ_TIMEOUT)
+                )
+                result['dropped_frames'] = self.dropped_frames
+                if result.get('final') and result.get('match'):
+                    await mark_face_verified(self.scope["session"], self.user_id)
+                    result['redirect'] = reverse('auth:verify_face_complete')
+                await self.send(text_data=json.dumps(result))
+                if result.get('final'):
+                    await self.close()
+                    return
+        except (OSError, asyncio.TimeoutError, websockets.WebSocketException):
+            ml_client.breaker.record_failure()
+            await self.send_error("Erreur de connexion au service d'authentification faciale.")
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({'status': 'error', 'match': False, 'final': True, 'message': message}))
+        await self.close()
@@ -0,0 +1,161 @@
+import asyncio
+import random
+import threading
+import time
+
+import httpx
+import msgpack
+from django.conf import settings
+
+# Réponses indiquant un service momentanément saturé : on peut réessayer
+RETRY_STATUS_CODES = (502, 503, 504)
+MSGPACK_MEDIA_TYPE = 'application/x-msgpack'
+
+
+class MLServiceUnavailable(Exception):
+    """Le disjoncteur est ouvert : le service ML n'est pas appelé."""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur simple : ouvert après failure_threshold échecs consécutifs,
+    il laisse passer une requête d'essai après reset_timeout secondes
+    (semi-ouvert) ; un succès le referme, un échec le rouvre.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow_request(self):
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < self.reset_timeout or self._trial_in_progress:
+                return False
+            # Semi-ouvert : une seule requête d'essai à la fois
+            self._trial_in_progress = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_progress = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_progress = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class MLClient:
+    """
+    Client HTTP asynchrone partagé vers ml_service : httpx.AsyncClient
+    keep-alive avec pool de connexions, délais de connexion/lecture, nouvelles
+    tentatives bornées avec gigue et disjoncteur. Les vues asynchrones
+    l'attendent directement sur la boucle de Daphne, sans occuper de thread.
+    En mode binaire (par défaut), l'image part en corps brut vers les routes
+    /internal/face et la réponse revient en msgpack ; sinon multipart et JSON
+    vers les routes publiques /face.
+    """
+
+    def __init__(self, base_url, connect_timeout=2.0, read_timeout=10.0, retries=2,
+                 retry_backoff=0.2, pool_size=10, breaker=None, binary=False):
+        self.base_url = base_url.rstrip('/')
+        self.binary = binary
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.session = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size),
+        )
+
+    async def _sleep_before_retry(self, attempt):
+        # Attente exponentielle avec gigue complète pour étaler les nouvelles tentatives
+        await asyncio.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+
+    async def post(self, path, image_file):
+        """
+        Envoie l'image au service ML et retourne la réponse.
+        Lève MLServiceUnavailable si le disjoncteur est ouvert, ou
+        httpx.HTTPError si toutes les tentatives échouent.
+        """
+        if not self.breaker.allow_request():
+            raise MLServiceUnavailable("Service de reconnaissance faciale momentanément indisponible.")
+
+        # Lecture unique du fichier pour pouvoir le renvoyer à chaque tentative
+        image_bytes = image_file.read()
+        if self.binary:
+            request_kwargs = {
+                'content': image_bytes,
+                'headers': {'Content-Type': 'application/octet-stream', 'Accept': MSGPACK_MEDIA_TYPE},
+            }
+        else:
+            request_kwargs = {'files': {'image': (
+                getattr(image_file, 'name', 'image.jpg'),
+                image_bytes,
+                getattr(image_file, 'content_type', None) or 'image/jpeg',
+            )}}
+        url = f"{self.base_url}{path}"
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            try:
+                response = await self.session.post(url, **request_kwargs)
+            except (httpx.ConnectError, httpx.ConnectTimeout):
+                if last_attempt:
+                    self.breaker.record_failure()
+                    raise
+            except httpx.HTTPError:
+                # Délai de lecture dépassé : la requête a pu être traitée, on ne la rejoue pas
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                    # Toute erreur 5xx compte comme un échec ; une 4xx est une réponse valide du service
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    return response
+            await self._sleep_before_retry(attempt)
+
+    @staticmethod
+    def decode(response):
+        """Corps de la réponse (msgpack ou JSON selon le Content-Type)."""
+        if response.headers.get('content-type', '').startswith(MSGPACK_MEDIA_TYPE):
+            return msgpack.unpackb(response.content)
+        return response.json()
+
+    async def post_image(self, path, image_file):
+        """Comme post(), puis lève httpx.HTTPStatusError sur erreur HTTP et retourne le corps décodé."""
+        response = await self.post(path, image_file)
+        response.raise_for_status()
+        return self.decode(response)
+
+
+ml_client = MLClient(
+    settings.ML_API_INTERNAL_URL if settings.ML_API_BINARY else settings.ML_API_URL,
+    connect_timeout=settings.ML_API_CONNECT_TIMEOUT,
+    read_timeout=settings.ML_API_READ_TIMEOUT,
+    retries=settings.ML_API_RETRIES,
+    retry_backoff=settings.ML_API_RETRY_BACKOFF,
+    pool_size=settings.ML_API_POOL_SIZE,
+    breaker=CircuitBreaker(settings.ML_API_BREAKER_THRESHOLD, settings.ML_API_BREAKER_RESET_TIMEOUT),
+    binary=settings.ML_API_BINARY,
+)
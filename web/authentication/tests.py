@@ -1,15 +1,51 @@
 import pytest
+import asyncio
 import io
-import requests
+import json
+import httpx
+import websockets
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import WebsocketCommunicator
 from PIL import Image
-from unittest.mock import patch, Mock
+import msgpack
+from unittest.mock import AsyncMock, patch, Mock
 from django.contrib.auth import get_user_model
 from django.contrib.messages import get_messages
+from django.contrib.sessions.backends.db import SessionStore
 from django.urls import reverse
 
+from authentication.consumers import FaceVerifyConsumer
+from authentication.ml_client import CircuitBreaker, ml_client
+
 
 User = get_user_model()
 
+@pytest.fixture(autouse=True)
+def reset_ml_client(monkeypatch):
+    """Disjoncteur refermé et nouvelles tentatives sans attente pour chaque test."""
+    ml_client.breaker.reset()
+    monkeypatch.setattr(ml_client, 'retry_backoff', 0)
+    yield
+    ml_client.breaker.reset()
+
+def ml_response(payload, status_code=200):
+    """Réponse du service ML telle que renvoyée par les routes internes (msgpack)."""
+    return httpx.Response(
+        status_code,
+        content=msgpack.packb(payload),
+        headers={'content-type': 'application/x-msgpack'},
+        request=httpx.Request('POST', 'http://ml_service:8000/internal/face'),
+    )
+
+def make_image_file():
+    image = Image.new('RGB', (100, 100), color='red')
+    image_file = io.BytesIO()
+    image.save(image_file, 'JPEG')
+    image_file.seek(0)
+    image_file.name = 'test.jpg'
+    return image_file
+
 # Fixture pour créer différents utilisateurs de test
 @pytest.fixture
 def user_password_ok(db):
@@ -149,8 +185,8 @@ def test_login_page_face_auth_setup(mock_authenticate, mock_login, client, user_
 
 
 
-@patch('authentication.views.requests.post')
-@patch('authentication.views.login')
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
+@patch('authentication.views.alogin', new_callable=AsyncMock)
 def test_setup_face_auth_success(mock_login, mock_post, client, user_face_auth_required):
     """Test de la configuration réussie de l'authentification faciale."""
     
@@ -158,10 +194,7 @@ def test_setup_face_auth_success(mock_login, mock_post, client, user_face_auth_r
     client.force_login(user_face_auth_required)
     
     # Mock de la réponse de l'API ML
-    mock_response = Mock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {'status': 'success'}
-    mock_post.return_value = mock_response
+    mock_post.return_value = ml_response({'status': 'success'})
     
     # Créer une fausse image
     image = Image.new('RGB', (100, 100), color='red')
@@ -197,7 +230,7 @@ def test_setup_face_auth_success(mock_login, mock_post, client, user_face_auth_r
     assert "succès" in str(messages[0])
 
 
-@patch('authentication.views.requests.post')
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
 def test_setup_face_auth_no_image(mock_post, client, user_face_auth_required):
     """Test sans image fournie."""
     
@@ -209,20 +242,17 @@ def test_setup_face_auth_no_image(mock_post, client, user_face_auth_required):
     assert not mock_post.called
 
 
-@patch('authentication.views.requests.post')
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
 def test_setup_face_auth_api_error(mock_post, client, user_face_auth_required):
     """Test d'erreur de l'API ML."""
     
     client.force_login(user_face_auth_required)
     
     # Mock d'une réponse d'erreur
-    mock_response = Mock()
-    mock_response.status_code = 200
-    mock_response.json.return_value = {
+    mock_post.return_value = ml_response({
         'status': 'error',
         'message': 'Aucun visage détecté'
-    }
-    mock_post.return_value = mock_response
+    })
     
     # Créer une fausse image
     image = Image.new('RGB', (100, 100), color='red')
@@ -246,14 +276,14 @@ def test_setup_face_auth_api_error(mock_post, client, user_face_auth_required):
     assert user_face_auth_required.face_image_registered is False
 
 
-@patch('authentication.views.requests.post')
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
 def test_setup_face_auth_connection_error(mock_post, client, user_face_auth_required):
     """Test d'erreur de connexion à l'API ML."""
     
     client.force_login(user_face_auth_required)
     
     # Mock d'une exception de connexion
-    mock_post.side_effect = requests.exceptions.ConnectionError("Connection failed")
+    mock_post.side_effect = httpx.ConnectError("Connection failed")
     
     # Créer une fausse image
     image = Image.new('RGB', (100, 100), color='red')
@@ -292,4 +322,225 @@ def test_setup_face_auth_not_authenticated(client):
     assert response.status_code == 302
     # Le décorateur @login_required redirige vers /accounts/login/ avec le paramètre next
     expected_url = f"/accounts/login/?next={reverse('auth:setup_face_auth')}"
-    assert response.url == expected_url
\ No newline at end of file
+    assert response.url == expected_url
+
+
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
+def test_verify_face_success(mock_post, client, user_face_auth_verify):
+    """Vérification réussie : connexion asynchrone et nettoyage de temp_user_id."""
+    session = client.session
+    session['temp_user_id'] = user_face_auth_verify.pk
+    session.save()
+
+    mock_post.return_value = ml_response({'status': 'success', 'match': True})
+
+    response = client.post(
+        reverse('auth:verify_face'),
+        data={'image': make_image_file()},
+        format='multipart'
+    )
+
+    assert response.status_code == 200
+    assert response.json() == {'status': 'success', 'redirect': reverse('index')}
+    assert f"/verify/{user_face_auth_verify.pk}" in mock_post.call_args[0][0]
+    assert 'temp_user_id' not in client.session
+    assert int(client.session['_auth_user_id']) == user_face_auth_verify.pk
+
+
+def test_verify_face_get(client):
+    """Affichage de la page de vérification (rendu depuis la vue asynchrone)."""
+    response = client.get(reverse('auth:verify_face'))
+
+    assert response.status_code == 200
+    assert 'authentication/verify_face.html' in [t.name for t in response.templates]
+
+
+# -------- Tests du client ML (nouvelles tentatives et disjoncteur) -------
+
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
+def test_setup_face_auth_retries_connection_error(mock_post, client, user_face_auth_required):
+    """Une erreur de connexion passagère est rejouée de façon transparente."""
+    client.force_login(user_face_auth_required)
+
+    mock_post.side_effect = [httpx.ConnectError("Connection reset"), ml_response({'status': 'success'})]
+
+    response = client.post(
+        reverse('auth:setup_face_auth'),
+        data={'image': make_image_file()},
+        format='multipart'
+    )
+
+    assert response.status_code == 200
+    assert response.json()['status'] == 'success'
+    assert mock_post.call_count == 2
+    # Le même contenu d'image est renvoyé à la seconde tentative, en corps brut
+    first, second = (call.kwargs for call in mock_post.call_args_list)
+    assert first['content'] == second['content'] == make_image_file().read()
+    assert first['headers']['Content-Type'] == 'application/octet-stream'
+    assert not ml_client.breaker.is_open
+
+
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
+def test_verify_face_fails_fast_when_breaker_open(mock_post, client, user_face_auth_verify):
+    """Disjoncteur ouvert : réponse immédiate sans appel au service ML."""
+    session = client.session
+    session['temp_user_id'] = user_face_auth_verify.pk
+    session.save()
+
+    for _ in range(ml_client.breaker.failure_threshold):
+        ml_client.breaker.record_failure()
+
+    response = client.post(
+        reverse('auth:verify_face'),
+        data={'image': make_image_file()},
+        format='multipart'
+    )
+
+    assert response.status_code == 503
+    assert response.json()['status'] == 'error'
+    assert 'indisponible' in response.json()['message']
+    assert not mock_post.called
+
+
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
+def test_breaker_opens_after_repeated_failures(mock_post, client, user_face_auth_verify):
+    """Les échecs répétés (503 après nouvelles tentatives) finissent par ouvrir le disjoncteur."""
+    session = client.session
+    session['temp_user_id'] = user_face_auth_verify.pk
+    session.save()
+
+    mock_post.return_value = ml_response({'detail': 'Service surchargé, veuillez réessayer.'}, status_code=503)
+
+    for _ in range(ml_client.breaker.failure_threshold):
+        response = client.post(reverse('auth:verify_face'), data={'image': make_image_file()}, format='multipart')
+        assert response.json()['status'] == 'error'
+
+    assert ml_client.breaker.is_open
+    assert mock_post.call_count == ml_client.breaker.failure_threshold * (ml_client.retries + 1)
+
+
+@patch('authentication.views.ml_client.session.post', new_callable=AsyncMock)
+def test_internal_error_counts_as_breaker_failure(mock_post, client, user_face_auth_verify):
+    """Une erreur 500 n'est pas rejouée mais compte comme un échec du disjoncteur."""
+    session = client.session
+    session['temp_user_id'] = user_face_auth_verify.pk
+    session.save()
+
+    mock_post.return_value = ml_response({'detail': 'Erreur interne'}, status_code=500)
+
+    for _ in range(ml_client.breaker.failure_threshold):
+        response = client.post(reverse('auth:verify_face'), data={'image': make_image_file()}, format='multipart')
+        assert response.json()['status'] == 'error'
+
+    assert ml_client.breaker.is_open
+    assert mock_post.call_count == ml_client.breaker.failure_threshold
+
+
+def test_circuit_breaker_half_open_trial():
+    """Après le délai, une seule requête d'essai passe ; son succès referme le disjoncteur."""
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+
+    breaker.record_failure()
+    assert breaker.allow_request()
+    breaker.record_failure()
+    assert breaker.is_open
+
+    assert breaker.allow_request()
+    assert not breaker.allow_request()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow_request()
+
+
+# -------- Tests de la vérification en flux (WebSocket) -------
+
+@pytest.fixture
+def in_memory_channel_layer(settings):
+    """Couche de canaux en mémoire : pas de Redis pendant les tests."""
+    settings.CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures('in_memory_channel_layer')
+def test_face_verify_stream_drops_stale_frames_and_stops_on_match(client, settings, user_face_auth_verify):
+    """Pendant l'analyse d'une image, seule la plus récente est conservée ; arrêt au premier match sûr."""
+    received = []
+    release_first = asyncio.Event()
+
+    async def fake_ml_stream(websocket):
+        received.append(websocket.request.path)
+        received.append(await websocket.recv())
+        await release_first.wait()
+        await websocket.send(json.dumps({'status': 'success', 'match': False, 'final': False, 'frame': 1}))
+        received.append(await websocket.recv())
+        await websocket.send(json.dumps({'status': 'success', 'match': True, 'final': True, 'frame': 2, 'distance': 0.3}))
+
+    async def scenario():
+        async with websockets.serve(fake_ml_stream, '127.0.0.1', 0) as server:
+            port = server.sockets[0].getsockname()[1]
+            settings.ML_API_WS_URL = f'ws://127.0.0.1:{port}/face'
+            session = SessionStore()
+            session['temp_user_id'] = user_face_auth_verify.pk
+            await database_sync_to_async(session.save)()
+
+            communicator = WebsocketCommunicator(FaceVerifyConsumer.as_asgi(), '/ws/auth/verify-face/')
+            communicator.scope['session'] = session
+            connected, _ = await communicator.connect()
+            assert connected
+
+            await communicator.send_to(bytes_data=b'frame-1')
+            await asyncio.sleep(0.1)
+            # Arrivent pendant l'analyse de frame-1 : seule frame-3 doit partir ensuite
+            await communicator.send_to(bytes_data=b'frame-2')
+            await communicator.send_to(bytes_data=b'frame-3')
+            await asyncio.sleep(0.1)
+            release_first.set()
+
+            first = await communicator.receive_json_from(timeout=5)
+            final = await communicator.receive_json_from(timeout=5)
+            closed = await communicator.receive_output(timeout=5)
+            await communicator.disconnect()
+            return session.session_key, first, final, closed
+
+    session_key, first, final, closed = async_to_sync(scenario)()
+
+    assert received == [f'/face/verify/{user_face_auth_verify.pk}/stream', b'frame-1', b'frame-3']
+    assert first['final'] is False
+    assert final['match'] is True
+    assert final['dropped_frames'] == 1
+    assert final['redirect'] == reverse('auth:verify_face_complete')
+    assert closed['type'] == 'websocket.close'
+
+    # La connexion est finalisée en HTTP avec la même session
+    client.cookies[settings.SESSION_COOKIE_NAME] = session_key
+    response = client.get(reverse('auth:verify_face_complete'))
+    assert response.status_code == 302
+    assert response.url == reverse('index')
+    assert int(client.session['_auth_user_id']) == user_face_auth_verify.pk
+    assert 'temp_user_id' not in client.session
+
+
+@pytest.mark.django_db(transaction=True)
+@pytest.mark.usefixtures('in_memory_channel_layer')
+def test_face_verify_stream_requires_pending_login():
+    """Sans temp_user_id en session, la connexion WebSocket est refusée."""
+    async def scenario():
+        communicator = WebsocketCommunicator(FaceVerifyConsumer.as_asgi(), '/ws/auth/verify-face/')
+        communicator.scope['session'] = SessionStore()
+        connected, code = await communicator.connect()
+        return connected, code
+
+    assert async_to_sync(scenario)() == (False, 4401)
+
+
+def test_verify_face_complete_without_stream_verification(client, user_face_auth_verify):
+    """Sans vérification préalable par le flux, aucune connexion n'est faite."""
+    session = client.session
+    session['temp_user_id'] = user_face_auth_verify.pk
+    session.save()
+
+    response = client.get(reverse('auth:verify_face_complete'))
+
+    assert response.status_code == 302
+    assert response.url == reverse('auth:verify_face')
+    assert '_auth_user_id' not in client.session
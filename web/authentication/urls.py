@@ -10,4 +10,5 @@ urlpatterns = [
     path("register/", views.register_page, name="register"),
     path("setup_face/", views.setup_face_auth, name="setup_face_auth"),
     path("verify_face/", views.verify_face, name="verify_face"),
+    path("verify_face/complete/", views.verify_face_complete, name="verify_face_complete"),
 ]
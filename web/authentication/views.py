@@ -1,6 +1,9 @@
-import requests
+import time
+
+import httpx
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect
-from django.contrib.auth import login, logout, authenticate
+from django.contrib.auth import login, alogin, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.http import JsonResponse, HttpResponseBadRequest
@@ -8,8 +11,12 @@ from django.contrib.auth import get_user_model
 from django.urls import reverse
 
 from . import forms
+from .ml_client import ml_client, MLServiceUnavailable
 
-ML_API_URL = 'http://ml_service:8000/face'  # URL de l'API de reconnaissance faciale
+ML_UNAVAILABLE_MESSAGE = "Le service d'authentification faciale est momentanément indisponible. Veuillez réessayer dans quelques instants."
+# Vérification réussie par le flux WebSocket (FaceVerifyConsumer), en attente de connexion
+FACE_VERIFIED_SESSION_KEY = 'face_verified'
+FACE_VERIFIED_MAX_AGE = 60  # secondes
 
 def login_page(resquest):
     form = forms.LoginForm()
@@ -118,18 +125,20 @@ def logout_page(request):
     return redirect('auth:login')
 
 @login_required
-def setup_face_auth(request):
+async def setup_face_auth(request):
     """
-    Vue pour configurer l'authentification faciale
+    Vue pour configurer l'authentification faciale.
+    Asynchrone : l'appel au service ML et les accès ORM n'occupent pas de thread.
     """
     # Vérifier si l'utilisateur est connecté ou a un temp_user_id
-    if not request.user.is_authenticated:
-        user_id = request.session.get('temp_user_id')
+    current_user = await request.auser()
+    if not current_user.is_authenticated:
+        user_id = await request.session.aget('temp_user_id')
         if not user_id:
             messages.error(request, "Session expirée. Veuillez vous reconnecter.")
             return redirect('auth:login')
     else:
-        user_id = request.user.pk
+        user_id = current_user.pk
 
     if request.method == 'POST':
         image_file = request.FILES.get('image')
@@ -137,42 +146,42 @@ def setup_face_auth(request):
             return HttpResponseBadRequest('Image non fournie.')
         
         try:
-            response = requests.post(
-                f"{ML_API_URL}/register/{user_id}",
-                files={'image': image_file},
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = await ml_client.post_image(f"/register/{user_id}", image_file)
             if result.get('status') == 'success':
                 # Marquer l'utilisateur comme ayant l'authentification faciale activée
                 User = get_user_model()
-                user = User.objects.get(pk=user_id)
+                user = await User.objects.aget(pk=user_id)
                 user.face_auth_enabled = True
                 user.face_image_registered = True  # ✅ Marquer l'image comme enregistrée
-                user.save()
+                await user.asave()
                 
                 # Connecter l'utilisateur s'il ne l'était pas déjà
-                if not request.user.is_authenticated:
-                    login(request, user)
+                if not current_user.is_authenticated:
+                    await alogin(request, user)
                 
                 messages.success(request, "Authentification faciale configurée avec succès.")
                 return JsonResponse({'status': 'success'})
             else:
                 messages.error(request, result.get("message", "Erreur lors de la configuration de l'authentification faciale."))
                 return JsonResponse({'status': 'error', 'message': result.get("message")})
-        except requests.exceptions.RequestException as e:
+        except MLServiceUnavailable:
+            # Disjoncteur ouvert : échec immédiat sans solliciter le service
+            messages.error(request, ML_UNAVAILABLE_MESSAGE)
+            return JsonResponse({'status': 'error', 'message': ML_UNAVAILABLE_MESSAGE}, status=503)
+        except httpx.HTTPError as e:
             messages.error(request, f"Erreur de connexion au service d'authentification faciale: {e}")
             return JsonResponse({'status': 'error', 'message': str(e)})
     
-    return render(request, 'authentication/setup_face_auth.html')
+    # Le rendu (barre de navigation, utilisateur courant) reste synchrone
+    return await sync_to_async(render)(request, 'authentication/setup_face_auth.html')
 
-def verify_face(request):
+async def verify_face(request):
     """
-    Vue pour la vérification du visage après la saisie des identifiants
+    Vue pour la vérification du visage après la saisie des identifiants.
+    Asynchrone : l'appel au service ML et les accès ORM n'occupent pas de thread.
     """
     if request.method == 'POST':
-        user_id = request.session.get('temp_user_id')
+        user_id = await request.session.aget('temp_user_id')
         if not user_id:
             messages.error(request, "Session expirée. Veuillez vous reconnecter.")
             return JsonResponse({"status": "failure", "redirect": reverse('auth:login')})
@@ -182,27 +191,45 @@ def verify_face(request):
             return JsonResponse({"status": "error", "message": "Image non fournie."})
         
         try: 
-            response = requests.post(
-                f"{ML_API_URL}/verify/{user_id}",
-                files={'image': image_file},
-            )
-            response.raise_for_status()
-
-            result = response.json()
+            result = await ml_client.post_image(f"/verify/{user_id}", image_file)
             if result.get('status') == 'success' and result.get('match'):
-                user = get_user_model().objects.get(pk=user_id)
-                login(request, user)
-                del request.session['temp_user_id']
+                user = await get_user_model().objects.aget(pk=user_id)
+                await alogin(request, user)
+                await request.session.apop('temp_user_id', None)
                 # Ajouter le message de succès avant la redirection
                 messages.success(request, "🎉 Authentification faciale réussie ! Bienvenue dans le chat.")
                 return JsonResponse({"status": "success", "redirect": reverse('index')})
             else:
                 return JsonResponse({"status": "failure", "message": result.get("message", "Vérification faciale échouée.")})
-        except requests.exceptions.RequestException as e:
+        except MLServiceUnavailable:
+            return JsonResponse({"status": "error", "message": ML_UNAVAILABLE_MESSAGE}, status=503)
+        except httpx.HTTPError as e:
             print(f"Erreur de connexion ML API: {e}")
             return JsonResponse({"status": "error", "message": f"Erreur de connexion au service d'authentification faciale: {str(e)}"})
         except Exception as e:
             print(f"Erreur inattendue: {e}")
             return JsonResponse({"status": "error", "message": f"Erreur inattendue: {str(e)}"})
     
-    return render(request, 'authentication/verify_face.html')
\ No newline at end of file
+    return await sync_to_async(render)(request, 'authentication/verify_face.html')
+
+async def verify_face_complete(request):
+    """
+    Finalise la connexion après une vérification réussie par le flux WebSocket :
+    la session a été marquée par FaceVerifyConsumer, la connexion (et le nouveau
+    cookie de session) se fait ici en HTTP.
+    """
+    verified = await request.session.apop(FACE_VERIFIED_SESSION_KEY, None)
+    user_id = await request.session.aget('temp_user_id')
+    if (
+        not verified
+        or verified.get('user_id') != user_id
+        or time.time() - verified.get('at', 0) > FACE_VERIFIED_MAX_AGE
+    ):
+        messages.error(request, "Vérification faciale expirée. Veuillez réessayer.")
+        return redirect('auth:verify_face')
+
+    user = await get_user_model().objects.aget(pk=user_id)
+    await alogin(request, user)
+    await request.session.apop('temp_user_id', None)
+    messages.success(request, "🎉 Authentification faciale réussie ! Bienvenue dans le chat.")
+    return redirect('index')
@@ -0,0 +1,9 @@
+from django.contrib import admin
+
+from .models import Message
+
+
+@admin.register(Message)
+class MessageAdmin(admin.ModelAdmin):
+    list_display = ('room', 'author', 'created', 'body')
+    list_filter = ('room',)
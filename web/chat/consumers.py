@@ -1,6 +1,14 @@
+import asyncio
 import json
 
+from channels.db import database_sync_to_async
 from channels.generic.websocket import AsyncWebsocketConsumer
+from django.conf import settings
+from django.utils import timezone
+
+from .history import history_page, message_buffer
+from .models import Message
+from .presence import connection_member, member_username, safe_presence_call
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
@@ -8,25 +16,47 @@ class ChatConsumer(AsyncWebsocketConsumer):
         self.room_name = self.scope["url_route"]["kwargs"]["room_name"]
         self.room_group_name = f"chat_{self.room_name}"
         user = self.scope["user"]
+        self.presence_member = None
+        self.heartbeat_task = None
 
         # Join room group
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
 
         if user.is_authenticated:
             await self.accept()
+            # Derniers messages du salon, y compris ceux encore en tampon
+            await message_buffer.flush(self.room_name)
+            await self.send_history()
+            await self.join_presence(user)
         else:
             await self.close()
 
     async def disconnect(self, close_code):
         # Leave room group
         await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.leave_presence()
+        # Écrit les messages du salon encore en attente (les autres suivent leur minuterie)
+        await message_buffer.flush(self.room_name)
 
     # Receive message from WebSocket
     async def receive(self, text_data):
         text_data_json = json.loads(text_data)
+        # Remontée dans l'historique : page précédant le curseur reçu
+        if text_data_json.get("action") == "history":
+            await self.send_history(text_data_json.get("before"), text_data_json.get("limit"))
+            return
+
         message = text_data_json["message"]
         username = text_data_json["username"]
 
+        # Historique : mis en tampon, écrit en base par lots
+        await message_buffer.add(Message(
+            room=self.room_name,
+            author_id=self.scope["user"].pk,
+            body=message,
+            created=timezone.now(),
+        ))
+
         await self.channel_layer.group_send(
             self.room_group_name,
             {
@@ -36,6 +66,67 @@ class ChatConsumer(AsyncWebsocketConsumer):
             }
         )
 
+    async def send_history(self, before=None, limit=None):
+        # Même règle que la vue history : un entier strictement positif (bool exclu)
+        if limit is not None and (not isinstance(limit, int) or isinstance(limit, bool) or limit < 1):
+            await self.send(text_data=json.dumps({"type": "error", "message": "Paramètres d'historique invalides."}))
+            return
+        try:
+            page = await database_sync_to_async(history_page)(self.room_name, before, limit)
+        except ValueError:
+            await self.send(text_data=json.dumps({"type": "error", "message": "Curseur d'historique invalide."}))
+            return
+        await self.send(text_data=json.dumps({"type": "history", **page}))
+
+    async def join_presence(self, user):
+        # Présents dans le salon, puis annonce de l'arrivée aux autres connexions
+        self.presence_member = connection_member(user.username, self.channel_name)
+        count = await safe_presence_call("join", self.room_name, self.presence_member)
+        members = await safe_presence_call("members", self.room_name, default=[])
+        # Autres connexions du salon (un nom par connexion) ; la sienne arrive avec l'événement join
+        await self.send(text_data=json.dumps({
+            "type": "presence",
+            "event": "snapshot",
+            "users": sorted(member_username(m) for m in members if m != self.presence_member),
+            "count": count,
+        }))
+        await self.broadcast_presence("join", user.username, count)
+        self.heartbeat_task = asyncio.create_task(self.heartbeat())
+
+    async def leave_presence(self):
+        if self.presence_member is None:
+            return
+        if self.heartbeat_task is not None:
+            self.heartbeat_task.cancel()
+        count = await safe_presence_call("leave", self.room_name, self.presence_member)
+        await self.broadcast_presence("leave", member_username(self.presence_member), count)
+        self.presence_member = None
+
+    async def heartbeat(self):
+        # Prolonge la présence de la connexion ; sans heartbeat elle expire après CHAT_PRESENCE_TTL
+        while True:
+            await asyncio.sleep(settings.CHAT_PRESENCE_HEARTBEAT)
+            await safe_presence_call("refresh", self.room_name, self.presence_member)
+
+    async def broadcast_presence(self, event, username, count):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'presence_update',
+                'event': event,
+                'username': username,
+                'count': count,
+            }
+        )
+
+    async def presence_update(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "presence",
+            "event": event["event"],
+            "username": event["username"],
+            "count": event["count"],
+        }))
+
     # Receive message from room group
     async def chat_message(self, event):
         message = event["message"]
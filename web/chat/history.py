@@ -0,0 +1,142 @@
+import atexit
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.db.models import Q
+
+from .models import Message
+
+logger = logging.getLogger(__name__)
+
+class MessageBuffer:
+    """
+    Tampon des messages du chat : écrits en base par lots (bulk_create) dès
+    flush_size messages, ou flush_interval secondes après le premier message
+    en attente, plutôt qu'une requête par message. Un lot dont l'écriture
+    échoue reste en tampon (au plus max_pending messages) pour la suivante.
+    """
+
+    def __init__(self, flush_size=50, flush_interval=1.0, max_pending=None):
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending or 20 * flush_size
+        self._pending = []
+        self._lock = threading.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _take_pending(self, room=None):
+        with self._lock:
+            if room is None:
+                batch, self._pending = self._pending, []
+            else:
+                batch = [m for m in self._pending if m.room == room]
+                self._pending = [m for m in self._pending if m.room != room]
+        return batch
+
+    def _restore(self, batch):
+        with self._lock:
+            self._pending[:0] = batch
+            dropped = len(self._pending) - self.max_pending
+            if dropped > 0:
+                # Base indisponible trop longtemps : on abandonne les plus anciens
+                del self._pending[:dropped]
+        if dropped > 0:
+            logger.error("Tampon du chat plein : %d messages abandonnés", dropped)
+
+    async def add(self, message):
+        with self._lock:
+            self._pending.append(message)
+            size = len(self._pending)
+        if size >= self.flush_size:
+            await self.flush()
+        elif self._timer is None or self._timer.done() or self._timer.get_loop() is not asyncio.get_running_loop():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self, room=None):
+        """
+        Écrit les messages en attente (seulement ceux du salon room s'il est
+        donné). Ne lève jamais : la diffusion des messages ne dépend pas de
+        l'historique, un lot en échec est remis en tampon.
+        """
+        batch = self._take_pending(room)
+        if not batch:
+            return
+        try:
+            await database_sync_to_async(Message.objects.bulk_create)(batch)
+        except Exception:
+            logger.exception("Écriture de %d messages du chat impossible, nouvel essai au prochain flush", len(batch))
+            self._restore(batch)
+
+    def flush_sync(self):
+        """Écriture synchrone des messages en attente (arrêt du processus)."""
+        batch = self._take_pending()
+        if batch:
+            Message.objects.bulk_create(batch)
+
+
+message_buffer = MessageBuffer(settings.CHAT_HISTORY_FLUSH_SIZE, settings.CHAT_HISTORY_FLUSH_INTERVAL)
+# Aucun message en attente n'est perdu à l'arrêt du serveur
+atexit.register(message_buffer.flush_sync)
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def encode_cursor(message):
+    """Curseur opaque « microsecondes_id » désignant la position d'un message."""
+    delta = message.created - EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 10**6 + delta.microseconds
+    return f"{microseconds}_{message.id}"
+
+def decode_cursor(cursor):
+    """Retourne (created, id) ; lève ValueError si le curseur est invalide."""
+    # Le curseur arrive tel quel du client (JSON WebSocket) : pas forcément une chaîne
+    if not isinstance(cursor, str):
+        raise ValueError(f"Curseur invalide : {cursor!r}")
+    microseconds, message_id = cursor.split("_")
+    try:
+        created = EPOCH + timedelta(microseconds=int(microseconds))
+    except OverflowError:
+        raise ValueError(f"Curseur invalide : {cursor!r}")
+    return created, int(message_id)
+
+def serialize_message(message):
+    return {
+        "id": message.id,
+        "message": message.body,
+        "username": message.author.username if message.author else "",
+        "created": message.created.isoformat(),
+    }
+
+def history_page(room, before=None, limit=None):
+    """
+    Page d'historique d'un salon : les limit messages précédant le curseur before
+    (les plus récents si before est None), du plus ancien au plus récent.
+    Pagination par clé (room, created, id) et non par OFFSET : chaque page lit
+    l'index à partir du curseur, quelle que soit la profondeur.
+    Retourne {"messages": [...], "next_cursor": curseur de la page précédente ou None}.
+    """
+    limit = min(limit or settings.CHAT_HISTORY_PAGE_SIZE, settings.CHAT_HISTORY_MAX_PAGE_SIZE)
+    queryset = Message.objects.filter(room=room).select_related("author").order_by("-created", "-id")
+    if before:
+        created, message_id = decode_cursor(before)
+        queryset = queryset.filter(Q(created__lt=created) | Q(created=created, id__lt=message_id))
+    # Un message de plus pour savoir s'il reste des pages
+    messages = list(queryset[:limit + 1])
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    return {
+        "messages": [serialize_message(message) for message in reversed(messages)],
+        "next_cursor": encode_cursor(messages[-1]) if has_more else None,
+    }
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import math
+import random
+import resource
+import time
+import tracemalloc
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from chat.models import Message
+from chat.routing import websocket_urlpatterns
+
+ROOM_PREFIX = "loadtest_"
+IN_MEMORY_CHANNEL_LAYER = "channels.layers.InMemoryChannelLayer"
+# Délai d'attente d'un message par le lecteur d'une connexion (annulé en fin de test)
+READ_TIMEOUT = 3600
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class LoadClient:
+    """Une connexion ChatConsumer authentifiée et la tâche qui lit ses messages."""
+
+    def __init__(self, application, room, user):
+        self.room = room
+        self.user = user
+        self.communicator = WebsocketCommunicator(application, f"/ws/{room}/")
+        self.communicator.scope["user"] = user
+        self.received = 0
+        self.reader = None
+
+    async def connect(self, timeout):
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        return connected
+
+    def start_reading(self, latencies):
+        self.reader = asyncio.create_task(self.read(latencies))
+
+    async def read(self, latencies):
+        # Le message publié porte son horodatage d'envoi : latence de diffusion = réception - envoi
+        while True:
+            data = json.loads(await self.communicator.receive_from(timeout=READ_TIMEOUT))
+            if "type" in data:
+                # Historique envoyé à la connexion : hors mesure
+                continue
+            sent_at = json.loads(data["message"])["sent_at"]
+            latencies.append(time.perf_counter() - sent_at)
+            self.received += 1
+
+    async def publish(self, seq):
+        await self.communicator.send_to(text_data=json.dumps({
+            "message": json.dumps({"seq": seq, "sent_at": time.perf_counter()}),
+            "username": self.user.username,
+        }))
+
+    async def close(self):
+        if self.reader is not None:
+            self.reader.cancel()
+        await self.communicator.disconnect()
+
+
+async def run_load_test(connections, rooms, rate, duration, drain, connect_timeout=10, seed=0):
+    """
+    Ouvre connections connexions réparties sur rooms salons, publie rate messages
+    par seconde pendant duration secondes (émetteur et salon tirés au hasard),
+    puis attend drain secondes les messages en retard.
+    Retourne les statistiques : latences de diffusion, messages perdus, mémoire par connexion.
+    """
+    rng = random.Random(seed)
+    application = URLRouter(websocket_urlpatterns)
+    User = get_user_model()
+    latencies = []
+
+    tracemalloc.start()
+    memory_before = tracemalloc.get_traced_memory()[0]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    clients = [
+        LoadClient(application, f"{ROOM_PREFIX}{i % rooms}", User(username=f"{ROOM_PREFIX}{i}"))
+        for i in range(connections)
+    ]
+    start = time.perf_counter()
+    connected = await asyncio.gather(*(client.connect(connect_timeout) for client in clients))
+    connect_seconds = time.perf_counter() - start
+    memory_after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    clients = [client for client, ok in zip(clients, connected) if ok]
+    room_members = {}
+    for client in clients:
+        room_members.setdefault(client.room, []).append(client)
+        client.start_reading(latencies)
+
+    # Publication à cadence fixe : le message n est envoyé à start + n / rate
+    sent = 0
+    expected = 0
+    start = time.perf_counter()
+    total_messages = int(rate * duration)
+    publishers = list(room_members.values())
+    for seq in range(total_messages if publishers else 0):
+        delay = start + seq / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        members = rng.choice(publishers)
+        await rng.choice(members).publish(seq)
+        sent += 1
+        expected += len(members)
+    publish_seconds = time.perf_counter() - start
+
+    deadline = time.perf_counter() + drain
+    while len(latencies) < expected and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+
+    received = len(latencies)
+    await asyncio.gather(*(client.close() for client in clients))
+
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    return {
+        "connections": len(clients),
+        "failed_connections": connections - len(clients),
+        "rooms": len(room_members),
+        "connect_seconds": connect_seconds,
+        "messages_sent": sent,
+        "publish_rate": sent / publish_seconds if publish_seconds else 0.0,
+        "deliveries_expected": expected,
+        "deliveries_received": received,
+        "dropped": expected - received,
+        "latency_ms": {
+            "p50": percentile(latencies_ms, 50),
+            "p95": percentile(latencies_ms, 95),
+            "p99": percentile(latencies_ms, 99),
+            "max": latencies_ms[-1] if latencies_ms else None,
+        },
+        "memory_per_connection_bytes": (memory_after - memory_before) / len(clients) if clients else None,
+        # ru_maxrss est en kilo-octets sous Linux (pic du processus, indicatif)
+        "peak_rss_increase_kb": rss_after - rss_before,
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Test de charge du ChatConsumer : ouvre des milliers de connexions WebSocket authentifiées "
+        "réparties sur plusieurs salons, publie à cadence fixe et mesure la latence de diffusion, "
+        "les messages perdus et la mémoire par connexion."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--connections", type=int, default=1000)
+        parser.add_argument("--rooms", type=int, default=50)
+        parser.add_argument("--rate", type=float, default=50.0, help="Messages publiés par seconde (tous salons confondus)")
+        parser.add_argument("--duration", type=float, default=10.0, help="Durée de publication en secondes")
+        parser.add_argument("--drain", type=float, default=5.0, help="Attente maximale des messages en retard, en secondes")
+        parser.add_argument("--redis", action="store_true",
+                            help="Utilise la couche de canaux et la présence configurées (Redis) au lieu de la mémoire")
+        parser.add_argument("--capacity", type=int, default=100,
+                            help="Messages en attente par canal avant perte (couche en mémoire)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--keep-history", action="store_true",
+                            help="Conserve en base les messages des salons de test (supprimés par défaut)")
+        parser.add_argument("--output", help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        if options["connections"] < 1 or options["rooms"] < 1 or options["rate"] <= 0:
+            self.stderr.write("--connections, --rooms et --rate doivent être positifs.")
+            return
+
+        def run():
+            return asyncio.run(run_load_test(
+                options["connections"], options["rooms"], options["rate"], options["duration"],
+                options["drain"], seed=options["seed"],
+            ))
+
+        if options["redis"]:
+            results = run()
+        else:
+            layers = {"default": {"BACKEND": IN_MEMORY_CHANNEL_LAYER, "CONFIG": {"capacity": options["capacity"]}}}
+            with override_settings(CHANNEL_LAYERS=layers, CHAT_PRESENCE_REDIS_URL=""):
+                results = run()
+        results["channel_layer"] = "redis" if options["redis"] else "in_memory"
+        if not options["keep_history"]:
+            Message.objects.filter(room__startswith=ROOM_PREFIX).delete()
+
+        latency = results["latency_ms"]
+        self.stdout.write(
+            f"{results['connections']} connexions ({results['failed_connections']} échecs) sur {results['rooms']} salons, "
+            f"ouvertes en {results['connect_seconds']:.2f}s"
+        )
+        self.stdout.write(
+            f"{results['messages_sent']} messages publiés ({results['publish_rate']:.1f}/s), "
+            f"{results['deliveries_received']}/{results['deliveries_expected']} remis, {results['dropped']} perdus"
+        )
+        if latency["p50"] is not None:
+            self.stdout.write(
+                f"Latence de diffusion : p50={latency['p50']:.1f}ms p95={latency['p95']:.1f}ms "
+                f"p99={latency['p99']:.1f}ms max={latency['max']:.1f}ms"
+            )
+        if results["memory_per_connection_bytes"] is not None:
+            self.stdout.write(f"Mémoire par connexion : {results['memory_per_connection_bytes'] / 1024:.1f} Ko")
+
+        if options["output"]:
+            with open(options["output"], "w") as f:
+                json.dump(results, f, indent=2)
+            self.stdout.write(f"Résultats enregistrés dans {options['output']}")
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='message',
+            options={'ordering': ['created', 'id']},
+        ),
+        migrations.RemoveIndex(
+            model_name='message',
+            name='chat_message_room_created',
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'created', 'id'], name='chat_message_room_created_id'),
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Message(models.Model):
+    room = models.CharField(max_length=100)
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        null=True,
+        related_name='chat_messages',
+    )
+    body = models.TextField()
+    # Horodatage pris à la réception (et non à l'écriture différée en base)
+    created = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['created', 'id']
+        indexes = [
+            # Pagination par curseur (room, created, id) : coût constant par page
+            models.Index(fields=['room', 'created', 'id'], name='chat_message_room_created_id'),
+        ]
+
+    def __str__(self):
+        return f"[{self.room}] {self.body[:50]}"
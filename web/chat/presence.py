@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+import weakref
+
+import redis.asyncio as redis
+from django.conf import settings
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+ROOMS_KEY = "chat:presence:rooms"
+ROOM_KEY_PREFIX = "chat:presence:room:"
+
+# Purge des salons et membres expirés puis ZCARD de chaque salon actif, côté
+# serveur : un seul aller-retour quel que soit le nombre de salons. Les clés des
+# salons sont construites dans le script (Redis seul, pas de Cluster).
+ROOM_COUNTS_SCRIPT = """
+local now = ARGV[1]
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+local counts = {}
+for _, room in ipairs(redis.call('ZRANGE', KEYS[1], 0, -1)) do
+    local key = ARGV[2] .. room
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    local count = redis.call('ZCARD', key)
+    if count > 0 then
+        table.insert(counts, room)
+        table.insert(counts, count)
+    end
+end
+return counts
+"""
+
+
+def room_key(room):
+    return f"{ROOM_KEY_PREFIX}{room}"
+
+def connection_member(username, channel_name):
+    # Un membre par connexion (plusieurs onglets = plusieurs membres) ; « | » n'apparaît pas dans un username Django
+    return f"{username}|{channel_name}"
+
+def member_username(member):
+    return member.split("|", 1)[0]
+
+
+class RedisPresence:
+    """
+    Présence par salon dans Redis : un ZSET par salon (membre = connexion,
+    score = date d'expiration) rafraîchi par le heartbeat de chaque connexion,
+    et un ZSET des salons actifs. Une connexion qui disparaît sans leave
+    expire après ttl secondes. Le nombre de connexions d'un salon est un ZCARD
+    (O(1)) après purge des membres expirés, le tout en un aller-retour.
+    """
+
+    def __init__(self, url, ttl):
+        self.url = url
+        self.ttl = ttl
+        # Un client par boucle asyncio : une connexion redis.asyncio est liée à sa boucle
+        self._clients = weakref.WeakKeyDictionary()
+        self._room_counts_script = None
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = redis.from_url(
+                self.url, decode_responses=True, socket_connect_timeout=1, socket_timeout=1,
+            )
+        return client
+
+    async def _touch(self, room, member):
+        now = time.time()
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zadd(room_key(room), {member: now + self.ttl})
+            pipe.expire(room_key(room), int(self.ttl) + 1)
+            pipe.zadd(ROOMS_KEY, {room: now + self.ttl})
+            pipe.zremrangebyscore(room_key(room), "-inf", now)
+            pipe.zcard(room_key(room))
+            return (await pipe.execute())[-1]
+
+    async def join(self, room, member):
+        return await self._touch(room, member)
+
+    async def refresh(self, room, member):
+        return await self._touch(room, member)
+
+    async def leave(self, room, member):
+        async with self.client.pipeline(transaction=True) as pipe:
+            pipe.zrem(room_key(room), member)
+            pipe.zremrangebyscore(room_key(room), "-inf", time.time())
+            pipe.zcard(room_key(room))
+            return (await pipe.execute())[-1]
+
+    async def members(self, room):
+        return await self.client.zrangebyscore(room_key(room), time.time(), "+inf")
+
+    async def room_counts(self):
+        """Nombre de connexions de chaque salon actif : {salon: nombre}, en un aller-retour."""
+        if self._room_counts_script is None:
+            self._room_counts_script = self.client.register_script(ROOM_COUNTS_SCRIPT)
+        # EVALSHA, avec rechargement automatique du script si Redis l'a oublié
+        flat = await self._room_counts_script(
+            keys=[ROOMS_KEY], args=[time.time(), ROOM_KEY_PREFIX], client=self.client,
+        )
+        return dict(zip(flat[::2], flat[1::2]))
+
+
+class MemoryPresence:
+    """Même interface que RedisPresence, en mémoire du processus (développement, tests)."""
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self._rooms = {}  # salon -> {membre: expiration}
+
+    def _live(self, room):
+        now = time.time()
+        members = self._rooms.get(room, {})
+        for member in [m for m, expires in members.items() if expires <= now]:
+            del members[member]
+        if not members:
+            self._rooms.pop(room, None)
+        return members
+
+    async def join(self, room, member):
+        self._rooms.setdefault(room, {})[member] = time.time() + self.ttl
+        return len(self._live(room))
+
+    async def refresh(self, room, member):
+        return await self.join(room, member)
+
+    async def leave(self, room, member):
+        self._rooms.get(room, {}).pop(member, None)
+        return len(self._live(room))
+
+    async def members(self, room):
+        return list(self._live(room))
+
+    async def room_counts(self):
+        return {room: len(members) for room in list(self._rooms) if (members := self._live(room))}
+
+
+_stores = {}
+
+def presence_store():
+    """Stockage de présence selon CHAT_PRESENCE_REDIS_URL (vide : en mémoire)."""
+    url = settings.CHAT_PRESENCE_REDIS_URL
+    store = _stores.get(url)
+    if store is None:
+        if url:
+            store = RedisPresence(url, settings.CHAT_PRESENCE_TTL)
+        else:
+            store = MemoryPresence(settings.CHAT_PRESENCE_TTL)
+        _stores[url] = store
+    return store
+
+async def safe_presence_call(method, *args, default=None):
+    """La présence est accessoire : une panne de Redis ne doit pas couper le chat."""
+    try:
+        return await getattr(presence_store(), method)(*args)
+    except (RedisError, OSError, asyncio.TimeoutError) as e:
+        logger.warning("Présence indisponible (%s) : %s", method, e)
+        return default
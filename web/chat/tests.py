@@ -1,11 +1,30 @@
-from channels.testing import ChannelsLiveServerTestCase
+import asyncio
+import io
+import json
+import os
+import tempfile
+from unittest.mock import AsyncMock, MagicMock, PropertyMock, patch
+
+from asgiref.sync import async_to_sync
+from channels.routing import URLRouter
+from channels.testing import ChannelsLiveServerTestCase, WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
 from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.action_chains import ActionChains
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
-from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.support.wait import WebDriverWait
-from django.test.testcases import TransactionTestCase
+
+from chat.history import MessageBuffer, history_page
+from chat.models import Message
+from chat.presence import ROOM_COUNTS_SCRIPT, ROOMS_KEY, MemoryPresence, RedisPresence
+from chat.routing import websocket_urlpatterns
 
 
 class ChatTests(ChannelsLiveServerTestCase):
@@ -115,4 +134,326 @@ class ChatTests(ChannelsLiveServerTestCase):
     def _chat_log_value(self):
         return self.driver.find_element(
             by=By.CSS_SELECTOR, value="#chat-log"
-        ).get_property("value")
\ No newline at end of file
+        ).get_property("value")
+
+
+class ChatLoadTestCommandTests(TransactionTestCase):
+    # Les messages sont écrits en base depuis le thread de database_sync_to_async
+    def test_small_load_delivers_every_message(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, "loadtest.json")
+            call_command(
+                "chat_loadtest", connections=20, rooms=4, rate=50, duration=0.2, drain=2,
+                output=output, stdout=io.StringIO(),
+            )
+            with open(output) as f:
+                results = json.load(f)
+
+        self.assertEqual(results["connections"], 20)
+        self.assertEqual(results["messages_sent"], 10)
+        # Chaque message est diffusé aux 5 membres de son salon
+        self.assertEqual(results["deliveries_expected"], 50)
+        self.assertEqual(results["dropped"], 0)
+        self.assertIsNotNone(results["latency_ms"]["p99"])
+        self.assertGreater(results["memory_per_connection_bytes"], 0)
+        # Les messages des salons de test ne sont pas conservés
+        self.assertFalse(Message.objects.filter(room__startswith="loadtest_").exists())
+
+
+IN_MEMORY_CHANNEL_LAYERS = {"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+
+
+async def receive_chat(communicator):
+    """Prochain message hors présence (arrivées et départs diffusés au salon)."""
+    while True:
+        data = json.loads(await communicator.receive_from())
+        if data.get("type") != "presence":
+            return data
+
+
+class MessageBufferTests(TransactionTestCase):
+    def test_flushes_when_size_threshold_reached(self):
+        buffer = MessageBuffer(flush_size=3, flush_interval=60)
+
+        async def add_messages(count):
+            for i in range(count):
+                await buffer.add(Message(room="lobby", body=f"message {i}"))
+
+        async_to_sync(add_messages)(2)
+        self.assertEqual(Message.objects.count(), 0)
+        async_to_sync(add_messages)(1)
+        self.assertEqual(Message.objects.count(), 3)
+        self.assertEqual(len(buffer), 0)
+
+    def test_flushes_after_interval(self):
+        buffer = MessageBuffer(flush_size=100, flush_interval=0.05)
+
+        async def add_and_wait():
+            await buffer.add(Message(room="lobby", body="bonjour"))
+            await asyncio.sleep(0.2)
+
+        async_to_sync(add_and_wait)()
+        self.assertEqual(Message.objects.count(), 1)
+
+    def test_flush_sync_writes_pending_messages(self):
+        buffer = MessageBuffer(flush_size=100, flush_interval=60)
+        async_to_sync(buffer.add)(Message(room="lobby", body="bonjour"))
+
+        buffer.flush_sync()
+
+        self.assertEqual(Message.objects.get().body, "bonjour")
+
+    def test_failed_write_keeps_batch_for_next_flush(self):
+        buffer = MessageBuffer(flush_size=2, flush_interval=60, max_pending=3)
+
+        async def add_messages(*bodies):
+            for body in bodies:
+                await buffer.add(Message(room="lobby", body=body))
+
+        with patch.object(Message.objects, "bulk_create", side_effect=DatabaseError("base indisponible")), \
+                self.assertLogs("chat.history", level="ERROR"):
+            async_to_sync(add_messages)("a", "b", "c", "d")
+        # Lot remis en tampon ; au-delà de max_pending, les plus anciens sont abandonnés
+        self.assertEqual(Message.objects.count(), 0)
+        self.assertEqual(len(buffer), 3)
+
+        async_to_sync(buffer.flush)()
+
+        self.assertEqual(sorted(Message.objects.values_list("body", flat=True)), ["b", "c", "d"])
+        self.assertEqual(len(buffer), 0)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CHAT_PRESENCE_REDIS_URL="")
+class ChatConsumerHistoryTests(TransactionTestCase):
+    def test_message_is_stored_on_disconnect(self):
+        user = get_user_model().objects.create_user(username="alice", password="secret")
+
+        async def chat():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/lobby/")
+            communicator.scope["user"] = user
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            self.assertEqual((await receive_chat(communicator))["messages"], [])
+            await communicator.send_to(text_data=json.dumps({"message": "bonjour", "username": "alice"}))
+            self.assertEqual((await receive_chat(communicator))["message"], "bonjour")
+            await communicator.disconnect()
+
+        async_to_sync(chat)()
+
+        message = Message.objects.get()
+        self.assertEqual((message.room, message.author, message.body), ("lobby", user, "bonjour"))
+
+    def test_message_is_delivered_when_history_write_fails(self):
+        user = get_user_model().objects.create_user(username="alice", password="secret")
+
+        async def chat():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/lobby/")
+            communicator.scope["user"] = user
+            await communicator.connect()
+            await receive_chat(communicator)
+            await communicator.send_to(text_data=json.dumps({"message": "bonjour", "username": "alice"}))
+            received = await receive_chat(communicator)
+            await communicator.disconnect()
+            return received
+
+        with patch("chat.consumers.message_buffer", MessageBuffer(flush_size=1)), \
+                patch.object(Message.objects, "bulk_create", side_effect=DatabaseError("base indisponible")), \
+                self.assertLogs("chat.history", level="ERROR"):
+            received = async_to_sync(chat)()
+
+        self.assertEqual(received["message"], "bonjour")
+
+    def test_history_sent_on_connect_and_on_request(self):
+        user = get_user_model().objects.create_user(username="alice", password="secret")
+        created = timezone.now()
+        Message.objects.bulk_create(
+            Message(room="lobby", author=user, body=f"message {i}", created=created) for i in range(5)
+        )
+
+        async def chat():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/lobby/")
+            communicator.scope["user"] = user
+            await communicator.connect()
+            first = await receive_chat(communicator)
+            await communicator.send_to(text_data=json.dumps({"action": "history", "before": first["next_cursor"]}))
+            second = await receive_chat(communicator)
+            await communicator.disconnect()
+            return first, second
+
+        with self.settings(CHAT_HISTORY_PAGE_SIZE=3):
+            first, second = async_to_sync(chat)()
+
+        self.assertEqual(first["type"], "history")
+        self.assertEqual([m["message"] for m in first["messages"]], ["message 2", "message 3", "message 4"])
+        self.assertEqual(first["messages"][0]["username"], "alice")
+        self.assertEqual([m["message"] for m in second["messages"]], ["message 0", "message 1"])
+        self.assertIsNone(second["next_cursor"])
+
+    def test_connect_flushes_only_its_room(self):
+        user = get_user_model().objects.create_user(username="alice", password="secret")
+        buffer = MessageBuffer(flush_size=100, flush_interval=60)
+
+        async def chat():
+            await buffer.add(Message(room="lobby", author=user, body="en attente"))
+            await buffer.add(Message(room="other", body="ailleurs"))
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/lobby/")
+            communicator.scope["user"] = user
+            await communicator.connect()
+            history = await receive_chat(communicator)
+            pending = len(buffer)
+            await communicator.disconnect()
+            return history, pending
+
+        with patch("chat.consumers.message_buffer", buffer):
+            history, pending = async_to_sync(chat)()
+
+        self.assertEqual([m["message"] for m in history["messages"]], ["en attente"])
+        # Le tampon des autres salons n'est pas écrit à la connexion
+        self.assertEqual(pending, 1)
+
+    def test_invalid_history_request_returns_error_and_keeps_connection(self):
+        user = get_user_model().objects.create_user(username="alice", password="secret")
+
+        async def chat():
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/lobby/")
+            communicator.scope["user"] = user
+            await communicator.connect()
+            await receive_chat(communicator)
+            errors = []
+            for request in ({"before": 123}, {"before": "99999999999999999999999_1"}, {"limit": "3"}, {"limit": 0}, {"limit": True}):
+                await communicator.send_to(text_data=json.dumps({"action": "history", **request}))
+                errors.append(await receive_chat(communicator))
+            await communicator.send_to(text_data=json.dumps({"action": "history", "limit": 2}))
+            page = await receive_chat(communicator)
+            await communicator.disconnect()
+            return errors, page
+
+        errors, page = async_to_sync(chat)()
+
+        self.assertEqual([e["type"] for e in errors], ["error"] * 5)
+        self.assertEqual([e["message"] for e in errors], ["Curseur d'historique invalide."] * 2 + ["Paramètres d'historique invalides."] * 3)
+        self.assertEqual((page["type"], page["messages"]), ("history", []))
+
+
+class HistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username="bob", password="secret")
+        created = timezone.now()
+        # Horodatages identiques deux à deux : l'id départage les messages
+        Message.objects.bulk_create(
+            Message(room="lobby", author=self.user, body=f"message {i}", created=created + timezone.timedelta(seconds=i // 2))
+            for i in range(7)
+        )
+        Message.objects.create(room="other", author=self.user, body="ailleurs")
+
+    def test_pages_walk_back_through_room_without_gaps_or_duplicates(self):
+        bodies = []
+        cursor = None
+        while True:
+            page = history_page("lobby", before=cursor, limit=2)
+            bodies = [m["message"] for m in page["messages"]] + bodies
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        self.assertEqual(bodies, [f"message {i}" for i in range(7)])
+
+    def test_history_view_returns_json_page(self):
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse("history", args=["lobby"]), {"limit": 3})
+
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual([m["message"] for m in data["messages"]], ["message 4", "message 5", "message 6"])
+        next_page = self.client.get(reverse("history", args=["lobby"]), {"before": data["next_cursor"], "limit": 3}).json()
+        self.assertEqual([m["message"] for m in next_page["messages"]], ["message 1", "message 2", "message 3"])
+
+    def test_history_view_rejects_invalid_cursor_and_anonymous_users(self):
+        self.assertEqual(self.client.get(reverse("history", args=["lobby"])).status_code, 401)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse("history", args=["lobby"]), {"before": "abc"}).status_code, 400)
+
+
+class MemoryPresenceTests(SimpleTestCase):
+    def test_counts_connections_and_expires_without_heartbeat(self):
+        presence = MemoryPresence(ttl=0.05)
+
+        async def scenario():
+            self.assertEqual(await presence.join("lobby", "alice|c1"), 1)
+            self.assertEqual(await presence.join("lobby", "bob|c2"), 2)
+            self.assertEqual(await presence.join("other", "alice|c3"), 1)
+            self.assertEqual(await presence.leave("lobby", "bob|c2"), 1)
+            counts = await presence.room_counts()
+            await asyncio.sleep(0.1)
+            return counts, await presence.room_counts()
+
+        counts, expired = async_to_sync(scenario)()
+
+        self.assertEqual(counts, {"lobby": 1, "other": 1})
+        self.assertEqual(expired, {})
+
+
+class RedisPresenceTests(SimpleTestCase):
+    def test_room_counts_is_a_single_script_call(self):
+        presence = RedisPresence("redis://localhost:6379/0", ttl=60)
+        client = MagicMock()
+        script = client.register_script.return_value = AsyncMock(return_value=["lobby", 2, "other", 1])
+
+        with patch.object(RedisPresence, "client", new_callable=PropertyMock, return_value=client):
+            counts = async_to_sync(presence.room_counts)()
+            async_to_sync(presence.room_counts)()
+
+        self.assertEqual(counts, {"lobby": 2, "other": 1})
+        # Script enregistré une fois, puis un EVALSHA par appel
+        client.register_script.assert_called_once_with(ROOM_COUNTS_SCRIPT)
+        self.assertEqual(script.await_count, 2)
+        self.assertEqual(script.await_args.kwargs["keys"], [ROOMS_KEY])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CHAT_PRESENCE_REDIS_URL="")
+class ChatPresenceTests(TransactionTestCase):
+    def test_join_and_leave_are_pushed_to_the_room(self):
+        User = get_user_model()
+        alice = User.objects.create_user(username="alice", password="secret")
+        bob = User.objects.create_user(username="bob", password="secret")
+
+        async def connect(user):
+            communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), "/ws/presence/")
+            communicator.scope["user"] = user
+            await communicator.connect()
+            await communicator.receive_from()  # historique
+            return communicator
+
+        async def scenario():
+            alice_socket = await connect(alice)
+            alice_snapshot = json.loads(await alice_socket.receive_from())
+            alice_join = json.loads(await alice_socket.receive_from())
+            bob_socket = await connect(bob)
+            bob_snapshot = json.loads(await bob_socket.receive_from())
+            bob_join = json.loads(await alice_socket.receive_from())
+            await bob_socket.disconnect()
+            bob_leave = json.loads(await alice_socket.receive_from())
+            await alice_socket.disconnect()
+            return alice_snapshot, alice_join, bob_snapshot, bob_join, bob_leave
+
+        alice_snapshot, alice_join, bob_snapshot, bob_join, bob_leave = async_to_sync(scenario)()
+
+        self.assertEqual((alice_snapshot["event"], alice_snapshot["users"], alice_snapshot["count"]), ("snapshot", [], 1))
+        self.assertEqual((alice_join["event"], alice_join["username"]), ("join", "alice"))
+        self.assertEqual((bob_snapshot["users"], bob_snapshot["count"]), (["alice"], 2))
+        self.assertEqual((bob_join["event"], bob_join["username"], bob_join["count"]), ("join", "bob", 2))
+        self.assertEqual((bob_leave["event"], bob_leave["username"], bob_leave["count"]), ("leave", "bob", 1))
+
+    def test_index_lists_active_rooms_with_online_counts(self):
+        user = get_user_model().objects.create_user(username="alice", password="secret")
+        self.client.force_login(user)
+        store = MemoryPresence(ttl=60)
+        async_to_sync(store.join)("lobby", "alice|c1")
+        async_to_sync(store.join)("lobby", "bob|c2")
+
+        with patch("chat.presence.presence_store", return_value=store):
+            response = self.client.get(reverse("index"))
+
+        self.assertEqual(response.context["active_rooms"], [("lobby", 2)])
+        self.assertContains(response, "2 en ligne")
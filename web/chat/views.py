@@ -1,14 +1,36 @@
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
 from django.shortcuts import render, redirect
 
+from .history import history_page
+from .presence import safe_presence_call
 
-def index(request):
-    if not request.user.is_authenticated:
+
+async def index(request):
+    user = await request.auser()
+    if not user.is_authenticated:
         return redirect("auth:login")
-    context={}
-    return render(request, "chat/index.html", context)
+    # Salons actifs et nombre de connexions, en un aller-retour Redis
+    room_counts = await safe_presence_call("room_counts", default={})
+    context = {"active_rooms": sorted(room_counts.items(), key=lambda item: (-item[1], item[0]))}
+    return await sync_to_async(render)(request, "chat/index.html", context)
 
 
 def room(request, room_name):
     if not request.user.is_authenticated:
         return redirect("auth:login")
     return render(request, "chat/room.html", {"room_name": room_name})
+
+
+def history(request, room_name):
+    """Page d'historique d'un salon (JSON), paramètres before (curseur) et limit."""
+    if not request.user.is_authenticated:
+        return JsonResponse({"error": "Authentification requise."}, status=401)
+    try:
+        limit = int(request.GET["limit"]) if request.GET.get("limit") else None
+        if limit is not None and limit < 1:
+            raise ValueError
+        page = history_page(room_name, request.GET.get("before"), limit)
+    except ValueError:
+        return JsonResponse({"error": "Paramètres d'historique invalides."}, status=400)
+    return JsonResponse(page)
@@ -20,13 +20,14 @@ django_asgi_app = get_asgi_application()
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "mychat.settings")
 django.setup()
 
+from authentication.routing import websocket_urlpatterns as auth_websocket_urlpatterns
 from chat.routing import websocket_urlpatterns
 
 application = ProtocolTypeRouter(
     {
         "http": django_asgi_app,
         "websocket": AllowedHostsOriginValidator(
-            AuthMiddlewareStack(URLRouter(websocket_urlpatterns))
+            AuthMiddlewareStack(URLRouter(auth_websocket_urlpatterns + websocket_urlpatterns))
         ),
     }
 )
\ No newline at end of file
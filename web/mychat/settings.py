@@ -164,4 +164,32 @@ AUTH_USER_MODEL = 'authentication.User'
 
 LOGIN_REDIRECT_URL = 'auth:login'
 
-LOGOUT_REDIRECT_URL = 'auth:login'
\ No newline at end of file
+LOGOUT_REDIRECT_URL = 'auth:login'
+# Service de reconnaissance faciale (ml_service)
+ML_API_URL = os.getenv('ML_API_URL', 'http://ml_service:8000/face')
+# Routes internes : image en corps brut (octet-stream) et réponses msgpack, utilisées par défaut
+ML_API_INTERNAL_URL = os.getenv('ML_API_INTERNAL_URL', 'http://ml_service:8000/internal/face')
+ML_API_BINARY = os.getenv('ML_API_BINARY', 'true').lower() in ('1', 'true', 'yes')
+# Flux WebSocket de vérification (par défaut, même hôte que ML_API_URL)
+ML_API_WS_URL = os.getenv('ML_API_WS_URL', ML_API_URL.replace('http', 'ws', 1))
+ML_API_CONNECT_TIMEOUT = float(os.getenv('ML_API_CONNECT_TIMEOUT', '2'))
+ML_API_READ_TIMEOUT = float(os.getenv('ML_API_READ_TIMEOUT', '10'))
+# Nouvelles tentatives sur erreur de connexion ou service saturé (502/503/504)
+ML_API_RETRIES = int(os.getenv('ML_API_RETRIES', '2'))
+ML_API_RETRY_BACKOFF = float(os.getenv('ML_API_RETRY_BACKOFF', '0.2'))
+ML_API_POOL_SIZE = int(os.getenv('ML_API_POOL_SIZE', '10'))
+# Disjoncteur : ouvert après N échecs consécutifs, nouvel essai après le délai (secondes)
+ML_API_BREAKER_THRESHOLD = int(os.getenv('ML_API_BREAKER_THRESHOLD', '5'))
+ML_API_BREAKER_RESET_TIMEOUT = float(os.getenv('ML_API_BREAKER_RESET_TIMEOUT', '30'))
+
+# Historique du chat : messages écrits par lots (bulk_create) dès N messages ou après le délai (secondes)
+CHAT_HISTORY_FLUSH_SIZE = int(os.getenv('CHAT_HISTORY_FLUSH_SIZE', '50'))
+CHAT_HISTORY_FLUSH_INTERVAL = float(os.getenv('CHAT_HISTORY_FLUSH_INTERVAL', '1'))
+# Messages envoyés à l'ouverture d'un salon, et par page d'historique (plafond pour les requêtes)
+CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', '50'))
+CHAT_HISTORY_MAX_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_MAX_PAGE_SIZE', '200'))
+# Présence dans les salons : Redis (base distincte de la couche de canaux) ; vide = en mémoire du processus
+CHAT_PRESENCE_REDIS_URL = os.getenv('CHAT_PRESENCE_REDIS_URL', 'redis://redis:6379/1')
+# Une connexion sans heartbeat depuis CHAT_PRESENCE_TTL secondes est considérée partie
+CHAT_PRESENCE_TTL = float(os.getenv('CHAT_PRESENCE_TTL', '60'))
+CHAT_PRESENCE_HEARTBEAT = float(os.getenv('CHAT_PRESENCE_HEARTBEAT', '20'))
@@ -15,16 +15,28 @@ async function setupWebcam(){
     }
 }
 
-function captureImage() {
+// Intervalle entre deux images envoyées en mode flux (ms)
+const STREAM_FRAME_INTERVAL = 250;
+// Largeur maximale des images envoyées en mode flux
+const STREAM_MAX_WIDTH = 640;
+
+function captureImage(maxWidth = 0, quality = 0.95) {
     const context = canvas.getContext('2d');
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
+    const scale = maxWidth && video.videoWidth > maxWidth ? maxWidth / video.videoWidth : 1;
+    canvas.width = Math.round(video.videoWidth * scale);
+    canvas.height = Math.round(video.videoHeight * scale);
     context.drawImage(video, 0, 0, canvas.width, canvas.height);
     return new Promise(resolve => {
-        canvas.toBlob(resolve, 'image/jpeg', 0.95);
+        canvas.toBlob(resolve, 'image/jpeg', quality);
     });
 }
 
+function showStatus(text, success) {
+    statusDiv.textContent = text;
+    statusDiv.classList.toggle('text-green-500', success === true);
+    statusDiv.classList.toggle('text-red-500', success === false);
+}
+
 async function sendImage(imageData) {
     statusDiv.textContent = "Envoi de l'image...";
     const form = new FormData();
@@ -66,7 +78,63 @@ async function sendImage(imageData) {
     }
 }
 
+// Vérification en flux : les images partent en continu sur un WebSocket jusqu'au
+// premier résultat final. Le serveur ne garde que la plus récente pendant l'analyse.
+function streamVerification(path) {
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const socket = new WebSocket(`${protocol}://${window.location.host}${path}`);
+    let timer = null;
+    let opened = false;
+
+    const stop = () => {
+        clearInterval(timer);
+        captureButton.disabled = false;
+    };
+
+    socket.onopen = () => {
+        opened = true;
+        captureButton.disabled = true;
+        showStatus('Analyse en cours...');
+        timer = setInterval(async () => {
+            // Inutile d'empiler des images si le réseau ne suit pas
+            if (socket.readyState !== WebSocket.OPEN || socket.bufferedAmount > 0) {
+                return;
+            }
+            socket.send(await captureImage(STREAM_MAX_WIDTH, 0.8));
+        }, STREAM_FRAME_INTERVAL);
+    };
+
+    socket.onmessage = event => {
+        const result = JSON.parse(event.data);
+        if (!result.final) {
+            showStatus(result.message || 'Analyse en cours...');
+            return;
+        }
+        stop();
+        if (result.match && result.redirect) {
+            showStatus('Vérification réussie !', true);
+            window.location.href = result.redirect;
+        } else {
+            showStatus(`Échec de la vérification: ${result.message || 'Erreur inconnue'}`, false);
+        }
+    };
+
+    socket.onclose = () => stop();
+
+    socket.onerror = async () => {
+        stop();
+        // WebSocket indisponible : repli sur l'envoi d'une image unique
+        if (!opened) {
+            sendImage(await captureImage());
+        }
+    };
+}
+
 captureButton.addEventListener('click', async () => {
+    if (captureButton.dataset.streamUrl && 'WebSocket' in window) {
+        streamVerification(captureButton.dataset.streamUrl);
+        return;
+    }
     const imageData = await captureImage();
     sendImage(imageData);
 });